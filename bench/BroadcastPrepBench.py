@@ -0,0 +1,65 @@
+"""
+Tick preparation time of the Broadcaster against the number of users.
+
+Compares the per-user get_subscriptions() fan-out, the single joined
+get_all_subscriptions() query and the in-memory SubscriptionIndex.
+Needs the overseer_test database (it is dropped!).
+
+    python -m bench.BroadcastPrepBench
+"""
+from random import sample
+from time import perf_counter
+
+from src.DBOperator import DBOperator
+from test.SlaveMock import SlaveMock
+from test.UserMock import UserMock
+
+USER_COUNTS = [10, 100, 1000, 5000]
+SLAVES = 10
+SUBSCRIPTIONS_PER_USER = 3
+
+
+def populate(db_operator, user_count):
+    for i in range(SLAVES):
+        db_operator.add_slave(SlaveMock("slave%d" % i))
+    for i in range(user_count):
+        telegram_id = 100000 + i
+        db_operator.add_user(UserMock(telegram_id))
+        for j in sample(range(SLAVES), SUBSCRIPTIONS_PER_USER):
+            db_operator.subscribe(telegram_id, "slave%d" % j, i)
+
+
+def per_user_queries(db_operator):
+    pairs = []
+    for user in db_operator.get_users():
+        for subscription in db_operator.get_subscriptions(user.telegram_id):
+            pairs.append((user, subscription))
+    return pairs
+
+
+def joined_query(db_operator):
+    return list(db_operator.get_all_subscriptions())
+
+
+def subscription_index(db_operator):
+    return db_operator.get_subscription_index().get_all_subscriptions()
+
+
+def measure(function, db_operator, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        function(db_operator)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    print("%8s %16s %16s %16s" % ("users", "per-user, ms", "joined, ms", "index, ms"))
+    for user_count in USER_COUNTS:
+        db_operator = DBOperator("overseer_test", "inlatexbot", "inlatexbot", drop_key="r4jYi1@")
+        populate(db_operator, user_count)
+        print("%8d %16.2f %16.2f %16.2f" % (user_count,
+                                            measure(per_user_queries, db_operator) * 1e3,
+                                            measure(joined_query, db_operator) * 1e3,
+                                            measure(subscription_index, db_operator) * 1e3))
@@ -0,0 +1,139 @@
+"""
+Time to prepare one broadcast round of 10k subscribers on 100 slaves.
+
+Compares rendering the state message and building the "OK" markup for
+every subscription, as the Broadcaster used to, with rendering once per
+slave. Telegram, the database and the send queue are replaced by stubs,
+the alert ledger lets every alert through.
+
+    python -m bench.BroadcastRenderBench
+"""
+import json
+from functools import partial
+from random import sample
+from time import perf_counter
+from unittest.mock import Mock
+
+from telegram import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton
+
+from src.Broadcaster import Broadcaster
+from src.SlaveState import SlaveState
+from src.SubscriptionIndex import SubscriptionIndex
+
+SLAVES = 100
+USERS = 2000
+SUBSCRIPTIONS_PER_USER = 5
+ALERTS = ["He-3 flow is low", "T_mc above 20 mK"]
+
+
+class StubFuture:
+
+    def add_done_callback(self, callback):
+        pass
+
+
+class StubBot:
+
+    def edit_message_text(self, *args, **kwargs):
+        pass
+
+    def send_message(self, *args, **kwargs):
+        pass
+
+
+class StubScheduler:
+
+    def __init__(self):
+        self.submitted = 0
+
+    def submit(self, chat_id, function, priority=None, key=None):
+        self.submitted += 1
+        return StubFuture()
+
+
+class StubLedger:
+
+    def get_new_alerts(self, telegram_id, slave_nickname, alerts):
+        return alerts
+
+    def flush(self):
+        pass
+
+
+class StubUpdateServer:
+
+    def __init__(self):
+        self.states = {}
+
+    def add_state_listener(self, listener):
+        pass
+
+    def get_alert_engine(self):
+        return Mock()
+
+    def get_liveness(self):
+        return Mock()
+
+    def get_state_version(self, slave_nickname):
+        return 1
+
+    def get_latest_state(self, slave_nickname):
+        return self.states[slave_nickname]
+
+
+def make_round():
+    update_server = StubUpdateServer()
+    for i in range(SLAVES):
+        update_server.states["slave%d" % i] = \
+            SlaveState("slave%d" % i, json.dumps({"state": "T_mc = 10 mK\n" * 20, "sent_at": "",
+                                                  "alerts": ALERTS}))
+    index = SubscriptionIndex()
+    for telegram_id in range(USERS):
+        for i in sample(range(SLAVES), SUBSCRIPTIONS_PER_USER):
+            index.add(telegram_id, "slave%d" % i, telegram_id)
+    return update_server, index
+
+
+def per_subscription(update_server, index, bot, scheduler):
+    for telegram_id, slave_nickname, info_message_id in index.get_all_subscriptions():
+        state = update_server.get_latest_state(slave_nickname)
+        message = state.get_received_at().strftime("%Y-%m-%d %H:%M:%S") + " - " + slave_nickname + "\n" + \
+                  json.loads(state.get_raw_message())["state"]
+        scheduler.submit(telegram_id, partial(bot.edit_message_text, message, telegram_id, info_message_id,
+                                              parse_mode=ParseMode.MARKDOWN))
+        for alert in state.get_alerts():
+            alert_message = state.get_received_at().strftime("%Y-%m-%d %H:%M:%S") + \
+                            " - " + slave_nickname + "\nAlert! " + alert
+            reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("OK", callback_data="OK")]])
+            scheduler.submit(telegram_id, partial(bot.send_message, telegram_id, alert_message,
+                                                  parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup))
+
+
+def per_slave(broadcaster):
+    broadcaster._broadcast_updates()
+
+
+def measure(function, *args, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        function(*args)
+        best = min(best, perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    update_server, index = make_round()
+    bot = StubBot()
+    telegram_updater = Mock(bot=bot)
+    db_operator = Mock(get_subscription_index=Mock(return_value=index))
+
+    scheduler = StubScheduler()
+    broadcaster = Broadcaster(telegram_updater, update_server, db_operator,
+                              send_scheduler=scheduler, alert_ledger=StubLedger())
+
+    baseline = measure(per_subscription, update_server, index, bot, scheduler)
+    grouped = measure(per_slave, broadcaster)
+    print("%d subscriptions on %d slaves" % (len(index), SLAVES))
+    print("%20s %10.2f ms" % ("per subscription", baseline * 1e3))
+    print("%20s %10.2f ms" % ("per slave", grouped * 1e3))
@@ -0,0 +1,62 @@
+"""
+A week-long trend of one metric of one slave reporting every 5 seconds,
+read from the raw states and from the hour rollups. Also times the rollup
+maintenance done by StateArchive for every batch of states.
+Needs the overseer_test database, its tables are recreated.
+
+    python -m bench.MetricRollupBench
+"""
+import datetime
+import json
+from time import perf_counter
+
+from loggingserver import LoggingServer
+
+from src.DBOperator import DBOperator
+from src.SlaveState import SlaveState
+
+INTERVAL = 5
+DAYS = 7
+BATCH = 1000
+
+
+def make_states(start):
+    return [SlaveState("slave1", json.dumps({"state": "", "sent_at": "", "alerts": [],
+                                             "metrics": {"T_mc": 10 + i % 100, "P": 1e-6}}),
+                       start + datetime.timedelta(seconds=i * INTERVAL))
+            for i in range(DAYS * 24 * 3600 // INTERVAL)]
+
+
+def measure(function, *args, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        result = function(*args)
+        best = min(best, perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    LoggingServer.getInstance("overseer", test=True)
+    db_operator = DBOperator("overseer_test", "inlatexbot", "inlatexbot", drop_key="r4jYi1@")
+    start = datetime.datetime(2020, 1, 1)
+    states = make_states(start)
+    for state in states:
+        state.get_metrics()  # parsed by TelemetryStore on ingest, before they reach the archive
+
+    copy_time = rollup_time = 0
+    for i in range(0, len(states), BATCH):
+        batch = states[i:i + BATCH]
+        copy_start = perf_counter()
+        db_operator.add_slave_states(batch)
+        rollup_start = perf_counter()
+        db_operator.add_metric_rollups(batch)
+        copy_time += rollup_start - copy_start
+        rollup_time += perf_counter() - rollup_start
+
+    print("%d states over %d days" % (len(states), DAYS))
+    print("%20s %10.2f ms" % ("COPY", copy_time * 1e3))
+    print("%20s %10.2f ms" % ("rollup upserts", rollup_time * 1e3))
+    for name, resolution in [("raw states", 0), ("minute rollups", 60), ("hour rollups", 3600)]:
+        elapsed, points = measure(db_operator.get_metric_series, "slave1", "T_mc", start, None, resolution)
+        print("%20s %10.2f ms %8d points" % (name, elapsed * 1e3, len(points)))
@@ -0,0 +1,66 @@
+"""
+Serving /plot to 100 users asking for the same week-long plot, rendering it
+for every request and through PlotService, which renders it once in a worker
+process. The metric series comes from a stub, so only rendering is measured.
+
+    python -m bench.PlotBench
+"""
+import datetime
+from time import perf_counter
+
+import numpy as np
+
+from src.DBOperator import MetricPoint
+from src.PlotRenderer import render_plot
+from src.PlotService import PlotService
+
+REQUESTS = 100
+WINDOW = 7 * 24 * 3600
+
+
+class StubDBOperator:
+
+    def __init__(self, points):
+        self.points = points
+
+    def get_metric_series(self, slave_nickname, metric, since, until=None, resolution=0):
+        return self.points
+
+
+def make_points():
+    start = datetime.datetime.now() - datetime.timedelta(seconds=WINDOW)
+    values = 10 + np.random.RandomState(0).normal(size=PlotService.POINTS).cumsum()
+    return [MetricPoint(start + datetime.timedelta(seconds=i * WINDOW / PlotService.POINTS), value - 1, value + 1,
+                        value) for i, value in enumerate(values)]
+
+
+def render_every_time(points):
+    timestamps = np.array([point.at.timestamp() for point in points])
+    minimums, maximums, means = np.array([point[1:] for point in points]).T
+    for _ in range(REQUESTS):
+        render_plot(timestamps, minimums, maximums, means)
+
+
+def render_once(plot_service):
+    plots = [plot_service.submit("slave1", "T_mc", WINDOW) for _ in range(REQUESTS)]
+    for plot in plots:
+        plot.result()
+
+
+if __name__ == "__main__":
+    points = make_points()
+    plot_service = PlotService(StubDBOperator(points))
+    plot_service.submit("slave0", "T_mc", WINDOW).result()  # starts the worker process
+
+    start = perf_counter()
+    render_every_time(points)
+    every_time = perf_counter() - start
+
+    start = perf_counter()
+    render_once(plot_service)
+    once = perf_counter() - start
+    plot_service.stop()
+
+    print("%d requests of a %d point plot" % (REQUESTS, len(points)))
+    print("%20s %10.2f ms" % ("render every time", every_time * 1e3))
+    print("%20s %10.2f ms" % ("PlotService", once * 1e3))
@@ -0,0 +1,28 @@
+"""
+ResourceManager.get_string with the process-wide cache against reading
+and parsing strings.json on every call, as it used to be done.
+
+    python -m bench.ResourceManagerBench
+"""
+import json
+from timeit import timeit
+
+from src.ResourceManager import ResourceManager
+
+CALLS = 10000
+
+
+def uncached_get_string(string_id, strings_file="resources/strings.json"):
+    with open(strings_file, "r") as f:
+        return json.load(f)[string_id]
+
+
+if __name__ == "__main__":
+    resource_manager = ResourceManager()
+
+    uncached = timeit(lambda: uncached_get_string("slave_not_connected"), number=CALLS)
+    cached = timeit(lambda: resource_manager.get_string("slave_not_connected"), number=CALLS)
+
+    print("per-call disk read: %8.2f us/call" % (uncached / CALLS * 1e6))
+    print("cached:             %8.2f us/call" % (cached / CALLS * 1e6))
+    print("speedup:            %8.1fx" % (uncached / cached))
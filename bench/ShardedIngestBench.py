@@ -0,0 +1,75 @@
+"""
+Ingest rate of the single-process AsyncUpdateServer against the
+ShardedUpdateServer with a growing number of worker processes.
+
+Load generators run in their own processes and push framed JSON states
+with metrics as fast as they can; the rate is the number of states that
+reached the unified view of the main process per second.
+
+    python -m bench.ShardedIngestBench
+"""
+import json
+import multiprocessing
+import os
+from hashlib import md5
+from time import perf_counter, sleep
+from unittest.mock import MagicMock
+
+from loggingserver import LoggingServer
+
+from src.AsyncUpdateServer import AsyncUpdateServer
+from src.ShardedUpdateServer import ShardedUpdateServer
+from test.SlaveLoadGenerator import SlaveLoadGenerator
+from test.SlaveMock import SlaveMock
+
+GENERATORS = 4
+SLAVES_PER_GENERATOR = 50
+UPDATES_PER_SLAVE = 100
+
+
+def make_state(update, i):
+    return json.dumps({"state": "T_mc = %d mK\n" % update * 20, "sent_at": "", "alerts": [],
+                       "metrics": {"T_mc_%d" % j: update * 1e-3 for j in range(20)}})
+
+
+def generate(port, first_slave):
+    generator = SlaveLoadGenerator("127.0.0.1", port, SLAVES_PER_GENERATOR, updates_per_slave=UPDATES_PER_SLAVE,
+                                   update_interval=0, framed=True, first_slave=first_slave)
+    generator.make_state = make_state
+    generator.run()
+
+
+def count_states(server):
+    return sum(server.get_state_version("slave%d" % i) for i in range(GENERATORS * SLAVES_PER_GENERATOR))
+
+
+def measure(server):
+    server._host = "127.0.0.1"
+    server.launch()
+    try:
+        expected = SLAVES_PER_GENERATOR * UPDATES_PER_SLAVE
+        start = perf_counter()
+        generators = [multiprocessing.Process(target=generate, args=(server.get_port(), g * SLAVES_PER_GENERATOR))
+                      for g in range(GENERATORS)]
+        for generator in generators:
+            generator.start()
+        for generator in generators:
+            generator.join()
+        while count_states(server) < GENERATORS * expected:
+            sleep(.01)
+        return GENERATORS * expected / (perf_counter() - start)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    LoggingServer.getInstance("overseer", test=True)
+    db_operator = MagicMock()
+    db_operator.get_slave = MagicMock(return_value=SlaveMock(password=md5("testpass".encode()).hexdigest()))
+
+    print("%d CPU cores" % os.cpu_count())
+    print("%20s %14s" % ("", "states per s"))
+    print("%20s %14.0f" % ("async, 1 process", measure(AsyncUpdateServer(None, db_operator, port=0))))
+    for workers in [1, 2, 4, 8]:
+        server = ShardedUpdateServer(None, db_operator, port=0, workers=workers)
+        print("%20s %14.0f" % ("sharded, %d workers" % workers, measure(server)))
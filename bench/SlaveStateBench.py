@@ -0,0 +1,85 @@
+"""
+Memory and construction cost of SlaveState against the former dict-based,
+eagerly parsed class (copied below as DictSlaveState).
+
+Memory is the traced allocation per state kept in a list, throughput is
+the number of states built per second from the received bytes: the old
+class needs them decoded first, the new one only when a field is read.
+
+    python -m bench.SlaveStateBench
+"""
+import datetime
+import json
+import tracemalloc
+from json import JSONDecodeError
+from time import perf_counter
+
+from src.SlaveState import SlaveState
+
+COUNT = 100000
+
+
+class DictSlaveState:
+
+    def __init__(self, slave_nickname, raw_message):
+        self._slave_nickname = slave_nickname
+        self._raw_message = raw_message
+        self._received_at = datetime.datetime.now()
+        self._parse_raw_message(raw_message)
+
+    def _parse_raw_message(self, raw_message):
+        try:
+            data = json.loads(raw_message)
+            self._sent_at = data["sent_at"]
+            self._state = data["state"]
+            self._alerts = data["alerts"]
+            self._metrics = {name: float(value) for name, value in data.get("metrics", {}).items()
+                             if isinstance(value, (int, float)) and not isinstance(value, bool)}
+        except (JSONDecodeError, KeyError, TypeError):
+            self._sent_at = ""
+            self._state = raw_message
+            self._alerts = ("")
+            self._metrics = {}
+
+
+def make_messages():
+    return [json.dumps({"state": "T_mc = %d mK" % i, "sent_at": "2018-01-01 00:00:00", "alerts": [],
+                        "metrics": {"T_mc": i * 1e-3, "P": 1.5}}).encode() for i in range(COUNT)]
+
+
+def build_dict_states(messages):
+    return [DictSlaveState("slave1", message.decode()) for message in messages]
+
+
+def build_slotted_states(messages):
+    return [SlaveState("slave1", message) for message in messages]
+
+
+def measure_memory(build, messages):
+    tracemalloc.start()
+    states = build(messages)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / len(states)
+
+
+def measure_rate(build, messages, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        build(messages)
+        best = min(best, perf_counter() - start)
+    return len(messages) / best
+
+
+if __name__ == "__main__":
+    messages = make_messages()
+    print("%20s %16s %16s" % ("", "bytes per state", "states per s"))
+    for name, build in [("dict, eager", build_dict_states), ("slots, lazy", build_slotted_states)]:
+        print("%20s %16.0f %16.0f" % (name, measure_memory(build, messages), measure_rate(build, messages)))
+
+    states = build_slotted_states(messages)
+    start = perf_counter()
+    for state in states:
+        state.get_metrics()
+    print("%20s %16s %16.0f" % ("slots, parsed later", "", len(states) / (perf_counter() - start)))
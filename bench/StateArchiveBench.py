@@ -0,0 +1,62 @@
+"""
+Writing 20k slave states to the slave_states table with one INSERT per
+state, with multi-row INSERTs and with the binary COPY used by StateArchive.
+Needs the overseer_test database, its tables are recreated.
+
+    python -m bench.StateArchiveBench
+"""
+import datetime
+import json
+from time import perf_counter
+
+from loggingserver import LoggingServer
+from psycopg2.extras import execute_values
+
+from src.DBOperator import DBOperator
+from src.SlaveState import SlaveState
+
+STATES = 20000
+SLAVES = 100
+
+
+def make_states():
+    start = datetime.datetime.now()
+    return [SlaveState("slave%d" % (i % SLAVES),
+                       json.dumps({"state": "T_mc = %d mK\n" % i * 10, "sent_at": "", "alerts": [],
+                                   "metrics": {"T_mc": i}}),
+                       start + datetime.timedelta(milliseconds=i)) for i in range(STATES)]
+
+
+def make_rows(states):
+    return [(state.get_slave_nickname(), state.get_received_at(), state.get_raw_bytes()) for state in states]
+
+
+def insert_per_row(db_operator, states):
+    with db_operator._cursor() as c:
+        for row in make_rows(states):
+            c.execute("INSERT INTO slave_states (slave_nickname, received_at, raw_message) VALUES (%s, %s, %s);",
+                      row)
+
+
+def insert_values(db_operator, states):
+    with db_operator._cursor() as c:
+        execute_values(c, "INSERT INTO slave_states (slave_nickname, received_at, raw_message) VALUES %s;",
+                       make_rows(states), page_size=1000)
+
+
+def copy(db_operator, states):
+    db_operator.add_slave_states(states)
+
+
+if __name__ == "__main__":
+    LoggingServer.getInstance("overseer", test=True)
+    db_operator = DBOperator("overseer_test", "inlatexbot", "inlatexbot", drop_key="r4jYi1@")
+    states = make_states()
+
+    print("%d states of %d slaves" % (STATES, SLAVES))
+    for name, function in [("INSERT per row", insert_per_row), ("multi-row INSERT", insert_values),
+                           ("COPY", copy)]:
+        start = perf_counter()
+        function(db_operator, states)
+        elapsed = perf_counter() - start
+        print("%20s %10.2f ms %10.0f states/s" % (name, elapsed * 1e3, STATES / elapsed))
@@ -0,0 +1,38 @@
+"""
+Summarizing a window of samples from TelemetryStore against re-parsing the
+JSON states kept in StateHistory.
+
+    python -m bench.TelemetryStoreBench
+"""
+import json
+from timeit import timeit
+
+import numpy as np
+
+from src.TelemetryStore import TelemetryStore
+
+SAMPLES = 4096
+CALLS = 200
+
+
+def parse_and_summarize(raw_messages):
+    values = [json.loads(raw_message)["metrics"]["T"] for raw_message in raw_messages]
+    values.sort()
+    return {"min": values[0], "max": values[-1], "mean": sum(values) / len(values),
+            "p50": values[len(values) // 2]}
+
+
+if __name__ == "__main__":
+    store = TelemetryStore(capacity=SAMPLES)
+    raw_messages = []
+    for i, value in enumerate(np.random.RandomState(0).normal(size=SAMPLES)):
+        store.add("slave1", float(i), {"T": value})
+        raw_messages.append(json.dumps({"state": "T = %f" % value, "sent_at": "", "alerts": [],
+                                        "metrics": {"T": value}}))
+
+    parsed = timeit(lambda: parse_and_summarize(raw_messages), number=CALLS) / CALLS
+    vectorized = timeit(lambda: store.aggregate("slave1", "T"), number=CALLS) / CALLS
+
+    print("%d samples" % SAMPLES)
+    print("re-parsing JSON: %10.1f us" % (parsed * 1e6))
+    print("TelemetryStore:  %10.1f us" % (vectorized * 1e6))
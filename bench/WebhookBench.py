@@ -0,0 +1,77 @@
+"""
+Posting recorded updates at a local WebhookServer: the latency of a single
+command from the POST to its handler, and the throughput of one update per
+request against batches of 100, with 1 and 4 workers. The handler only counts,
+so the receiver and the dispatch are measured. Polling is not compared here,
+its latency is bound by the getUpdates round trip to Telegram.
+
+    python -m bench.WebhookBench
+"""
+import json
+from queue import Queue
+from threading import Event
+from time import perf_counter
+from urllib.request import urlopen, Request
+
+from loggingserver import LoggingServer
+from telegram.ext import Dispatcher, MessageHandler, Filters
+
+from src.WebhookServer import WebhookServer
+from test.WebhookServerTest import make_update
+
+UPDATES = 2000
+LATENCY_SAMPLES = 200
+CHATS = 50
+
+
+def make_server(workers, on_update):
+    dispatcher = Dispatcher(None, Queue(), workers=0)
+    dispatcher.add_handler(MessageHandler(Filters.text, lambda bot, update: on_update()))
+    server = WebhookServer(dispatcher, "https://localhost/bench", host="127.0.0.1", port=0, workers=workers,
+                           max_queue_size=UPDATES)
+    server.launch(register=False)
+    return server
+
+
+def post(server, data):
+    urlopen(Request("http://127.0.0.1:%d/bench" % server.get_port(), data=json.dumps(data).encode())).read()
+
+
+def measure_latency():
+    handled = Event()
+    server = make_server(1, handled.set)
+    latencies = []
+    for i in range(LATENCY_SAMPLES):
+        handled.clear()
+        start = perf_counter()
+        post(server, make_update(i, 10, "/start"))
+        handled.wait()
+        latencies.append(perf_counter() - start)
+    server.stop(unregister=False)
+    latencies.sort()
+    return latencies[len(latencies) // 2], latencies[int(len(latencies) * .99)]
+
+
+def measure_throughput(workers, batch):
+    updates = [make_update(i, i % CHATS, "/start") for i in range(UPDATES)]
+    server = make_server(workers, lambda: None)
+    start = perf_counter()
+    for i in range(0, UPDATES, batch):
+        post(server, updates[i:i + batch] if batch > 1 else updates[i])
+    server.stop(unregister=False)  # waits for the queued updates
+    return UPDATES / (perf_counter() - start)
+
+
+def main():
+    LoggingServer.getInstance("overseer", test=True)
+
+    median, p99 = measure_latency()
+    print("command latency: median %.2f ms, p99 %.2f ms" % (median * 1e3, p99 * 1e3))
+    for workers in (1, 4):
+        for batch in (1, 100):
+            print("%d workers, %3d updates per request: %7.0f updates/s"
+                  % (workers, batch, measure_throughput(workers, batch)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+import json
+from abc import ABC, abstractmethod
+from datetime import datetime
+from threading import Thread, Lock
+from time import time, sleep
+
+
+class AlertRule(ABC):
+
+    def evaluate(self, state):
+        """
+        :type state: src.SlaveState.SlaveState
+        :return: (firing, value) or None if the state says nothing about this rule
+        """
+        return None
+
+    def check_silence(self, last_seen, now):
+        """
+        :return: (firing, value) or None if the rule does not watch for silence
+        """
+        return None
+
+    @abstractmethod
+    def describe(self):
+        pass
+
+
+class ThresholdRule(AlertRule):
+
+    def __init__(self, metric, above=None, below=None):
+        self._metric = metric
+        self._above = above
+        self._below = below
+
+    def evaluate(self, state):
+        value = state.get_metrics().get(self._metric)
+        if value is None:
+            return None
+        firing = (self._above is not None and value > self._above) or \
+                 (self._below is not None and value < self._below)
+        return firing, value
+
+    def describe(self):
+        limits = []
+        if self._above is not None:
+            limits.append("above %g" % self._above)
+        if self._below is not None:
+            limits.append("below %g" % self._below)
+        return "%s %s" % (self._metric, " or ".join(limits))
+
+
+class RateRule(AlertRule):
+    """
+    Fires when the metric changes faster than max_rate units per second
+    between two consecutive updates
+    """
+
+    def __init__(self, metric, max_rate):
+        self._metric = metric
+        self._max_rate = max_rate
+        self._previous = None
+
+    def evaluate(self, state):
+        value = state.get_metrics().get(self._metric)
+        if value is None:
+            return None
+
+        timestamp = state.get_received_at().timestamp()
+        previous, self._previous = self._previous, (timestamp, value)
+        if previous is None or timestamp <= previous[0]:
+            return None
+
+        rate = (value - previous[1]) / (timestamp - previous[0])
+        return abs(rate) > self._max_rate, rate
+
+    def describe(self):
+        return "%s changing faster than %g/s" % (self._metric, self._max_rate)
+
+
+class SilenceRule(AlertRule):
+
+    def __init__(self, seconds):
+        self._seconds = seconds
+
+    def check_silence(self, last_seen, now):
+        silence = now - last_seen
+        return silence > self._seconds, silence
+
+    def describe(self):
+        return "no updates for %g s" % self._seconds
+
+
+class AlertEvent:
+
+    def __init__(self, slave_nickname, description, fired, value, at):
+        self.slave_nickname = slave_nickname
+        self.description = description
+        self.fired = fired
+        self.value = value
+        self.at = at
+
+    def get_message(self):
+        return self.at.strftime("%Y-%m-%d %H:%M:%S") + " - " + self.slave_nickname + \
+               ("\nAlert! " if self.fired else "\nResolved: ") + self.description + \
+               " (%g)" % self.value
+
+    def __repr__(self):
+        return "AlertEvent(%s, %s, fired=%s)" % (self.slave_nickname, self.description, self.fired)
+
+
+class AlertEngine:
+    """
+    Evaluates per-slave alert rules as updates arrive. Listeners are called
+    only when an alert fires or clears, never while it merely persists
+    """
+
+    RULE_TYPES = {"threshold": ThresholdRule, "rate": RateRule, "silence": SilenceRule}
+
+    def __init__(self, check_interval=1):
+        self._check_interval = check_interval
+        self._lock = Lock()
+        self._rules = {}
+        self._last_seen = {}
+        self._active = {}
+        self._listeners = []
+        self._stop = False
+
+    def add_rule(self, slave_nickname, rule: AlertRule):
+        with self._lock:
+            self._rules.setdefault(slave_nickname, []).append(rule)
+
+    def load_rules(self, config):
+        """
+        :param config: {"slave1": [{"type": "threshold", "metric": "T", "above": 1.5},
+                                   {"type": "rate", "metric": "P", "max_rate": 0.1},
+                                   {"type": "silence", "seconds": 120}]}
+        """
+        for slave_nickname, rules in config.items():
+            for rule in rules:
+                parameters = dict(rule)
+                rule_type = self.RULE_TYPES[parameters.pop("type")]
+                self.add_rule(slave_nickname, rule_type(**parameters))
+
+    def load_rules_file(self, path):
+        with open(path, "r") as f:
+            self.load_rules(json.load(f))
+
+    def add_listener(self, listener):
+        """
+        :param listener: called with an AlertEvent when an alert fires or clears
+        """
+        self._listeners.append(listener)
+
+    def launch(self):
+        self._stop = False
+        checker = Thread(target=self._run)
+        checker.setDaemon(True)
+        checker.start()
+
+    def stop(self):
+        self._stop = True
+
+    def touch(self, slave_nickname):
+        """
+        Registers an update that did not change the state
+        """
+        self._notify(self._update_silence(slave_nickname, time()))
+
+    def on_update(self, state):
+        """
+        :type state: src.SlaveState.SlaveState
+        """
+        slave_nickname = state.get_slave_nickname()
+        events = self._update_silence(slave_nickname, time())
+        with self._lock:
+            for rule in self._rules.get(slave_nickname, []):
+                result = rule.evaluate(state)
+                if result is not None:
+                    events += self._transition(slave_nickname, rule, *result)
+        self._notify(events)
+
+    def check_silence(self, now=None):
+        now = time() if now is None else now
+        events = []
+        with self._lock:
+            for slave_nickname, last_seen in self._last_seen.items():
+                for rule in self._rules.get(slave_nickname, []):
+                    result = rule.check_silence(last_seen, now)
+                    if result is not None:
+                        events += self._transition(slave_nickname, rule, *result)
+        self._notify(events)
+
+    def get_active_alerts(self, slave_nickname):
+        with self._lock:
+            return [rule.describe() for (nickname, rule) in self._active if nickname == slave_nickname]
+
+    def _update_silence(self, slave_nickname, now):
+        with self._lock:
+            self._last_seen[slave_nickname] = now
+            events = []
+            for rule in self._rules.get(slave_nickname, []):
+                result = rule.check_silence(now, now)
+                if result is not None:
+                    events += self._transition(slave_nickname, rule, *result)
+            return events
+
+    def _transition(self, slave_nickname, rule, firing, value):
+        key = (slave_nickname, rule)
+        if firing == (key in self._active):
+            return []
+
+        if firing:
+            self._active[key] = value
+        else:
+            del self._active[key]
+        return [AlertEvent(slave_nickname, rule.describe(), firing, value, datetime.now())]
+
+    def _notify(self, events):
+        for event in events:
+            for listener in self._listeners:
+                listener(event)
+
+    def _run(self):
+        while not self._stop:
+            self.check_silence()
+            sleep(self._check_interval)
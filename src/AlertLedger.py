@@ -0,0 +1,84 @@
+from threading import Lock
+
+from src.DBOperator import DBOperator
+
+
+class AlertLedger:
+    """
+    Remembers which slave alerts every (user, slave) pair has already been shown,
+    and whether the user was told the slave is offline. An alert is shown again
+    only after it disappeared from the slave state and came back. Alerts count as
+    shown once their message is delivered, until then they are pending.
+    Changes are kept in memory until flush() saves them to the alert_ledger table
+    """
+
+    def __init__(self, db_operator: DBOperator):
+        self._db_operator = db_operator
+        self._lock = Lock()
+        self._shown = {}
+        self._pending = {}
+        self._offline = {}
+        for telegram_id, slave_nickname, alerts, offline in db_operator.get_alert_ledger():
+            self._shown[(telegram_id, slave_nickname)] = frozenset(alerts)
+            self._offline[(telegram_id, slave_nickname)] = offline
+        self._changed = set()
+
+    def get_new_alerts(self, telegram_id, slave_nickname, alerts):
+        """
+        Forgets the shown alerts the slave no longer has and marks the new ones pending,
+        confirm() or discard() them when their message is sent or failed
+
+        :return: alerts the user has not seen and are not on the way, in their original order
+        """
+        key = (telegram_id, slave_nickname)
+        current = frozenset(alerts)
+        with self._lock:
+            shown = self._shown.get(key, frozenset())
+            pending = self._pending.get(key, frozenset())
+            if not shown <= current:
+                self._shown[key] = shown & current
+                self._changed.add(key)
+            new_alerts = [alert for alert in alerts if alert not in shown and alert not in pending]
+            if new_alerts:
+                self._pending[key] = pending | frozenset(new_alerts)
+        return new_alerts
+
+    def confirm(self, telegram_id, slave_nickname, alerts):
+        """
+        Records the pending alerts as shown, their message was delivered
+        """
+        key = (telegram_id, slave_nickname)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, frozenset()) - frozenset(alerts)
+            self._shown[key] = self._shown.get(key, frozenset()) | frozenset(alerts)
+            self._changed.add(key)
+
+    def discard(self, telegram_id, slave_nickname, alerts):
+        """
+        Forgets the pending alerts, their message failed and they are new again
+        """
+        key = (telegram_id, slave_nickname)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, frozenset()) - frozenset(alerts)
+
+    def set_offline(self, telegram_id, slave_nickname, offline):
+        """
+        Records the user as told whether the slave is offline
+
+        :return: True if the user was last told otherwise, so a notice is due;
+                 a slave coming back online is news only after it was reported offline
+        """
+        key = (telegram_id, slave_nickname)
+        with self._lock:
+            if self._offline.get(key, False) == offline:
+                return False
+            self._offline[key] = offline
+            self._changed.add(key)
+        return True
+
+    def flush(self):
+        with self._lock:
+            rows = [key + (sorted(self._shown.get(key, ())), self._offline.get(key, False)) for key in self._changed]
+            self._changed = set()
+        if rows:
+            self._db_operator.save_alert_ledger(rows)
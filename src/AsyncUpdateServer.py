@@ -0,0 +1,157 @@
+import asyncio
+import ssl
+from threading import Thread, Event
+
+from src.DBOperator import DBOperator
+from src.SlaveProtocol import parse_handshake, make_handshake_reply, read_frame, FRAMED_PROTOCOL
+from src.UpdateServer import UpdateServer
+
+
+class AsyncUpdateServer(UpdateServer):
+    """
+    UpdateServer serving all slave connections from one asyncio event loop
+    instead of a thread per slave; TLS handshakes do not block the accept loop
+    """
+
+    def __init__(self, tls_context, db_operator: DBOperator, port=5000,
+                 max_connections=20000, handshake_timeout=10, authenticator=None, sock=None):
+        """
+
+        :param sock: an already listening socket to serve instead of binding the port
+        """
+        super().__init__(tls_context, db_operator, authenticator)
+
+        self._secure_port = port
+        self._max_connections = max_connections
+        self._handshake_timeout = handshake_timeout
+        self._sock = sock
+
+        self._loop = None
+        self._server = None
+        self._ready = Event()
+        self._connections_count = 0
+        self._connection_tasks = set()
+
+    def launch(self):
+        self._stop = False
+        self._ready.clear()
+        self._launch_services()
+
+        event_loop = Thread(target=self._run_loop)
+        event_loop.setDaemon(True)
+        event_loop.start()
+        self._ready.wait()
+
+    def stop(self):
+        self._stop = True
+        self._stop_services()
+        if self._loop is not None and not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+
+    def get_port(self):
+        return self._server.sockets[0].getsockname()[1]
+
+    def get_connections_count(self):
+        return self._connections_count
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+
+        kwargs = {}
+        if self._tls_context is not None:
+            kwargs = {"ssl": self._tls_context, "ssl_handshake_timeout": self._handshake_timeout}
+
+        if self._sock is not None:
+            kwargs["sock"] = self._sock
+        else:
+            kwargs.update(host=self._host, port=self._secure_port)
+
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._serve, backlog=1024, **kwargs))
+            self._logger.info("AsyncUpdateServer: secure listening on %s" % str((self._host, self.get_port())))
+        finally:
+            self._ready.set()
+
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _shutdown(self):
+        """
+        Cancels the connections before stopping the loop, so none is left pending
+        """
+        self._server.close()
+        tasks = list(self._connection_tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._loop.stop()
+
+    async def _serve(self, reader, writer):
+        if self._connections_count >= self._max_connections:
+            self._logger.warn("AsyncUpdateServer: too many connections, refusing")
+            writer.close()
+            return
+
+        self._connections_count += 1
+        self._connection_tasks.add(asyncio.current_task())
+        address = writer.get_extra_info("peername")
+        self._logger.info("Connection from: " + str(address))
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            self._enable_keepalive(sock)
+        try:
+            await self._communicate_async(reader, writer, address)
+        except (asyncio.TimeoutError, ConnectionError, ssl.SSLError, ValueError) as e:
+            self._logger.warn("AsyncUpdateServer: %s, %s" % (str(address), repr(e)))
+        finally:
+            self._connections_count -= 1
+            self._connection_tasks.discard(asyncio.current_task())
+            writer.close()
+
+    async def _communicate_async(self, reader, writer, address):
+        handshake = await asyncio.wait_for(reader.read(1024), self._handshake_timeout)
+        try:
+            slave_nickname, slave_password, protocol = parse_handshake(handshake.decode())
+
+            authenticated = await asyncio.wrap_future(self._authenticator.submit(slave_nickname,
+                                                                                 slave_password))
+            if not authenticated:
+                raise ValueError("Wrong username/password!")
+
+        except ValueError as e:
+            self._logger.warn("Authentication failed, %s" % str(e))
+            writer.write(("Authentication failed: " + e.args[0]).encode())
+            await writer.drain()
+            return
+
+        writer.write(make_handshake_reply(slave_nickname, protocol).encode())
+        await writer.drain()
+        self._logger.debug("Successful handshake with %s (%s)" % (str(slave_nickname), protocol))
+
+        self._heartbeat_interval_counters[slave_nickname] = 0
+        self._on_slave_connected(slave_nickname)
+
+        try:
+            data = await self._read_update(reader, protocol)
+            while data is not None and not self._stop:
+                self._store_state(slave_nickname, data)
+                self._log_heartbeat(slave_nickname, address, len(data))
+                data = await self._read_update(reader, protocol)
+
+            if data is None:
+                self._logger.debug("Emtpy data from %s, closing" % str(slave_nickname))
+        finally:
+            self._on_slave_disconnected(slave_nickname)
+
+    async def _read_update(self, reader, protocol):
+        """
+        :return: the next update or None when the slave has disconnected
+        :raises asyncio.TimeoutError: if the slave stays silent for read_timeout
+        """
+        if protocol == FRAMED_PROTOCOL:
+            return await asyncio.wait_for(read_frame(reader), self._read_timeout)
+        return await asyncio.wait_for(reader.read(1024), self._read_timeout) or None
@@ -0,0 +1,123 @@
+from enum import Enum, auto
+from queue import Queue, Full, Empty
+from threading import Thread, Lock
+from time import time
+
+from loggingserver import LoggingServer
+
+
+class OverflowPolicy(Enum):
+    DROP = auto()
+    BLOCK = auto()
+
+
+class BatchWriter:
+    """
+    Queues items and hands them to flush_function from a background thread
+    in lists of up to batch_size, at the latest flush_interval seconds after
+    the first item of a batch arrived
+    """
+
+    _WAKE_UP = object()
+
+    def __init__(self, flush_function, batch_size=100, flush_interval=1, max_queue_size=10000,
+                 overflow_policy=OverflowPolicy.DROP, name="BatchWriter"):
+        self._flush_function = flush_function
+        self._batch_size = batch_size
+        self._flush_interval = flush_interval
+        self._overflow_policy = overflow_policy
+        self._name = name
+
+        self._logger = LoggingServer.getInstance("overseer")
+        self._queue = Queue(maxsize=max_queue_size)
+        self._flush_lock = Lock()
+        self._stop = False
+        self._thread = None
+
+        self._written_count = 0
+        self._dropped_count = 0
+        self._failed_count = 0
+
+    def launch(self):
+        if self._thread is not None:
+            raise ValueError("Already running!")
+
+        self._stop = False
+        self._thread = Thread(target=self._run)
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background thread and writes out everything still queued
+        """
+        self._stop = True
+        if self._thread is not None:
+            self._queue.put(self._WAKE_UP)
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def put(self, item):
+        if self._overflow_policy is OverflowPolicy.BLOCK:
+            self._queue.put(item)
+            return
+
+        try:
+            self._queue.put_nowait(item)
+        except Full:
+            self._dropped_count += 1
+            if self._dropped_count % 1000 == 1:
+                self._logger.warn("%s: queue is full, %d items dropped so far" % (self._name, self._dropped_count))
+
+    def flush(self):
+        batch = []
+        try:
+            while True:
+                item = self._queue.get_nowait()
+                if item is not self._WAKE_UP:
+                    batch.append(item)
+                if len(batch) == self._batch_size:
+                    self._write(batch)
+                    batch = []
+        except Empty:
+            pass
+        if batch:
+            self._write(batch)
+
+    def get_stats(self):
+        return {"queued": self._queue.qsize(),
+                "written": self._written_count,
+                "dropped": self._dropped_count,
+                "failed": self._failed_count}
+
+    def _run(self):
+        while not self._stop:
+            try:
+                item = self._queue.get(timeout=self._flush_interval)
+            except Empty:
+                continue
+            if item is self._WAKE_UP:
+                continue
+
+            batch = [item]
+            deadline = time() + self._flush_interval
+            try:
+                while len(batch) < self._batch_size:
+                    item = self._queue.get(timeout=max(deadline - time(), 0))
+                    if item is self._WAKE_UP:
+                        break
+                    batch.append(item)
+            except Empty:
+                pass
+
+            self._write(batch)
+
+    def _write(self, batch):
+        with self._flush_lock:
+            try:
+                self._flush_function(batch)
+                self._written_count += len(batch)
+            except Exception as e:
+                self._failed_count += len(batch)
+                self._logger.warn("%s: failed to write %d items: %s" % (self._name, len(batch), repr(e)))
@@ -1,23 +1,42 @@
 import pickle
+from functools import partial
 from threading import Lock, Thread
-from concurrent.futures import ThreadPoolExecutor
-from time import sleep
+from queue import Queue, Empty
+from time import time
 
 from telegram import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.error import BadRequest, TimedOut, NetworkError, RetryAfter
+from telegram.error import BadRequest
 from telegram.ext import Updater, run_async
 
+from src.AlertLedger import AlertLedger
 from src.DBOperator import DBOperator
 from loggingserver import LoggingServer
+from src.MetricsRegistry import MetricsRegistry
 from src.ResourceManager import ResourceManager
+from src.SendScheduler import SendScheduler, SendPriority
+
+OK_MARKUP = InlineKeyboardMarkup([[InlineKeyboardButton("OK", callback_data="OK")]])
+NOT_MODIFIED = "Message is not modified: specified new message content and reply markup " \
+               "are exactly the same as a current content and reply markup of the message"
+
+BROADCAST_SECONDS = MetricsRegistry.get_instance().histogram("overseer_broadcast_tick_seconds",
+                                                             "Duration of one broadcast of the changed slaves")
+BROADCAST_SENDS = MetricsRegistry.get_instance().counter("overseer_broadcast_sends_total",
+                                                         "Finished updates of subscriber messages by result",
+                                                         ["result"])
 
 
 class Broadcaster:
 
-    def __init__(self, telegram_updater: Updater, update_server, db_operator: DBOperator):
+    def __init__(self, telegram_updater: Updater, update_server, db_operator: DBOperator,
+                 min_push_interval=3, send_scheduler: SendScheduler = None, alert_ledger: AlertLedger = None,
+                 offline_after=60):
         """
 
         :type update_server: src.UpdateServer.UpdateServer
+        :param min_push_interval: seconds between two consecutive pushes for the same slave,
+                                  changes arriving in between are coalesced
+        :param offline_after: seconds a slave has to stay offline before its subscribers are told
         """
         self._logger = LoggingServer.getInstance("overseer")
         self._stop = False
@@ -26,7 +45,20 @@ class Broadcaster:
         self._db_operator = db_operator
         self._resource_manager = ResourceManager()
         self._running = False
-        self._executor = ThreadPoolExecutor(max_workers=32)
+        self._send_scheduler = send_scheduler if send_scheduler is not None else SendScheduler()
+        self._alert_ledger = alert_ledger if alert_ledger is not None else AlertLedger(db_operator)
+
+        self._min_push_interval = min_push_interval
+        self._idle_timeout = 1
+        self._changes = Queue()
+        self._dirty_slaves = set()
+        self._next_push_times = {}
+        self._offline_after = offline_after
+        self._offline_lock = Lock()
+        self._offline_since = {}
+        self._update_server.add_state_listener(self.request_update)
+        self._update_server.get_alert_engine().add_listener(self._on_alert)
+        self._update_server.get_liveness().add_listener(self._on_liveness_change)
 
     def get_telegram_updater(self):
         return self._telegram_updater
@@ -39,6 +71,7 @@ class Broadcaster:
             raise ValueError("Already running!")
 
         self._update_server.launch()
+        self._send_scheduler.launch()
 
         self._stop = False
         t = Thread(target=self._run)
@@ -47,59 +80,186 @@ class Broadcaster:
 
     def stop(self):
         self._update_server.stop()
+        self._send_scheduler.stop()
         self._stop = True
+        self._alert_ledger.flush()
+
+    def get_send_scheduler(self):
+        return self._send_scheduler
 
     def get_update_server(self):
         return self._update_server
 
+    def request_update(self, slave_nickname):
+        """
+        Marks the slave as changed, its subscribers are updated as soon as allowed
+        by min_push_interval
+        """
+        self._changes.put(slave_nickname)
+
     def _run(self):
         self._running = True
+        self._broadcast_updates()
         while not self._stop:
-            self._broadcast_updates()
-            sleep(15)
+            self._wait_for_changes()
+            due_slaves = self._pop_due_slaves()
+            if due_slaves:
+                self._broadcast_updates(due_slaves)
+            self._send_offline_notices()
+            self._alert_ledger.flush()  # alerts delivered since the last pass
         self._running = False
 
-    def _broadcast_updates(self):
+    def _wait_for_changes(self):
+        if self._dirty_slaves:
+            timeout = min(self._next_push_times.get(slave_nickname, 0)
+                          for slave_nickname in self._dirty_slaves) - time()
+        else:
+            timeout = self._idle_timeout
+        with self._offline_lock:
+            if self._offline_since:
+                timeout = min(timeout, min(self._offline_since.values()) + self._offline_after - time())
+
+        try:
+            self._dirty_slaves.add(self._changes.get(timeout=max(timeout, 0)))
+            while True:
+                self._dirty_slaves.add(self._changes.get_nowait())
+        except Empty:
+            pass
+
+    def _pop_due_slaves(self):
+        now = time()
+        due_slaves = {slave_nickname for slave_nickname in self._dirty_slaves
+                      if self._next_push_times.get(slave_nickname, 0) <= now}
+        self._dirty_slaves -= due_slaves
+        for slave_nickname in due_slaves:
+            self._next_push_times[slave_nickname] = now + self._min_push_interval
+        return due_slaves
+
+    def _broadcast_updates(self, slave_nicknames=None):
+        with BROADCAST_SECONDS.time():
+            self._do_broadcast_updates(slave_nicknames)
 
-        user_sub_pairs = []
+    def _do_broadcast_updates(self, slave_nicknames):
 
-        users = self._db_operator.get_users()
-        for user in users:
-            for subscription in self._db_operator.get_subscriptions(user.telegram_id):
-                user_sub_pairs.append((user, subscription))
+        subscriptions = self._db_operator.get_subscription_index().get_all_subscriptions(slave_nicknames)
 
-        for result in self._executor.map(self._send_update, user_sub_pairs):
-            user, subscription, error = result
-            print("\rUpdated %s, slave: %s. Error: %s" % (str(user.full_name), str(subscription[0]), str(error)),
-                  end=" " * 10, flush=True)
+        subscriptions_by_slave = {}
+        for subscription in subscriptions:
+            subscriptions_by_slave.setdefault(subscription.slave_nickname, []).append(subscription)
 
-    def _send_update(self, target):
+        for slave_nickname, slave_subscriptions in subscriptions_by_slave.items():
+            self._schedule_updates(slave_nickname, slave_subscriptions)
 
-        user, subscription = target
+        self._alert_ledger.flush()
 
-        slave_nickname, info_message_id = subscription
+    def _schedule_updates(self, slave_nickname, subscriptions):
+        """
+        Renders the state of the slave once and schedules it for all its subscribers
+        """
         state = self._update_server.get_latest_state(slave_nickname)
-        try:
-            self._telegram_updater.bot.edit_message_text(state.get_state_message(),
-                                                         user.telegram_id,
-                                                         info_message_id,
-                                                         parse_mode=ParseMode.MARKDOWN)
-            alerts = state.get_alerts()
-            for alert in alerts:
-                if alert != "":
-                    alert_message = state.get_alert_message(alert)
-                    reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("OK",
-                                                                               callback_data="OK")]])
-                    self._telegram_updater.bot.send_message(user.telegram_id,
-                                                            alert_message,
-                                                            parse_mode=ParseMode.MARKDOWN,
-                                                            reply_markup=reply_markup)
-            return user, subscription, None
-        except BadRequest as e:
-            if e.message != "Message is not modified: specified new message content and reply markup " \
-                            "are exactly the same as a current content and reply markup of the message":
-                self._logger.warn("Error for user %d, %s: " % (user.telegram_id, slave_nickname) + e.message)
-            return user, subscription, e
-        except (TimedOut, NetworkError, RetryAfter) as e:
-            return user, subscription, e
+        state_message = state.get_state_message()
+        bot = self._telegram_updater.bot
+
+        if self._update_server.get_state_version(slave_nickname):
+            alerts = [alert for alert in state.get_alerts() if alert != ""]
+        else:
+            alerts = None  # the slave has not reported yet, its alerts are unknown
+
+        for subscription in subscriptions:
+            telegram_id, slave_nickname, info_message_id = subscription
+
+            edit = partial(bot.edit_message_text, state_message, telegram_id, info_message_id,
+                           parse_mode=ParseMode.MARKDOWN)
+            self._send_scheduler.submit(telegram_id, edit, key=tuple(subscription),
+                                        on_done=partial(self._on_update_sent, subscription))
+
+            if alerts is None:
+                continue
+
+            new_alerts = self._alert_ledger.get_new_alerts(telegram_id, slave_nickname, alerts)
+            if new_alerts:
+                send = partial(bot.send_message, telegram_id, state.get_alerts_message(new_alerts),
+                               parse_mode=ParseMode.MARKDOWN, reply_markup=OK_MARKUP)
+                future = self._send_scheduler.submit(telegram_id, send, priority=SendPriority.ALERT)
+                future.add_done_callback(partial(self._on_update_sent, subscription))
+                future.add_done_callback(partial(self._on_alerts_sent, telegram_id, slave_nickname, new_alerts))
+
+    def _on_liveness_change(self, slave_nickname, online):
+        """
+        Re-renders the state of the slave. Its subscribers are told it went offline
+        only if it stays offline for offline_after, and that it is back if they were told
+        """
+        self.request_update(slave_nickname)
+        with self._offline_lock:
+            if not online:
+                self._offline_since.setdefault(slave_nickname, time())
+                return
+            self._offline_since.pop(slave_nickname, None)
+
+        self._notify_liveness(slave_nickname, "slave_online", False)
+        self._alert_ledger.flush()
+
+    def _send_offline_notices(self, now=None):
+        """
+        Tells the subscribers of the slaves offline for offline_after
+        """
+        now = time() if now is None else now
+        with self._offline_lock:
+            due_slaves = [slave_nickname for slave_nickname, since in self._offline_since.items()
+                          if now - since >= self._offline_after]
+            for slave_nickname in due_slaves:
+                del self._offline_since[slave_nickname]
+
+        for slave_nickname in due_slaves:
+            self._notify_liveness(slave_nickname, "slave_offline", True)
+        if due_slaves:
+            self._alert_ledger.flush()
+
+    def _notify_liveness(self, slave_nickname, string, offline):
+        """
+        Sends the message to the subscribers the ledger says have not been told yet
+        """
+        bot = self._telegram_updater.bot
+        message = self._resource_manager.get_string(string) % slave_nickname
+        for telegram_id, info_message_id in \
+                self._db_operator.get_subscription_index().get_subscribers(slave_nickname):
+            if not self._alert_ledger.set_offline(telegram_id, slave_nickname, offline):
+                continue
+            send = partial(bot.send_message, telegram_id, message, reply_markup=OK_MARKUP)
+            future = self._send_scheduler.submit(telegram_id, send, priority=SendPriority.ALERT)
+            future.add_done_callback(partial(self._on_update_sent, (telegram_id, slave_nickname, info_message_id)))
+
+    def _on_alert(self, event):
+        """
+        :type event: src.AlertEngine.AlertEvent
+        """
+        bot = self._telegram_updater.bot
+        message = event.get_message()
+        for telegram_id, info_message_id in \
+                self._db_operator.get_subscription_index().get_subscribers(event.slave_nickname):
+            send = partial(bot.send_message, telegram_id, message,
+                           parse_mode=ParseMode.MARKDOWN, reply_markup=OK_MARKUP)
+            future = self._send_scheduler.submit(telegram_id, send, priority=SendPriority.ALERT)
+            future.add_done_callback(partial(self._on_update_sent,
+                                             (telegram_id, event.slave_nickname, info_message_id)))
+
+    def _on_alerts_sent(self, telegram_id, slave_nickname, alerts, future):
+        """
+        Records the alerts as shown once delivered, a failed send leaves them to the next broadcast
+        """
+        if future.exception() is None:
+            self._alert_ledger.confirm(telegram_id, slave_nickname, alerts)
+        else:
+            self._alert_ledger.discard(telegram_id, slave_nickname, alerts)
 
+    def _on_update_sent(self, subscription, future):
+        telegram_id, slave_nickname, info_message_id = subscription
+        error = future.exception()
+        if error is None:
+            BROADCAST_SENDS.inc("ok")
+        elif isinstance(error, BadRequest) and error.message == NOT_MODIFIED:
+            BROADCAST_SENDS.inc("not_modified")
+        else:
+            BROADCAST_SENDS.inc("error")
+            if isinstance(error, BadRequest):
+                self._logger.warn("Error for user %d, %s: " % (telegram_id, slave_nickname) + error.message)
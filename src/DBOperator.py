@@ -1,51 +1,146 @@
-from datetime import datetime
+import struct
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from io import BytesIO
+from threading import BoundedSemaphore, Lock
+from time import perf_counter
 
-import psycopg2
 from psycopg2 import ProgrammingError, IntegrityError
 from psycopg2._psycopg import DataError
-from psycopg2.extras import Inet
+from psycopg2.extras import Inet, execute_values
+from psycopg2.pool import ThreadedConnectionPool
 from telegram import Message
 from collections import namedtuple
 from hashlib import md5
 
+from src.MetricsRegistry import MetricsRegistry, timed
+from src.PasswordHashing import hash_password, MD5
 from src.ResourceManager import ResourceManager
+from src.SlaveState import SlaveState
+from src.SubscriptionIndex import SubscriptionIndex, Subscription
+
+QUERY_SECONDS = MetricsRegistry.get_instance().histogram("overseer_db_query_seconds",
+                                                         "Duration of DBOperator queries", ["method"])
+POOL_WAIT_SECONDS = MetricsRegistry.get_instance().histogram("overseer_db_pool_wait_seconds",
+                                                             "Time spent waiting for a pooled connection")
+
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)  # signature, flags, header extension length
+COPY_TRAILER = struct.pack("!h", -1)
+COPY_EPOCH = datetime(2000, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+ROLLUP_RESOLUTIONS = (3600, 60)  # seconds, coarsest first
+
+MetricPoint = namedtuple("MetricPoint", ("at", "minimum", "maximum", "mean"))
+
+
+def floor_time(moment, seconds):
+    """
+    :return: the start of the interval of the given length containing the moment
+    """
+    return moment - (moment - COPY_EPOCH) % timedelta(seconds=seconds)
 
 
 class DBOperator:
-    TABLES = ["users", "slaves", "subscriptions", "messages"]
+    TABLES = ["users", "slaves", "subscriptions", "messages", "alert_ledger", "slave_states", "metric_rollups",
+              "media_files"]
+
+    def __init__(self, dbname, user, password, drop_key="", pool_size=10, password_scheme=MD5):
+        """
 
-    def __init__(self, dbname, user, password, drop_key=""):
+        :param password_scheme: PasswordHashing.MD5 or PasswordHashing.SCRYPT for the slave passwords
+                                stored from now on, both kinds are accepted on authentication
+        """
         self._dbname = dbname
         self._user = user
         self._password = password
-
-        self._conn = psycopg2.connect("dbname=%s user=%s password=%s" % (dbname, user, password))
-        self._c = self._conn.cursor()
+        self._password_scheme = password_scheme
+        self._slave_listeners = []
+
+        self._pool_size = pool_size
+        self._pool = ThreadedConnectionPool(1, pool_size, "dbname=%s user=%s password=%s" % (dbname, user, password))
+        self._pool_slots = BoundedSemaphore(pool_size)
+        self._pool_stats_lock = Lock()
+        self._connections_in_use = 0
+        self._connections_acquired = 0
+        self._total_wait_time = 0
+        self._max_wait_time = 0
 
         if drop_key == "r4jYi1@" and dbname == "overseer_test":
             for table in self.TABLES:
                 try:
-                    with self._conn:
-                        self._c.execute("DROP TABLE %s CASCADE;" % table)
+                    with self._cursor() as c:
+                        c.execute("DROP TABLE %s CASCADE;" % table)
                 except ProgrammingError as e:
                     print(e)
 
         if len(self.get_tables()) == 0:
             self.create_tables()
+        self.create_missing_tables()
 
         self._rm = ResourceManager()
 
+        self._subscription_index = SubscriptionIndex()
+        self._subscription_index.load(self.get_all_subscriptions())
+
+    @contextmanager
+    def _connection(self):
+        """
+        Borrows a connection from the pool, waiting while all of them are busy.
+        The transaction is committed on exit or rolled back on an exception
+        """
+        start = perf_counter()
+        self._pool_slots.acquire()
+        wait_time = perf_counter() - start
+        POOL_WAIT_SECONDS.observe(wait_time)
+
+        with self._pool_stats_lock:
+            self._connections_in_use += 1
+            self._connections_acquired += 1
+            self._total_wait_time += wait_time
+            self._max_wait_time = max(self._max_wait_time, wait_time)
+
+        conn = None
+        try:
+            conn = self._pool.getconn()
+            with conn:
+                yield conn
+        finally:
+            if conn is not None:
+                self._pool.putconn(conn, close=bool(conn.closed))
+            with self._pool_stats_lock:
+                self._connections_in_use -= 1
+            self._pool_slots.release()
+
+    @contextmanager
+    def _cursor(self):
+        with self._connection() as conn:
+            with conn.cursor() as c:
+                yield c
+
+    def get_pool_stats(self):
+        with self._pool_stats_lock:
+            acquired = self._connections_acquired
+            return {"size": self._pool_size,
+                    "in_use": self._connections_in_use,
+                    "acquired": acquired,
+                    "mean_wait": self._total_wait_time / acquired if acquired else 0,
+                    "max_wait": self._max_wait_time}
+
+    def close(self):
+        self._pool.closeall()
+
     def get_tables(self):
-        with self._conn:
+        with self._cursor() as c:
             query = """SELECT table_name 
                        FROM information_schema.tables 
                        WHERE table_schema = 'public' 
                        ORDER BY table_schema,table_name;"""
-            self._c.execute(query)
-            return self._c.fetchall()
+            c.execute(query)
+            return c.fetchall()
 
     def create_tables(self):
-        with self._conn:
+        with self._cursor() as c:
             query = """
                     CREATE TABLE users (
                         user_id serial PRIMARY KEY,
@@ -54,7 +149,7 @@ class DBOperator:
                         nickname VARCHAR(50)
                     );
                     """
-            self._c.execute(query)
+            c.execute(query)
 
             query = """
                     CREATE TABLE slaves (
@@ -65,7 +160,7 @@ class DBOperator:
                         slave_password VARCHAR(60)
                     );
                     """
-            self._c.execute(query)
+            c.execute(query)
 
             query = """
                     CREATE TABLE subscriptions (
@@ -83,7 +178,7 @@ class DBOperator:
                              ON UPDATE CASCADE ON DELETE CASCADE
                     );
                     """
-            self._c.execute(query)
+            c.execute(query)
 
             query = """
                     CREATE TABLE messages (
@@ -97,99 +192,169 @@ class DBOperator:
                     );
                     CREATE INDEX messages_idx ON messages (user_telegram_id, message_id);
                     """
-            self._c.execute(query)
+            c.execute(query)
+
+    def create_missing_tables(self):
+        """
+        Tables added after the initial schema, created in existing databases too
+        """
+        with self._cursor() as c:
+            query = """
+                    CREATE TABLE IF NOT EXISTS alert_ledger (
+                        user_id integer NOT NULL,
+                        slave_id integer NOT NULL,
+                        alerts text[] NOT NULL,
+                        offline boolean NOT NULL DEFAULT false,
+                        updated_at timestamp without time zone,
+
+                        PRIMARY KEY (user_id, slave_id),
+                        FOREIGN KEY (user_id) REFERENCES users (user_id)
+                            ON UPDATE CASCADE ON DELETE CASCADE,
+                        FOREIGN KEY (slave_id) REFERENCES slaves (slave_id)
+                            ON UPDATE CASCADE ON DELETE CASCADE
+                    );
+                    ALTER TABLE alert_ledger ADD COLUMN IF NOT EXISTS offline boolean NOT NULL DEFAULT false;
+                    """
+            c.execute(query)
+
+            query = """
+                    CREATE TABLE IF NOT EXISTS slave_states (
+                        slave_nickname VARCHAR(50) NOT NULL,
+                        received_at timestamp without time zone NOT NULL,
+                        raw_message bytea NOT NULL
+                    );
+                    CREATE INDEX IF NOT EXISTS slave_states_received_at_idx
+                        ON slave_states USING brin (received_at);
+                    """
+            c.execute(query)
+
+            query = """
+                    CREATE TABLE IF NOT EXISTS metric_rollups (
+                        slave_nickname VARCHAR(50) NOT NULL,
+                        metric text NOT NULL,
+                        resolution integer NOT NULL,
+                        bucket timestamp without time zone NOT NULL,
+                        samples integer NOT NULL,
+                        minimum double precision NOT NULL,
+                        maximum double precision NOT NULL,
+                        total double precision NOT NULL,
+
+                        PRIMARY KEY (slave_nickname, metric, resolution, bucket)
+                    );
+                    """
+            c.execute(query)
 
+            query = """
+                    CREATE TABLE IF NOT EXISTS media_files (
+                        content_hash CHAR(64) PRIMARY KEY,
+                        file_id VARCHAR(250) NOT NULL,
+                        uploaded_at timestamp without time zone
+                    );
+                    """
+            c.execute(query)
+
+    @timed(QUERY_SECONDS)
     def add_user(self, user):
         telegram_id = user.id
         full_name = user.full_name
         nickname = user.name
-        try:
-            query = "INSERT INTO users (telegram_id, full_name, nickname) VALUES (%s, %s, %s);"
-            self._c.execute(query, [telegram_id, full_name, nickname])
-            self._conn.commit()
-        except IntegrityError:
-            self._conn.rollback()  # user is already known
-            query = "UPDATE users SET (full_name, nickname) = (%s, %s) WHERE telegram_id = %s;"
-            self._c.execute(query, [full_name, nickname, telegram_id])
-            self._conn.commit()
+        with self._cursor() as c:
+            query = "INSERT INTO users (telegram_id, full_name, nickname) VALUES (%s, %s, %s) " \
+                    "ON CONFLICT (telegram_id) DO UPDATE " \
+                    "SET (full_name, nickname) = (EXCLUDED.full_name, EXCLUDED.nickname);"
+            c.execute(query, [telegram_id, full_name, nickname])
 
+    @timed(QUERY_SECONDS)
     def add_slave(self, slave):
         slave_nickname = slave.nickname
         slave_ip = slave.ip
-        slave_password = md5(slave.password.encode()).hexdigest()
+        slave_password = hash_password(slave.password, self._password_scheme)
         slave_owner = slave.owner
         try:
-            query = "INSERT INTO slaves (slave_nickname, slave_ip, slave_owner, slave_password) " \
-                    "VALUES (%s, %s, %s, %s);"
-            self._c.execute(query, [slave_nickname, Inet(slave_ip), slave_owner, slave_password])
-            self._conn.commit()
+            with self._cursor() as c:
+                query = "INSERT INTO slaves (slave_nickname, slave_ip, slave_owner, slave_password) " \
+                        "VALUES (%s, %s, %s, %s);"
+                c.execute(query, [slave_nickname, Inet(slave_ip), slave_owner, slave_password])
         except IntegrityError:
-            self._conn.rollback()
             raise ValueError("Slave already exists")
         except DataError as e:
-            self._conn.rollback()
             if len(slave_nickname) > 50:
                 raise ValueError(self._rm.get_string("slave_name_too_long"))
             else:
                 raise e
 
+        self._notify_slave_listeners(slave_nickname)
+
+    @timed(QUERY_SECONDS)
     def update_slave(self, slave):
         slave_nickname = slave.nickname
         slave_ip = slave.ip
-        slave_password = md5(slave.password.encode()).hexdigest()
+        slave_password = hash_password(slave.password, self._password_scheme)
         slave_owner = slave.owner
 
         try:
-            query = "UPDATE slaves SET (slave_ip, slave_owner, slave_password) = (%s, %s, %s) " \
-                    "WHERE slave_nickname = %s;"
-            self._c.execute(query, [Inet(slave_ip), slave_owner, slave_password, slave_nickname])
-            self._conn.commit()
-        # except IntegrityError:
-        #     self._conn.rollback()
-        #     raise ValueError("Slave already exists")
+            with self._cursor() as c:
+                query = "UPDATE slaves SET (slave_ip, slave_owner, slave_password) = (%s, %s, %s) " \
+                        "WHERE slave_nickname = %s;"
+                c.execute(query, [Inet(slave_ip), slave_owner, slave_password, slave_nickname])
         except DataError as e:
-            self._conn.rollback()
             if len(slave_nickname) > 50:
                 raise ValueError(self._rm.get_string("slave_name_too_long"))
             else:
                 raise e
 
+        self._notify_slave_listeners(slave_nickname)
+
+    def add_slave_listener(self, listener):
+        """
+        :param listener: called with the slave nickname after the slave was added or updated
+        """
+        self._slave_listeners.append(listener)
+
+    def _notify_slave_listeners(self, slave_nickname):
+        for listener in self._slave_listeners:
+            listener(slave_nickname)
+
+    @timed(QUERY_SECONDS)
     def get_users(self):
         fields = "telegram_id", "full_name", "nickname"
-        with self._conn:
-            self._c.execute("SELECT %s FROM users" % ", ".join(fields))
-            raw_users = self._c.fetchall()
+        with self._cursor() as c:
+            c.execute("SELECT %s FROM users" % ", ".join(fields))
+            raw_users = c.fetchall()
             users = []
             for raw_user in raw_users:
                 User = namedtuple("User", fields)
                 users.append(User(*raw_user))
             return users
 
+    @timed(QUERY_SECONDS)
     def get_slaves(self):
-        with self._conn:
+        with self._cursor() as c:
             fields = "slave_nickname", "slave_ip", "slave_owner", "slave_password"
-            self._c.execute("SELECT %s FROM slaves" % ", ".join(fields))
-            raw_slaves = self._c.fetchall()
+            c.execute("SELECT %s FROM slaves" % ", ".join(fields))
+            raw_slaves = c.fetchall()
             slaves = []
             for raw_slave in raw_slaves:
                 Slave = namedtuple("Slave", fields)
                 slaves.append(Slave(*raw_slave))
             return slaves
 
+    @timed(QUERY_SECONDS)
     def get_slave(self, nickname):
-        with self._conn:
+        with self._cursor() as c:
             fields = "slave_nickname", "slave_ip", "slave_owner", "slave_password"
-            self._c.execute("SELECT %s FROM slaves WHERE slave_nickname = '%s';" % (", ".join(fields), nickname))
+            c.execute("SELECT %s FROM slaves WHERE slave_nickname = %%s;" % ", ".join(fields), [nickname])
             try:
-                raw_slave = self._c.fetchall()[0]
+                raw_slave = c.fetchall()[0]
                 Slave = namedtuple("Slave", fields)
                 return Slave(*raw_slave)
             except IndexError:
                 raise ValueError("Slave %s not found" % nickname)
 
+    @timed(QUERY_SECONDS)
     def get_subscriptions(self, telegram_id):
 
-        with self._conn:
+        with self._cursor() as c:
             query = """SELECT slave_nickname, info_message_id
                           FROM slaves
                         LEFT OUTER JOIN subscriptions
@@ -198,73 +363,333 @@ class DBOperator:
                           ON users.user_id = subscriptions.user_id
                         where telegram_id = %s;
                     """
-            self._c.execute(query, [telegram_id])
-            return self._c.fetchall()
-
+            c.execute(query, [telegram_id])
+            return c.fetchall()
+
+    def get_all_subscriptions(self, slave_nicknames=None, itersize=2000):
+        """
+        Streams every subscription as (telegram_id, slave_nickname, info_message_id)
+        with one joined query through a server-side cursor
+
+        :param slave_nicknames: if given, only subscriptions to these slaves are returned
+        """
+        with self._connection() as conn:
+            with conn.cursor(name="all_subscriptions") as c:
+                c.itersize = itersize
+                query = """SELECT telegram_id, slave_nickname, info_message_id
+                              FROM subscriptions
+                            JOIN users
+                              ON users.user_id = subscriptions.user_id
+                            JOIN slaves
+                              ON slaves.slave_id = subscriptions.slave_id
+                        """
+                if slave_nicknames is None:
+                    c.execute(query)
+                else:
+                    c.execute(query + " WHERE slave_nickname = ANY(%s)", [list(slave_nicknames)])
+                for raw_subscription in c:
+                    yield Subscription(*raw_subscription)
+
+    @timed(QUERY_SECONDS)
     def subscribe(self, telegram_id, slave_nickname, info_message_id):
 
-        user_id = self._get_user_id(telegram_id)
-        slave_id = self._get_slave_id(slave_nickname)
         sub_date = datetime.now()
 
-        try:
-            query = "INSERT INTO subscriptions (user_id, slave_id, sub_date, info_message_id) VALUES (%s, %s, %s, %s);"
-            self._c.execute(query, [user_id, slave_id, sub_date, info_message_id])
-            self._conn.commit()
-        except IntegrityError:  # user is already subscribed to slave
-            self._conn.rollback()
-            with self._conn:
-                query = "UPDATE subscriptions SET info_message_id = %s, sub_date = %s WHERE user_id = %s AND slave_id = %s"
-                self._c.execute(query, [info_message_id, sub_date, user_id, slave_id])
+        with self._cursor() as c:
+            user_id = self._get_user_id(c, telegram_id)
+            slave_id = self._get_slave_id(c, slave_nickname)
 
-    def unsubscribe(self, telegram_id, slave_nickname):
+            query = "INSERT INTO subscriptions (user_id, slave_id, sub_date, info_message_id) " \
+                    "VALUES (%s, %s, %s, %s) " \
+                    "ON CONFLICT (user_id, slave_id) DO UPDATE " \
+                    "SET (info_message_id, sub_date) = (EXCLUDED.info_message_id, EXCLUDED.sub_date);"
+            c.execute(query, [user_id, slave_id, sub_date, info_message_id])
+
+        self._subscription_index.add(telegram_id, slave_nickname, info_message_id)
 
-        user_id = self._get_user_id(telegram_id)
-        slave_id = self._get_slave_id(slave_nickname)
+    @timed(QUERY_SECONDS)
+    def unsubscribe(self, telegram_id, slave_nickname):
 
         try:
-            query = "DELETE FROM subscriptions WHERE user_id=%s AND slave_id=%s;"
-            self._c.execute(query, [user_id, slave_id])
-            self._conn.commit()
+            with self._cursor() as c:
+                user_id = self._get_user_id(c, telegram_id)
+                slave_id = self._get_slave_id(c, slave_nickname)
+
+                query = "DELETE FROM subscriptions WHERE user_id=%s AND slave_id=%s;"
+                c.execute(query, [user_id, slave_id])
         except ProgrammingError as e:
-            self._conn.rollback()
             raise ValueError("Delete error: %s" % str(e))
 
-    def add_message(self, message: Message):
-        user_telegram_id = message.from_user.id
-        message_id = message.message_id
-        user_full_name = message.from_user.full_name
-        user_telegram_nick = message.from_user.name
-        date = message.date
-        text = md5(message.text.encode()).hexdigest()
-
-        fields = [user_telegram_id, message_id, user_full_name,
-                  user_telegram_nick, date, text]
+        self._subscription_index.remove(telegram_id, slave_nickname)
+
+    def get_subscription_index(self):
+        """
+        :rtype: SubscriptionIndex
+        """
+        return self._subscription_index
+
+    @timed(QUERY_SECONDS)
+    def get_alert_ledger(self):
+        """
+        :return: list of (telegram_id, slave_nickname, alerts already shown, whether told the slave is offline)
+        """
+        with self._cursor() as c:
+            query = """SELECT telegram_id, slave_nickname, alerts, offline
+                          FROM alert_ledger
+                        JOIN users
+                          ON users.user_id = alert_ledger.user_id
+                        JOIN slaves
+                          ON slaves.slave_id = alert_ledger.slave_id;
+                    """
+            c.execute(query)
+            return c.fetchall()
+
+    @timed(QUERY_SECONDS)
+    def save_alert_ledger(self, rows):
+        """
+        :param rows: (telegram_id, slave_nickname, alerts, offline) tuples, upserted with one statement
+        """
+        with self._cursor() as c:
+            query = "INSERT INTO alert_ledger (user_id, slave_id, alerts, offline, updated_at) " \
+                    "SELECT users.user_id, slaves.slave_id, v.alerts, v.offline, v.updated_at " \
+                    "FROM (VALUES %s) AS v (telegram_id, slave_nickname, alerts, offline, updated_at) " \
+                    "JOIN users ON users.telegram_id = v.telegram_id " \
+                    "JOIN slaves ON slaves.slave_nickname = v.slave_nickname " \
+                    "ON CONFLICT (user_id, slave_id) DO UPDATE " \
+                    "SET (alerts, offline, updated_at) = (EXCLUDED.alerts, EXCLUDED.offline, EXCLUDED.updated_at);"
+            now = datetime.now()
+            execute_values(c, query, [(telegram_id, slave_nickname, list(alerts), offline, now)
+                                      for telegram_id, slave_nickname, alerts, offline in rows],
+                           template="(%s, %s, %s::text[], %s, %s::timestamp)", page_size=1000)
+
+    @timed(QUERY_SECONDS)
+    def get_media_files(self):
+        """
+        :return: list of (content_hash, file_id)
+        """
+        with self._cursor() as c:
+            c.execute("SELECT content_hash, file_id FROM media_files;")
+            return c.fetchall()
+
+    @timed(QUERY_SECONDS)
+    def save_media_file(self, content_hash, file_id):
+        with self._cursor() as c:
+            query = "INSERT INTO media_files (content_hash, file_id, uploaded_at) VALUES (%s, %s, %s) " \
+                    "ON CONFLICT (content_hash) DO UPDATE " \
+                    "SET (file_id, uploaded_at) = (EXCLUDED.file_id, EXCLUDED.uploaded_at);"
+            c.execute(query, [content_hash, file_id, datetime.now()])
+
+    @timed(QUERY_SECONDS)
+    def delete_media_file(self, content_hash):
+        with self._cursor() as c:
+            c.execute("DELETE FROM media_files WHERE content_hash = %s;", [content_hash])
 
-        with self._conn:
+    def add_message(self, message: Message):
+        self.add_message_rows([self.make_message_row(message)])
+
+    @staticmethod
+    def make_message_row(message: Message):
+        return (message.from_user.id, message.message_id, message.from_user.full_name,
+                message.from_user.name, message.date, md5(message.text.encode()).hexdigest())
+
+    @timed(QUERY_SECONDS)
+    def add_message_rows(self, rows):
+        """
+        :param rows: tuples made by make_message_row, inserted with one statement
+        """
+        with self._cursor() as c:
             query = "INSERT INTO messages (user_telegram_id, message_id, user_full_name, " \
                     "                      user_telegram_nick, date, text) " \
-                    "VALUES (%s, %s, %s, %s, %s, %s);"
-            self._c.execute(query, fields)
-
+                    "VALUES %s;"
+            execute_values(c, query, rows, page_size=1000)
+
+    @timed(QUERY_SECONDS)
+    def add_slave_states(self, states):
+        """
+        Appends the states with one binary COPY. Rows are keyed by the nickname and not
+        by slave_id, so no lookups are made and the table has no constraints to check.
+        Raw messages are stored as received
+
+        :param states: iterable of SlaveState
+        """
+        chunks = [COPY_HEADER]
+        for state in states:
+            nickname = state.get_slave_nickname().encode()
+            raw_message = state.get_raw_bytes()
+            chunks.append(struct.pack("!hi", 3, len(nickname)))
+            chunks.append(nickname)
+            chunks.append(struct.pack("!iqi", 8, (state.get_received_at() - COPY_EPOCH) // MICROSECOND,
+                                      len(raw_message)))
+            chunks.append(raw_message)
+        chunks.append(COPY_TRAILER)
+
+        with self._cursor() as c:
+            c.copy_expert("COPY slave_states (slave_nickname, received_at, raw_message) FROM STDIN WITH BINARY",
+                          BytesIO(b"".join(chunks)))
+
+    @timed(QUERY_SECONDS)
+    def get_slave_states(self, slave_nickname, since, until=None):
+        """
+        :return: list of SlaveState received in [since, until), oldest first
+        """
+        until = until if until is not None else datetime.max
+        with self._cursor() as c:
+            query = "SELECT received_at, raw_message FROM slave_states " \
+                    "WHERE received_at >= %s AND received_at < %s AND slave_nickname = %s " \
+                    "ORDER BY received_at;"
+            c.execute(query, [since, until, slave_nickname])
+            return [SlaveState(slave_nickname, bytes(raw_message), received_at) for received_at, raw_message in c]
+
+    @timed(QUERY_SECONDS)
+    def delete_slave_states(self, before):
+        """
+        :return: number of deleted states
+        """
+        with self._cursor() as c:
+            c.execute("DELETE FROM slave_states WHERE received_at < %s;", [before])
+            return c.rowcount
+
+    @timed(QUERY_SECONDS)
+    def downsample_slave_states(self, before, interval):
+        """
+        Keeps only the first state of every slave in each interval for the states
+        received before the given moment. Downsampling again is a no-op
+
+        :param interval: seconds
+        :return: number of deleted states
+        """
+        with self._cursor() as c:
+            query = """DELETE FROM slave_states
+                        WHERE received_at < %(before)s AND ctid IN (
+                          SELECT ctid FROM (
+                            SELECT ctid, row_number() OVER (
+                                     PARTITION BY slave_nickname, floor(extract(epoch FROM received_at) / %(interval)s)
+                                     ORDER BY received_at) AS position
+                              FROM slave_states
+                             WHERE received_at < %(before)s) AS numbered
+                           WHERE position > 1);
+                    """
+            c.execute(query, {"before": before, "interval": interval})
+            return c.rowcount
+
+    @timed(QUERY_SECONDS)
+    def add_metric_rollups(self, states):
+        """
+        Folds the metrics of the states into their minute and hour rollups
+
+        :param states: iterable of SlaveState
+        """
+        finest = ROLLUP_RESOLUTIONS[-1]
+        rollups = {}
+        for state in states:
+            slave_nickname = state.get_slave_nickname()
+            bucket = floor_time(state.get_received_at(), finest)
+            for metric, value in state.get_metrics().items():
+                self._merge_rollup(rollups, (slave_nickname, metric, finest, bucket), 1, value, value, value)
+
+        finest_rollups = list(rollups.items())
+        for resolution in ROLLUP_RESOLUTIONS[:-1]:  # coarser rollups are merged from the finest ones
+            for (slave_nickname, metric, _, bucket), rollup in finest_rollups:
+                self._merge_rollup(rollups, (slave_nickname, metric, resolution, floor_time(bucket, resolution)),
+                                   *rollup)
+
+        if not rollups:
+            return
+        with self._cursor() as c:
+            query = "INSERT INTO metric_rollups " \
+                    "(slave_nickname, metric, resolution, bucket, samples, minimum, maximum, total) VALUES %s " \
+                    "ON CONFLICT (slave_nickname, metric, resolution, bucket) DO UPDATE " \
+                    "SET (samples, minimum, maximum, total) = (metric_rollups.samples + EXCLUDED.samples, " \
+                    "LEAST(metric_rollups.minimum, EXCLUDED.minimum), " \
+                    "GREATEST(metric_rollups.maximum, EXCLUDED.maximum), " \
+                    "metric_rollups.total + EXCLUDED.total);"
+            execute_values(c, query, [key + tuple(rollup) for key, rollup in sorted(rollups.items())],
+                           page_size=1000)
+
+    @staticmethod
+    def _merge_rollup(rollups, key, samples, minimum, maximum, total):
+        rollup = rollups.get(key)
+        if rollup is None:
+            rollups[key] = [samples, minimum, maximum, total]
+        else:
+            rollup[0] += samples
+            rollup[1] = min(rollup[1], minimum)
+            rollup[2] = max(rollup[2], maximum)
+            rollup[3] += total
+
+    @timed(QUERY_SECONDS)
+    def get_metric_series(self, slave_nickname, metric, since, until=None, resolution=0):
+        """
+        Reads the coarsest rollup not coarser than the resolution and merges it into
+        intervals of the requested length; raw states are read for resolutions under a minute.
+        Intervals starting before since are left out, they would hold older samples
+
+        :param resolution: seconds
+        :return: list of MetricPoint, oldest first
+        """
+        until = until if until is not None else datetime.max
+        rollup_resolution = next((rollup_resolution for rollup_resolution in ROLLUP_RESOLUTIONS
+                                  if rollup_resolution <= resolution), None)
+
+        if rollup_resolution is None:
+            points = []
+            for state in self.get_slave_states(slave_nickname, since, until):
+                value = state.get_metrics().get(metric)
+                if value is not None:
+                    points.append(MetricPoint(state.get_received_at(), value, value, value))
+            return points
+
+        with self._cursor() as c:
+            query = "SELECT bucket, samples, minimum, maximum, total FROM metric_rollups " \
+                    "WHERE slave_nickname = %s AND metric = %s AND resolution = %s " \
+                    "AND bucket >= %s AND bucket < %s " \
+                    "ORDER BY bucket;"
+            c.execute(query, [slave_nickname, metric, rollup_resolution, since, until])
+            rows = c.fetchall()
+
+        merged = []
+        for bucket, samples, minimum, maximum, total in rows:
+            at = floor_time(bucket, resolution)
+            if at < since:
+                continue
+            if merged and merged[-1][0] == at:
+                point = merged[-1]
+                point[1] += samples
+                point[2] = min(point[2], minimum)
+                point[3] = max(point[3], maximum)
+                point[4] += total
+            else:
+                merged.append([at, samples, minimum, maximum, total])
+        return [MetricPoint(at, minimum, maximum, total / samples) for at, samples, minimum, maximum, total in merged]
+
+    @timed(QUERY_SECONDS)
+    def delete_metric_rollups(self, resolution, before):
+        """
+        :return: number of deleted rollups
+        """
+        with self._cursor() as c:
+            c.execute("DELETE FROM metric_rollups WHERE resolution = %s AND bucket < %s;", [resolution, before])
+            return c.rowcount
+
+    @timed(QUERY_SECONDS)
     def get_messages(self, telegram_id):
-        with self._conn:
+        with self._cursor() as c:
             query = "SELECT * from messages WHERE user_telegram_id = %s"
-            self._c.execute(query, [telegram_id])
-            return self._c.fetchall()
+            c.execute(query, [telegram_id])
+            return c.fetchall()
 
-    def _get_user_id(self, telegram_id):
+    @staticmethod
+    def _get_user_id(c, telegram_id):
         try:
-            self._c.execute("select users.user_id from users where users.telegram_id = %s", [telegram_id])
-            return self._c.fetchall()[0][0]
+            c.execute("select users.user_id from users where users.telegram_id = %s", [telegram_id])
+            return c.fetchall()[0][0]
         except IndexError:
-            self._conn.rollback()
             raise ValueError("User %d not found" % telegram_id)
 
-    def _get_slave_id(self, slave_nickname):
+    @staticmethod
+    def _get_slave_id(c, slave_nickname):
         try:
-            self._c.execute("select slaves.slave_id from slaves where slaves.slave_nickname=%s", [slave_nickname])
-            return self._c.fetchall()[0][0]
+            c.execute("select slaves.slave_id from slaves where slaves.slave_nickname=%s", [slave_nickname])
+            return c.fetchall()[0][0]
         except IndexError:
-            self._conn.rollback()
             raise ValueError("Slave %s not found" % slave_nickname)
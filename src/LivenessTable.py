@@ -0,0 +1,118 @@
+from threading import Lock
+from time import time
+
+
+class _Liveness:
+
+    __slots__ = ("last_seen", "mean_interval", "messages", "connections", "online")
+
+    def __init__(self):
+        self.last_seen = None
+        self.mean_interval = None
+        self.messages = 0
+        self.connections = 0
+        self.online = False
+
+
+class LivenessTable:
+    """
+    Tracks when every slave was last heard from. A slave goes offline when its
+    last connection closes or it stays silent for offline_after seconds, and
+    back online with its next message; listeners only see these transitions
+    """
+
+    SMOOTHING = 0.1
+
+    def __init__(self, offline_after=60):
+        self._offline_after = offline_after
+        self._lock = Lock()
+        self._slaves = {}
+        self._listeners = []
+
+    def add_listener(self, listener):
+        """
+        :param listener: called with the slave nickname and True if it came online, False if it went offline
+        """
+        self._listeners.append(listener)
+
+    def on_connect(self, slave_nickname):
+        with self._lock:
+            self._get(slave_nickname).connections += 1
+
+    def on_disconnect(self, slave_nickname):
+        with self._lock:
+            liveness = self._get(slave_nickname)
+            liveness.connections = max(liveness.connections - 1, 0)
+            went_offline = liveness.connections == 0 and liveness.online
+            if went_offline:
+                liveness.online = False
+        if went_offline:
+            self._notify(slave_nickname, False)
+
+    def on_message(self, slave_nickname, now=None):
+        now = time() if now is None else now
+        with self._lock:
+            liveness = self._get(slave_nickname)
+            if liveness.last_seen is not None and liveness.online:
+                interval = max(now - liveness.last_seen, 0)
+                if liveness.mean_interval is None:
+                    liveness.mean_interval = interval
+                else:
+                    liveness.mean_interval += self.SMOOTHING * (interval - liveness.mean_interval)
+            liveness.last_seen = now
+            liveness.messages += 1
+            came_online = not liveness.online
+            liveness.online = True
+        if came_online:
+            self._notify(slave_nickname, True)
+
+    def check(self, now=None):
+        """
+        Takes offline the slaves silent for too long
+
+        :return: their nicknames
+        """
+        now = time() if now is None else now
+        went_offline = []
+        with self._lock:
+            for slave_nickname, liveness in self._slaves.items():
+                if liveness.online and now - liveness.last_seen > self._offline_after:
+                    liveness.online = False
+                    went_offline.append(slave_nickname)
+        for slave_nickname in went_offline:
+            self._notify(slave_nickname, False)
+        return went_offline
+
+    def is_online(self, slave_nickname):
+        with self._lock:
+            liveness = self._slaves.get(slave_nickname)
+            return liveness is not None and liveness.online
+
+    def get_liveness(self, slave_nickname):
+        """
+        :return: dict with last_seen (timestamp), rate (messages per second), messages,
+                 connections and online; None for unknown slaves
+        """
+        with self._lock:
+            liveness = self._slaves.get(slave_nickname)
+            if liveness is None:
+                return None
+            return {"last_seen": liveness.last_seen,
+                    "rate": 1 / liveness.mean_interval if liveness.mean_interval else 0,
+                    "messages": liveness.messages,
+                    "connections": liveness.connections,
+                    "online": liveness.online}
+
+    def get_slaves(self):
+        with self._lock:
+            return list(self._slaves.keys())
+
+    def _get(self, slave_nickname):
+        liveness = self._slaves.get(slave_nickname)
+        if liveness is None:
+            liveness = self._slaves[slave_nickname] = _Liveness()
+        return liveness
+
+    def _notify(self, slave_nickname, online):
+        for listener in self._listeners:
+            listener(slave_nickname, online)
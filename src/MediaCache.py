@@ -0,0 +1,93 @@
+from collections import OrderedDict
+from hashlib import sha256
+from io import BytesIO
+from threading import Lock
+
+from loggingserver import LoggingServer
+from telegram.error import BadRequest
+
+from src.DBOperator import DBOperator
+
+FILE_ID_ERRORS = ("wrong file identifier", "wrong remote file identifier", "wrong file id", "file reference expired")
+
+
+class MediaCache:
+    """
+    Remembers the file_id Telegram assigns to an uploaded photo, keyed by the
+    SHA-256 of its content, so the same image is uploaded only once. Persistent
+    entries are kept in the media_files table, the others only in memory
+    """
+
+    def __init__(self, db_operator: DBOperator, cache_size=1024):
+        self._db_operator = db_operator
+        self._cache_size = cache_size
+        self._logger = LoggingServer.getInstance("overseer")
+
+        self._lock = Lock()
+        self._persistent = dict(db_operator.get_media_files())
+        self._transient = OrderedDict()
+
+        self._uploads = 0
+        self._reuses = 0
+
+    def send_photo(self, bot, chat_id, photo, persist=True, **kwargs):
+        """
+        Sends the photo by its file_id if it was uploaded before, uploads it otherwise.
+        A file_id Telegram no longer accepts is forgotten and the photo is uploaded again
+
+        :param photo: bytes
+        :param persist: False for short-lived images, their file_ids are not saved to the DB
+        :param kwargs: passed to bot.send_photo
+        :rtype: telegram.Message
+        """
+        content_hash = sha256(photo).hexdigest()
+        file_id = self._get(content_hash)
+
+        if file_id is not None:
+            try:
+                message = bot.send_photo(chat_id, file_id, **kwargs)
+                with self._lock:
+                    self._reuses += 1
+                return message
+            except BadRequest as e:
+                if not any(error in e.message.lower() for error in FILE_ID_ERRORS):
+                    raise  # not about the file, the entry is still valid
+                self._logger.warn("MediaCache: file %s was not accepted, uploading again: %s" % (file_id, e.message))
+                self._forget(content_hash)
+
+        message = bot.send_photo(chat_id, BytesIO(photo), **kwargs)
+        self._remember(content_hash, message.photo[-1].file_id, persist)  # the largest size
+        return message
+
+    def get_stats(self):
+        with self._lock:
+            return {"persistent": len(self._persistent), "transient": len(self._transient),
+                    "uploads": self._uploads, "reuses": self._reuses}
+
+    def _get(self, content_hash):
+        with self._lock:
+            file_id = self._persistent.get(content_hash)
+            if file_id is None:
+                file_id = self._transient.get(content_hash)
+                if file_id is not None:
+                    self._transient.move_to_end(content_hash)
+            return file_id
+
+    def _remember(self, content_hash, file_id, persist):
+        with self._lock:
+            self._uploads += 1
+            if persist:
+                self._persistent[content_hash] = file_id
+            else:
+                self._transient[content_hash] = file_id
+                while len(self._transient) > self._cache_size:
+                    self._transient.popitem(last=False)
+        if persist:
+            self._db_operator.save_media_file(content_hash, file_id)
+
+    def _forget(self, content_hash):
+        with self._lock:
+            self._transient.pop(content_hash, None)
+            persistent = self._persistent.pop(content_hash, None) is not None
+        if persistent:
+            self._db_operator.delete_media_file(content_hash)
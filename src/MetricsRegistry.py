@@ -0,0 +1,250 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from threading import Lock, Thread
+from time import perf_counter
+
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+
+class _Metric(ABC):
+
+    TYPE = None
+
+    def __init__(self, name, description, label_names=()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self._lock = Lock()
+
+    def render(self):
+        lines = ["# HELP %s %s" % (self.name, self.description), "# TYPE %s %s" % (self.name, self.TYPE)]
+        lines += self._render_samples()
+        return "\n".join(lines)
+
+    @abstractmethod
+    def _render_samples(self):
+        pass
+
+    def _format_labels(self, label_values, extra=()):
+        pairs = list(zip(self.label_names, label_values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{%s}" % ",".join('%s="%s"' % (name, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+                                 for name, value in pairs)
+
+
+class Counter(_Metric):
+
+    TYPE = "counter"
+
+    def __init__(self, name, description, label_names=()):
+        super().__init__(name, description, label_names)
+        self._values = {}
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def _render_samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        return ["%s%s %s" % (self.name, self._format_labels(label_values), repr(float(value)))
+                for label_values, value in values]
+
+
+class Gauge(Counter):
+    """
+    A value that goes up and down, or is read from a function at scrape time
+    """
+
+    TYPE = "gauge"
+
+    def __init__(self, name, description, label_names=()):
+        super().__init__(name, description, label_names)
+        self._functions = {}
+
+    def set(self, value, *label_values):
+        with self._lock:
+            self._values[label_values] = value
+
+    def dec(self, *label_values, amount=1):
+        self.inc(*label_values, amount=-amount)
+
+    def set_function(self, function, *label_values):
+        with self._lock:
+            self._functions[label_values] = function
+
+    def _render_samples(self):
+        with self._lock:
+            functions = list(self._functions.items())
+        for label_values, function in functions:
+            self.set(function(), *label_values)
+        return super()._render_samples()
+
+
+class Histogram(_Metric):
+
+    TYPE = "histogram"
+
+    def __init__(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, label_names)
+        self._buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self._buckets, value)
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self._buckets) + 2)
+            if index < len(self._buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, *label_values)
+
+    def get_count(self, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            return series[-1] if series is not None else 0
+
+    def _render_samples(self):
+        with self._lock:
+            series_items = [(label_values, list(series)) for label_values, series in self._series.items()]
+
+        lines = []
+        for label_values, series in series_items:
+            cumulative = 0
+            for bound, count in zip(self._buckets, series):
+                cumulative += count
+                lines.append("%s_bucket%s %d" % (self.name, self._format_labels(label_values, [("le", repr(bound))]),
+                                                 cumulative))
+            lines.append("%s_bucket%s %d" % (self.name, self._format_labels(label_values, [("le", "+Inf")]),
+                                             series[-1]))
+            lines.append("%s_sum%s %s" % (self.name, self._format_labels(label_values), repr(float(series[-2]))))
+            lines.append("%s_count%s %d" % (self.name, self._format_labels(label_values), series[-1]))
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Process-wide set of counters, gauges and histograms rendered in the
+    Prometheus text format. Metrics are created on first request by name
+    """
+
+    _instance = None
+    _instance_lock = Lock()
+
+    @classmethod
+    def get_instance(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = MetricsRegistry()
+            return cls._instance
+
+    def __init__(self):
+        self._lock = Lock()
+        self._metrics = {}
+
+    def counter(self, name, description, label_names=()):
+        """
+        :rtype: Counter
+        """
+        return self._get_or_create(Counter, name, description, label_names)
+
+    def gauge(self, name, description, label_names=()):
+        """
+        :rtype: Gauge
+        """
+        return self._get_or_create(Gauge, name, description, label_names)
+
+    def histogram(self, name, description, label_names=(), buckets=DEFAULT_BUCKETS):
+        """
+        :rtype: Histogram
+        """
+        return self._get_or_create(Histogram, name, description, label_names, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+    def _get_or_create(self, metric_type, name, description, label_names, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_type(name, description, label_names, **kwargs)
+            elif type(metric) is not metric_type or metric.label_names != tuple(label_names):
+                raise ValueError("Metric %s is already registered differently" % name)
+            return metric
+
+
+def timed(histogram: Histogram):
+    """
+    Decorator observing the duration of every call, labelled with the function name
+    """
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with histogram.time(function.__name__):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class MetricsServer:
+    """
+    Serves the registry on http://host:port/metrics
+    """
+
+    def __init__(self, registry: MetricsRegistry = None, host="127.0.0.1", port=9100):
+        self._registry = registry if registry is not None else MetricsRegistry.get_instance()
+        self._host = host
+        self._port = port
+        self._server = None
+
+    def launch(self):
+        registry = self._registry
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self._host, self._port), Handler)
+        self._server.daemon_threads = True
+        server = Thread(target=self._server.serve_forever)
+        server.setDaemon(True)
+        server.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def get_port(self):
+        return self._server.server_address[1]
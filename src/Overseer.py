@@ -1,10 +1,16 @@
 from collections import namedtuple
+from datetime import datetime, timedelta
+from functools import partial
 from telegram import *
 from telegram.ext import Updater, CommandHandler, CallbackQueryHandler, MessageHandler, Filters
 from loggingserver import LoggingServer
 
+from src.BatchWriter import BatchWriter
 from src.DBOperator import DBOperator
+from src.MediaCache import MediaCache
+from src.PlotService import PlotService
 from src.ResourceManager import ResourceManager
+from src.WebhookServer import WebhookServer
 
 from enum import Enum, auto
 
@@ -17,7 +23,7 @@ class SlaveRegistrationStages(Enum):
 def record_message(callback):
     def wrapper(*args):
         self, bot, update = args
-        self._db_operator.add_message(update.message)
+        self._audit_writer.put(DBOperator.make_message_row(update.message))
         callback(*args)
 
     return wrapper
@@ -25,22 +31,39 @@ def record_message(callback):
 
 class Overseer:
 
-    def __init__(self, broadcaster, db_operator: DBOperator):
+    MAX_MESSAGE_LENGTH = 4096
+    HELP_FILE = "resources/command_summary.html"
+    SCHEME_FILE = "scheme.PNG"
+
+    WINDOW_UNITS = {"m": 60, "h": 3600, "d": 24 * 3600}
+
+    def __init__(self, broadcaster, db_operator: DBOperator, plot_service: PlotService = None,
+                 media_cache: MediaCache = None, webhook_server: WebhookServer = None):
         """
 
         :type broadcaster: src.Broadcaster.Broadcaster
+        :param plot_service: PlotService over db_operator by default
+        :param media_cache: MediaCache over db_operator by default, all photos are sent through it
+        :param webhook_server: receives the updates over the updater's dispatcher, the updater polls if None
         """
         self._broadcaster = broadcaster
         self._db_operator = db_operator
+        self._plot_service = plot_service if plot_service is not None else PlotService(db_operator)
+        self._media_cache = media_cache if media_cache is not None else MediaCache(db_operator)
         self._updater = broadcaster.get_telegram_updater()
+        self._webhook_server = webhook_server
+        self._audit_writer = BatchWriter(db_operator.add_message_rows, name="AuditWriter")
 
         self._resource_manager = ResourceManager()
+        self._resource_manager.preload(text_files=[self.HELP_FILE], binary_files=[self.SCHEME_FILE])
         self._logger = LoggingServer.getInstance("overseer")
 
         self._updater.dispatcher.add_handler(CommandHandler('start', self.on_start))
         self._updater.dispatcher.add_handler(CommandHandler('help', self.on_help))
         self._updater.dispatcher.add_handler(CommandHandler('scheme', self.on_scheme))
         self._updater.dispatcher.add_handler(CommandHandler('checkout', self.on_checkout))
+        self._updater.dispatcher.add_handler(CommandHandler('history', self.on_history))
+        self._updater.dispatcher.add_handler(CommandHandler('plot', self.on_plot))
         self._updater.dispatcher.add_handler(CommandHandler('subscribe', self.on_subscribe))
         self._updater.dispatcher.add_handler(CommandHandler('unsubscribe', self.on_unsubscribe))
         self._updater.dispatcher.add_handler(CommandHandler('register_slave', self.on_register_slave))
@@ -56,12 +79,20 @@ class Overseer:
                                               SlaveRegistrationStages.SLAVE_PASS: self._register_slave_password}
 
     def launch(self):
-        self._updater.start_polling()
+        self._audit_writer.launch()
+        if self._webhook_server is not None:
+            self._webhook_server.launch()
+        else:
+            self._updater.start_polling()
         self._broadcaster.launch()
 
     def stop(self):
         self._broadcaster.stop()
+        if self._webhook_server is not None:
+            self._webhook_server.stop()
         self._updater.stop()
+        self._audit_writer.stop()
+        self._plot_service.stop()
 
     def stop_broadcaster(self):
         self._broadcaster.stop()
@@ -76,14 +107,13 @@ class Overseer:
     def on_help(self, bot, update):
         self._log_user_action("/help", update.message.from_user)
 
-        with open("resources/command_summary.html", "r") as f:
-            update.message.reply_text(f.read(), parse_mode="HTML")
+        update.message.reply_text(self._resource_manager.get_text(self.HELP_FILE), parse_mode="HTML")
 
     @record_message
     def on_scheme(self, bot, update):
         reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("OK", callback_data="OK")]])
-        with open("scheme.PNG", 'rb') as f:
-            self._updater.bot.send_photo(update.message.chat_id, f, reply_markup=reply_markup)
+        self._media_cache.send_photo(self._updater.bot, update.message.chat_id,
+                                     self._resource_manager.get_bytes(self.SCHEME_FILE), reply_markup=reply_markup)
 
     @record_message
     def on_subscribe(self, bot, update):
@@ -112,6 +142,7 @@ class Overseer:
                                                     .get_string("fetching_updates") % slave_nickname).message_id
 
         self._db_operator.subscribe(user_telegram_id, slave_nickname, info_message_id)
+        self._broadcaster.request_update(slave_nickname)
 
     @record_message
     def on_checkout(self, bot, update):
@@ -126,6 +157,89 @@ class Overseer:
         update.message.reply_text(self._broadcaster.get_update_server().get_latest_state(slave_nickname),
                                   parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
 
+    @record_message
+    def on_history(self, bot, update):
+        self._log_user_action("/history", update.message.from_user)
+
+        try:
+            slave_nickname, minutes = update.message.text[9:].split(" ")
+            if not float(minutes) > 0:
+                raise ValueError("The number of minutes %s is not positive" % minutes)
+            since = datetime.now() - timedelta(minutes=float(minutes))
+        except (ValueError, OverflowError):  # too many minutes overflow the timedelta or the date
+            update.message.reply_text(self._resource_manager.get_string("history_usage"))
+            return
+
+        states = self._broadcaster.get_update_server().get_history().get_range(slave_nickname, since)
+        if not states:
+            update.message.reply_text(self._resource_manager.get_string("no_history") % (slave_nickname, minutes))
+            return
+
+        messages = []
+        length = -2
+        for state in reversed(states):
+            message = state.get_state_message()
+            length += len(message) + 2
+            if length > self.MAX_MESSAGE_LENGTH:
+                break
+            messages.insert(0, message)
+        if not messages:
+            messages.append(self._fit_lines(states[-1].get_state_message()))
+
+        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("OK", callback_data="OK")]])
+        update.message.reply_text("\n\n".join(messages), parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+
+    @classmethod
+    def _fit_lines(cls, message):
+        """
+        Drops whole lines after the header until the message fits, so no Markdown entity is cut
+        """
+        header, *lines = message.split("\n")
+        length = len(message)
+        while lines and length > cls.MAX_MESSAGE_LENGTH:
+            length -= len(lines.pop(0)) + 1
+        return "\n".join([header] + lines)
+
+    @record_message
+    def on_plot(self, bot, update):
+        self._log_user_action("/plot", update.message.from_user)
+
+        try:
+            slave_nickname, metric, window = update.message.text[6:].split(" ")
+            seconds = self._parse_window(window)
+        except ValueError:
+            update.message.reply_text(self._resource_manager.get_string("plot_usage"))
+            return
+
+        plot = self._plot_service.submit(slave_nickname, metric, seconds)
+        plot.add_done_callback(partial(self._send_plot, update.message.chat_id, slave_nickname, metric, window))
+
+    def _send_plot(self, chat_id, slave_nickname, metric, window, plot):
+        error = plot.exception()
+        if error is not None:
+            self._logger.debug("No plot of %s of %s: %s" % (metric, slave_nickname, str(error)))
+            self._updater.bot.send_message(chat_id, self._resource_manager.get_string("no_plot")
+                                           % (metric, slave_nickname, window))
+            return
+
+        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("OK", callback_data="OK")]])
+        self._media_cache.send_photo(self._updater.bot, chat_id, plot.result(), persist=False,
+                                     caption="%s - %s, %s" % (slave_nickname, metric, window),
+                                     reply_markup=reply_markup)
+
+    @classmethod
+    def _parse_window(cls, window):
+        """
+        :param window: minutes, or a number with an m, h or d suffix
+        :return: seconds
+        :raises ValueError: if it is not a positive duration
+        """
+        unit = cls.WINDOW_UNITS.get(window[-1:])
+        seconds = float(window[:-1]) * unit if unit is not None else float(window) * 60
+        if not seconds > 0:
+            raise ValueError("Window %s is not positive" % window)
+        return seconds
+
     @record_message
     def on_unsubscribe(self, bot, update):
         self._log_user_action("/unsubscribe", update.message.from_user)
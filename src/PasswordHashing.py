@@ -0,0 +1,55 @@
+import hashlib
+import hmac
+import os
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from hashlib import md5
+
+MD5 = "md5"
+SCRYPT = "scrypt"
+
+SCRYPT_PREFIX = "scrypt1$"
+SCRYPT_PARAMETERS = {"n": 2 ** 14, "r": 8, "p": 1, "dklen": 16}
+SALT_SIZE = 16
+
+
+def hash_password(password, scheme=MD5):
+    """
+    Both schemes fit the 60 chars of slaves.slave_password: scrypt hashes are
+    stored as "scrypt1$<salt>$<hash>" in unpadded base64
+    """
+    if scheme == MD5:
+        return md5(password.encode()).hexdigest()
+    if scheme == SCRYPT:
+        salt = os.urandom(SALT_SIZE)
+        return SCRYPT_PREFIX + _encode(salt) + "$" + _encode(_scrypt(password, salt))
+    raise ValueError("Unknown password scheme %s" % scheme)
+
+
+def verify_password(password, stored_hash):
+    if not isinstance(stored_hash, str):
+        return False
+
+    if is_slow_hash(stored_hash):
+        try:
+            salt, expected = stored_hash[len(SCRYPT_PREFIX):].split("$")
+            return hmac.compare_digest(_scrypt(password, _decode(salt)), _decode(expected))
+        except ValueError:
+            return False
+
+    return hmac.compare_digest(md5(password.encode()).hexdigest(), stored_hash)
+
+
+def is_slow_hash(stored_hash):
+    return stored_hash.startswith(SCRYPT_PREFIX)
+
+
+def _scrypt(password, salt):
+    return hashlib.scrypt(password.encode(), salt=salt, **SCRYPT_PARAMETERS)
+
+
+def _encode(data):
+    return urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _decode(text):
+    return urlsafe_b64decode(text + "=" * (-len(text) % 4))
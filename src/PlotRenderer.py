@@ -0,0 +1,126 @@
+import struct
+import zlib
+from time import localtime, strftime
+
+import numpy as np
+
+BACKGROUND = (255, 255, 255)
+GRID = (225, 225, 225)
+AXIS = (80, 80, 80)
+BAND = (190, 210, 240)
+LINE = (30, 90, 200)
+TEXT = (60, 60, 60)
+
+MARGIN_LEFT, MARGIN_RIGHT, MARGIN_TOP, MARGIN_BOTTOM = 80, 20, 15, 30
+GRID_LINES = 5
+FONT_SCALE = 2
+
+_FONT = {"0": ("111", "101", "101", "101", "111"), "1": ("010", "110", "010", "010", "111"),
+         "2": ("111", "001", "111", "100", "111"), "3": ("111", "001", "111", "001", "111"),
+         "4": ("101", "101", "111", "001", "001"), "5": ("111", "100", "111", "001", "111"),
+         "6": ("111", "100", "111", "101", "111"), "7": ("111", "001", "001", "001", "001"),
+         "8": ("111", "101", "111", "101", "111"), "9": ("111", "101", "111", "001", "111"),
+         "-": ("000", "000", "111", "000", "000"), "+": ("000", "010", "111", "010", "000"),
+         ".": ("000", "000", "000", "000", "010"), ":": ("000", "010", "000", "010", "000"),
+         "e": ("000", "111", "111", "100", "011"), " ": ("000", "000", "000", "000", "000")}
+GLYPHS = {char: np.kron(np.array([[pixel == "1" for pixel in row] for row in rows]),
+                        np.ones((FONT_SCALE, FONT_SCALE), dtype=bool)).astype(bool)
+          for char, rows in _FONT.items()}
+GLYPH_HEIGHT, GLYPH_WIDTH = GLYPHS["0"].shape
+
+
+def render_plot(timestamps, minimums, maximums, means, start=None, end=None, width=800, height=400):
+    """
+    Draws the min-max band and the mean line of a metric over time, without per-point Python loops
+
+    :param timestamps: seconds, ascending
+    :param start: seconds, the left edge, the first timestamp by default
+    :param end: seconds, the right edge, the last timestamp by default
+    :return: PNG bytes
+    """
+    timestamps = np.asarray(timestamps, dtype=float)
+    minimums = np.asarray(minimums, dtype=float)
+    maximums = np.asarray(maximums, dtype=float)
+    means = np.asarray(means, dtype=float)
+    if len(timestamps) == 0:
+        raise ValueError("Nothing to plot")
+
+    canvas = np.empty((height, width, 3), dtype=np.uint8)
+    canvas[:] = BACKGROUND
+    plot_width = width - MARGIN_LEFT - MARGIN_RIGHT
+    plot_height = height - MARGIN_TOP - MARGIN_BOTTOM
+    plot = canvas[MARGIN_TOP:MARGIN_TOP + plot_height, MARGIN_LEFT:MARGIN_LEFT + plot_width]
+
+    start = timestamps[0] if start is None else start
+    end = max(timestamps[-1] if end is None else end, start + 1)
+    low, high = minimums.min(), maximums.max()
+    padding = (high - low) * .05 if high > low else max(abs(high) * .05, 1)
+    low, high = low - padding, high + padding
+
+    def to_row(values):
+        return np.clip(np.round((high - values) / (high - low) * (plot_height - 1)), 0, plot_height - 1).astype(int)
+
+    grid_rows = np.linspace(0, plot_height - 1, GRID_LINES).round().astype(int)
+    plot[grid_rows, :] = GRID
+
+    # every pixel column covers [column_times[i], column_times[i + 1]), samples falling into it widen the band
+    column_times = start + (end - start) * np.arange(plot_width + 1) / plot_width
+    inside = (column_times[:-1] >= timestamps[0]) & (column_times[:-1] <= timestamps[-1])
+    band_top = to_row(np.interp(column_times[:-1], timestamps, maximums))
+    band_bottom = to_row(np.interp(column_times[:-1], timestamps, minimums))
+    sample_columns = np.clip(np.searchsorted(column_times, timestamps, side="right") - 1, 0, plot_width - 1)
+    np.minimum.at(band_top, sample_columns, to_row(maximums))
+    np.maximum.at(band_bottom, sample_columns, to_row(minimums))
+    inside[sample_columns] = True
+
+    rows = np.arange(plot_height)[:, None]
+    plot[(rows >= band_top) & (rows <= band_bottom) & inside] = BAND
+
+    # the mean line joins the neighbouring columns with vertical runs, one pixel thicker
+    line = to_row(np.interp(column_times[:-1], timestamps, means))
+    following = np.append(line[1:], line[-1])
+    line_top = np.minimum(line, following) - 1
+    line_bottom = np.maximum(line, following) + 1
+    plot[(rows >= line_top) & (rows <= line_bottom) & inside] = LINE
+
+    canvas[MARGIN_TOP:MARGIN_TOP + plot_height, MARGIN_LEFT - 1] = AXIS
+    canvas[MARGIN_TOP + plot_height, MARGIN_LEFT - 1:MARGIN_LEFT + plot_width] = AXIS
+
+    for row, value in zip(grid_rows, np.linspace(high, low, GRID_LINES)):
+        label = "%.4g" % value
+        _draw_text(canvas, label, MARGIN_LEFT - 6 - len(label) * (GLYPH_WIDTH + FONT_SCALE),
+                   MARGIN_TOP + row - GLYPH_HEIGHT // 2)
+    label_row = MARGIN_TOP + plot_height + 8
+    _draw_text(canvas, strftime("%m-%d %H:%M", localtime(start)), MARGIN_LEFT, label_row)
+    end_label = strftime("%m-%d %H:%M", localtime(end))
+    _draw_text(canvas, end_label, width - MARGIN_RIGHT - len(end_label) * (GLYPH_WIDTH + FONT_SCALE), label_row)
+
+    return encode_png(canvas)
+
+
+def _draw_text(canvas, text, x, y):
+    for char in text:
+        if x >= 0:  # characters left of the canvas are dropped
+            glyph = GLYPHS.get(char, GLYPHS[" "])
+            region = canvas[y:y + GLYPH_HEIGHT, x:x + GLYPH_WIDTH]
+            region[glyph[:region.shape[0], :region.shape[1]]] = TEXT
+        x += GLYPH_WIDTH + FONT_SCALE
+
+
+def encode_png(canvas):
+    """
+    :param canvas: uint8 array of shape (height, width, 3)
+    :return: PNG bytes, RGB without filtering
+    """
+    height, width, _ = canvas.shape
+    scanlines = np.zeros((height, width * 3 + 1), dtype=np.uint8)  # filter type 0 in front of every row
+    scanlines[:, 1:] = canvas.reshape(height, -1)
+
+    return b"".join([b"\x89PNG\r\n\x1a\n",
+                     _make_chunk(b"IHDR", struct.pack("!IIBBBBB", width, height, 8, 2, 0, 0, 0)),
+                     _make_chunk(b"IDAT", zlib.compress(scanlines.tobytes(), 6)),
+                     _make_chunk(b"IEND", b"")])
+
+
+def _make_chunk(kind, data):
+    return struct.pack("!I", len(data)) + kind + data + struct.pack("!I", zlib.crc32(kind + data))
@@ -0,0 +1,89 @@
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from threading import Lock
+from time import time
+
+import numpy as np
+
+from src.DBOperator import DBOperator
+from src.PlotRenderer import render_plot
+
+
+class PlotService:
+    """
+    Renders metric plots from the stored history: the series is read in a thread
+    pool and drawn in a worker process. Plots are cached per slave, metric, window
+    and refresh bucket, so concurrent and repeated requests share one render.
+    A bucket lasts as long as one point of the plot, at least min_refresh seconds
+    """
+
+    POINTS = 400
+
+    def __init__(self, db_operator: DBOperator, cache_size=256, min_refresh=10, workers=1, fetchers=4):
+        self._db_operator = db_operator
+        self._cache_size = cache_size
+        self._min_refresh = min_refresh
+        self._fetcher = ThreadPoolExecutor(max_workers=fetchers)
+        self._renderer = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"))
+
+        self._lock = Lock()
+        self._plots = OrderedDict()
+
+        self._hits = 0
+        self._misses = 0
+
+    def submit(self, slave_nickname, metric, window):
+        """
+        :param window: seconds of history to plot, up to now
+        :return: future of the PNG bytes, failing with ValueError if there are no samples;
+                 failed futures are dropped from the cache
+        :rtype: concurrent.futures.Future
+        """
+        now = time()
+        resolution = window / self.POINTS
+        key = slave_nickname, metric, window, int(now // max(resolution, self._min_refresh))
+
+        with self._lock:
+            plot = self._plots.get(key)
+            if plot is not None:
+                self._plots.move_to_end(key)
+                self._hits += 1
+                return plot
+
+            self._misses += 1
+            plot = self._plots[key] = self._fetcher.submit(self._render, slave_nickname, metric, now - window, now,
+                                                           resolution)
+            while len(self._plots) > self._cache_size:
+                self._plots.popitem(last=False)
+        plot.add_done_callback(partial(self._forget_failed, key))
+        return plot
+
+    def stop(self):
+        self._fetcher.shutdown()
+        self._renderer.shutdown()
+
+    def get_stats(self):
+        with self._lock:
+            return {"cached": len(self._plots), "hits": self._hits, "misses": self._misses}
+
+    def _forget_failed(self, key, plot):
+        """
+        Failures are not cached, the next request tries again
+        """
+        if plot.cancelled() or plot.exception() is not None:
+            with self._lock:
+                if self._plots.get(key) is plot:
+                    del self._plots[key]
+
+    def _render(self, slave_nickname, metric, since, until, resolution):
+        points = self._db_operator.get_metric_series(slave_nickname, metric, datetime.fromtimestamp(since),
+                                                     datetime.fromtimestamp(until), resolution)
+        if not points:
+            raise ValueError("No %s samples of %s in this window" % (metric, slave_nickname))
+
+        timestamps = np.array([point.at.timestamp() for point in points])
+        minimums, maximums, means = np.array([point[1:] for point in points]).T
+        return self._renderer.submit(render_plot, timestamps, minimums, maximums, means, since, until).result()
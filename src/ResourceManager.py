@@ -1,16 +1,81 @@
 import json
+import os
+from threading import Lock
+from time import time
 
 
 class ResourceManager:
+    """
+    Resource files are parsed once per process and re-read only when their
+    modification time changes (checked at most every check_interval seconds)
+    """
 
-    def __init__(self, strings_file="resources/strings.json", numbers_file="resources/numbers.json"):
+    _cache = {}
+    _cache_lock = Lock()
+
+    def __init__(self, strings_file="resources/strings.json", numbers_file="resources/numbers.json",
+                 check_interval=1):
         self._strings_file = strings_file
         self._numbers_file = numbers_file
+        self._check_interval = check_interval
 
     def get_string(self, string_id):
-        with open(self._strings_file, "r") as f:
-            return json.load(f)[string_id]
+        return self._get(self._strings_file, "json")[string_id]
 
     def get_number(self, number_id):
-        with open(self._numbers_file, "r") as f:
-            return json.load(f)[number_id]
+        return self._get(self._numbers_file, "json")[number_id]
+
+    def get_text(self, path):
+        return self._get(path, "text")
+
+    def get_bytes(self, path):
+        return self._get(path, "bytes")
+
+    def preload(self, text_files=(), binary_files=()):
+        """
+        Reads the files into the cache ahead of time, missing files are skipped
+
+        :return: the paths that were loaded
+        """
+        loaded = []
+        for path, kind in [(path, "text") for path in text_files] + [(path, "bytes") for path in binary_files]:
+            try:
+                self._get(path, kind)
+                loaded.append(path)
+            except FileNotFoundError:
+                pass
+        return loaded
+
+    @classmethod
+    def reload(cls):
+        with cls._cache_lock:
+            cls._cache.clear()
+
+    def _get(self, path, kind):
+        key = (path, kind)
+        now = time()
+
+        entry = self._cache.get(key)
+        if entry is not None and now - entry[2] < self._check_interval:
+            return entry[0]
+
+        mtime = os.stat(path).st_mtime_ns
+        if entry is not None and entry[1] == mtime:
+            entry[2] = now
+            return entry[0]
+
+        with self._cache_lock:
+            data = self._read(path, kind)
+            self._cache[key] = [data, mtime, now]
+        return data
+
+    @staticmethod
+    def _read(path, kind):
+        if kind == "bytes":
+            with open(path, "rb") as f:
+                return f.read()
+
+        with open(path, "r") as f:
+            if kind == "json":
+                return json.load(f)
+            return f.read()
@@ -0,0 +1,353 @@
+from concurrent.futures import ThreadPoolExecutor, Future
+from enum import IntEnum
+from functools import partial
+from heapq import heappush, heappop
+from itertools import count
+from threading import Thread, Condition
+from time import time
+
+from telegram.error import BadRequest, TimedOut, NetworkError, RetryAfter
+
+from loggingserver import LoggingServer
+
+from src.MetricsRegistry import MetricsRegistry
+
+TELEGRAM_CALL_SECONDS = MetricsRegistry.get_instance().histogram("overseer_telegram_call_seconds",
+                                                                 "Duration of Telegram API calls")
+TELEGRAM_ERRORS = MetricsRegistry.get_instance().counter("overseer_telegram_errors_total",
+                                                         "Failed Telegram API calls by error class", ["error"])
+SEND_QUEUE = MetricsRegistry.get_instance().gauge("overseer_send_queue", "Telegram calls waiting to be sent")
+
+
+class SendPriority(IntEnum):
+    ALERT = 0
+    STATE = 1
+
+
+class ChatState(IntEnum):
+    IDLE = 0
+    READY = 1
+    WAITING = 2
+
+
+class TokenBucket:
+
+    def __init__(self, rate, capacity):
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time()
+
+    def get_delay(self, now):
+        """
+        :return: seconds until a token is available
+        """
+        self._refill(now)
+        return 0 if self._tokens >= 1 else (1 - self._tokens) / self._rate
+
+    def take(self, now):
+        self._refill(now)
+        self._tokens -= 1
+
+    def is_full(self, now):
+        self._refill(now)
+        return self._tokens >= self._capacity
+
+    def _refill(self, now):
+        self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+        self._updated_at = now
+
+
+class _Job:
+
+    def __init__(self, chat_id, function, priority, key, seq):
+        self.chat_id = chat_id
+        self.function = function
+        self.priority = priority
+        self.key = key
+        self.seq = seq
+        self.enqueued_at = time()
+        self.retries = 0
+        self.future = Future()
+
+
+class _Chat:
+
+    def __init__(self, bucket):
+        self.queue = []
+        self.bucket = bucket
+        self.blocked_until = 0
+        self.state = ChatState.IDLE
+
+
+class SendScheduler:
+    """
+    Sends Telegram requests within the global and per-chat rate limits of the Bot API.
+
+    Alerts go before routine state edits, a request rejected with RetryAfter is
+    put back and retried once the flood wait is over, and a request submitted
+    with the key of a still pending one replaces it
+    """
+
+    def __init__(self, workers=8, global_rate=30, global_burst=30, chat_rate=1, chat_burst=3,
+                 max_retries=5):
+        self._logger = LoggingServer.getInstance("overseer")
+        self._workers = workers
+        self._global_bucket = TokenBucket(global_rate, global_burst)
+        self._global_blocked_until = 0
+        self._chat_rate = chat_rate
+        self._chat_burst = chat_burst
+        self._max_retries = max_retries
+
+        self._condition = Condition()
+        self._chats = {}
+        self._ready_chats = []
+        self._waiting_chats = []
+        self._pending_keys = {}
+        self._seq = count()
+        self._prune_interval = 60
+        self._pruned_at = time()
+
+        self._stop = False
+        self._dispatcher = None
+        self._executor = None
+
+        self._queued_count = 0
+        self._in_flight_count = 0
+        self._sent_count = 0
+        self._failed_count = 0
+        self._retried_count = 0
+        self._coalesced_count = 0
+        self._total_latency = 0
+        self._max_latency = 0
+
+    def launch(self):
+        if self._dispatcher is not None:
+            raise ValueError("Already running!")
+
+        self._stop = False
+        self._executor = ThreadPoolExecutor(max_workers=self._workers)
+        self._dispatcher = Thread(target=self._dispatch)
+        self._dispatcher.setDaemon(True)
+        self._dispatcher.start()
+        SEND_QUEUE.set_function(lambda: self.get_stats()["queued"])
+
+    def stop(self):
+        with self._condition:
+            self._stop = True
+            self._condition.notify_all()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+            self._dispatcher = None
+            self._executor.shutdown(wait=False)
+
+    def submit(self, chat_id, function, priority=SendPriority.STATE, key=None, on_done=None):
+        """
+        :param function: makes the request, called without arguments from a worker thread
+        :param key: a pending request with the same key is replaced by this one
+        :param on_done: called with the Future once the request completes, only once
+                        for all the requests coalesced into one
+        :return: a Future of the function result
+        """
+        with self._condition:
+            if key is not None and key in self._pending_keys:
+                job = self._pending_keys[key]
+                job.function = function
+                self._coalesced_count += 1
+                return job.future
+
+            job = _Job(chat_id, function, priority, key, next(self._seq))
+            if on_done is not None:
+                job.future.add_done_callback(on_done)
+            if key is not None:
+                self._pending_keys[key] = job
+            self._queued_count += 1
+
+            chat = self._get_chat(chat_id)
+            heappush(chat.queue, (job.priority, job.seq, job))
+            if chat.state is ChatState.IDLE:
+                self._schedule_chat(chat_id, time())
+            elif chat.state is ChatState.READY and chat.queue[0][2] is job:
+                heappush(self._ready_chats, (job.priority, job.seq, chat_id))
+
+            self._condition.notify()
+            return job.future
+
+    def wait_idle(self, timeout=None):
+        """
+        :return: True if every submitted request was completed within the timeout
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._queued_count == 0 and self._in_flight_count == 0,
+                                            timeout)
+
+    def get_stats(self):
+        with self._condition:
+            completed = self._sent_count + self._failed_count
+            return {"queued": self._queued_count,
+                    "in_flight": self._in_flight_count,
+                    "sent": self._sent_count,
+                    "failed": self._failed_count,
+                    "retried": self._retried_count,
+                    "coalesced": self._coalesced_count,
+                    "mean_latency": self._total_latency / completed if completed else 0,
+                    "max_latency": self._max_latency}
+
+    def _get_chat(self, chat_id):
+        try:
+            return self._chats[chat_id]
+        except KeyError:
+            chat = _Chat(TokenBucket(self._chat_rate, self._chat_burst))
+            self._chats[chat_id] = chat
+            return chat
+
+    def _schedule_chat(self, chat_id, now):
+        chat = self._chats[chat_id]
+        if not chat.queue:
+            chat.state = ChatState.IDLE
+            return
+
+        delay = max(chat.bucket.get_delay(now), chat.blocked_until - now)
+        if delay > 0:
+            chat.state = ChatState.WAITING
+            heappush(self._waiting_chats, (now + delay, chat_id))
+        else:
+            chat.state = ChatState.READY
+            priority, seq, _ = chat.queue[0]
+            heappush(self._ready_chats, (priority, seq, chat_id))
+
+    def _wake_waiting_chats(self, now):
+        while self._waiting_chats and self._waiting_chats[0][0] <= now:
+            _, chat_id = heappop(self._waiting_chats)
+            chat = self._chats.get(chat_id)
+            if chat is not None and chat.state is ChatState.WAITING:
+                self._schedule_chat(chat_id, now)
+
+    def _pop_ready_chat(self, now):
+        while self._ready_chats:
+            priority, seq, chat_id = heappop(self._ready_chats)
+            chat = self._chats.get(chat_id)
+            if chat is None or chat.state is not ChatState.READY or not chat.queue or \
+                    chat.queue[0][:2] != (priority, seq):
+                continue  # outdated entry
+            if chat.blocked_until > now:
+                self._schedule_chat(chat_id, now)
+                continue
+            return chat_id
+        return None
+
+    def _next_wake_up(self, now):
+        if self._waiting_chats:
+            return max(self._waiting_chats[0][0] - now, 0)
+        return 1
+
+    def _dispatch(self):
+        with self._condition:
+            while not self._stop:
+                now = time()
+                self._wake_waiting_chats(now)
+                self._prune_chats(now)
+
+                global_delay = max(self._global_bucket.get_delay(now), self._global_blocked_until - now)
+                if global_delay > 0:
+                    self._condition.wait(global_delay)
+                    continue
+
+                chat_id = self._pop_ready_chat(now)
+                if chat_id is None:
+                    self._condition.wait(self._next_wake_up(now))
+                    continue
+
+                chat = self._chats[chat_id]
+                _, _, job = heappop(chat.queue)
+                if job.key is not None:
+                    del self._pending_keys[job.key]
+                self._queued_count -= 1
+                self._in_flight_count += 1
+
+                self._global_bucket.take(now)
+                chat.bucket.take(now)
+                self._schedule_chat(chat_id, now)
+
+                self._executor.submit(self._execute, job)
+
+    def _prune_chats(self, now):
+        if now - self._pruned_at < self._prune_interval:
+            return
+
+        self._pruned_at = now
+        for chat_id in [chat_id for chat_id, chat in self._chats.items()
+                        if chat.state is ChatState.IDLE and chat.blocked_until < now and chat.bucket.is_full(now)]:
+            del self._chats[chat_id]
+
+    def _execute(self, job):
+        try:
+            with TELEGRAM_CALL_SECONDS.time():
+                result = job.function()
+        except Exception as e:
+            TELEGRAM_ERRORS.inc(type(e).__name__)
+            self._handle_error(job, e)
+        else:
+            self._complete(job, result=result)
+
+    def _handle_error(self, job, error):
+        if isinstance(error, RetryAfter):
+            self._logger.warn("SendScheduler: flood control, retrying in %d s" % error.retry_after)
+            self._requeue(job, error.retry_after, pause_all=True)
+        elif isinstance(error, (TimedOut, NetworkError)) and not isinstance(error, BadRequest) \
+                and job.retries < self._max_retries:
+            self._requeue(job, 2 ** job.retries)
+        else:
+            self._complete(job, exception=error)
+
+    def _requeue(self, job, delay, pause_all=False):
+        with self._condition:
+            now = time()
+            job.retries += 1
+            self._retried_count += 1
+            self._in_flight_count -= 1
+
+            if job.key is not None and job.key in self._pending_keys:
+                self._pending_keys[job.key].future.add_done_callback(partial(self._copy_outcome, job.future))
+                self._condition.notify_all()
+                return  # a newer request for the same key is already waiting
+
+            if job.key is not None:
+                self._pending_keys[job.key] = job
+            self._queued_count += 1
+
+            chat = self._get_chat(job.chat_id)
+            chat.blocked_until = max(chat.blocked_until, now + delay)
+            if pause_all:
+                self._global_blocked_until = max(self._global_blocked_until, now + delay)
+
+            heappush(chat.queue, (job.priority, job.seq, job))
+            if chat.state is ChatState.IDLE:
+                self._schedule_chat(job.chat_id, now)
+            elif chat.state is ChatState.READY and chat.queue[0][2] is job:
+                heappush(self._ready_chats, (job.priority, job.seq, job.chat_id))
+            self._condition.notify_all()
+
+    @staticmethod
+    def _copy_outcome(future, done_future):
+        if done_future.exception() is not None:
+            future.set_exception(done_future.exception())
+        else:
+            future.set_result(done_future.result())
+
+    def _complete(self, job, result=None, exception=None):
+        latency = time() - job.enqueued_at
+        if exception is None:  # the callbacks run before wait_idle() sees the job done
+            job.future.set_result(result)
+        else:
+            job.future.set_exception(exception)
+
+        with self._condition:
+            self._in_flight_count -= 1
+            self._total_latency += latency
+            self._max_latency = max(self._max_latency, latency)
+            if exception is None:
+                self._sent_count += 1
+            else:
+                self._failed_count += 1
+            self._condition.notify_all()
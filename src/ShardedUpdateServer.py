@@ -0,0 +1,231 @@
+import multiprocessing
+import os
+import socket
+from concurrent.futures import Future
+from functools import partial
+from itertools import count
+from threading import Thread, Lock
+
+from src.AsyncUpdateServer import AsyncUpdateServer
+from src.DBOperator import DBOperator
+from src.UpdateServer import UpdateServer
+
+STATE = "state"
+TOUCH = "touch"
+AUTHENTICATE = "authenticate"
+BATCH = "batch"
+CONNECTED = "connected"
+DISCONNECTED = "disconnected"
+
+
+class _RemoteAuthenticator:
+    """
+    Takes the place of SlaveAuthenticator in a worker process, the credentials
+    are checked by the main process
+    """
+
+    def __init__(self, worker_id, requests, replies, on_stop):
+        self._worker_id = worker_id
+        self._requests = requests
+        self._replies = replies
+        self._on_stop = on_stop
+        self._lock = Lock()
+        self._futures = {}
+        self._request_ids = count()
+
+        receiver = Thread(target=self._receive)
+        receiver.setDaemon(True)
+        receiver.start()
+
+    def submit(self, nickname, password):
+        future = Future()
+        with self._lock:
+            request_id = next(self._request_ids)
+            self._futures[request_id] = future
+        self._requests.put((AUTHENTICATE, self._worker_id, request_id, nickname, password))
+        return future
+
+    def _receive(self):
+        while True:
+            reply = self._replies.get()
+            if reply is None:
+                self._on_stop()
+                return
+
+            request_id, authenticated, error = reply
+            with self._lock:
+                future = self._futures.pop(request_id)
+            if error is None:
+                future.set_result(authenticated)
+            else:
+                future.set_exception(ValueError(error))
+
+
+class _ShardWorker(AsyncUpdateServer):
+    """
+    Serves the connections one worker process accepted and forwards the new
+    states, already parsed, to the main process
+    """
+
+    def __init__(self, worker_id, sock, tls_context, requests, replies, max_connections, handshake_timeout,
+                 read_timeout):
+        authenticator = _RemoteAuthenticator(worker_id, requests, replies, self.stop)
+        super().__init__(tls_context, None, max_connections=max_connections,
+                         handshake_timeout=handshake_timeout, authenticator=authenticator, sock=sock)
+        self._read_timeout = read_timeout
+        self._requests = requests
+        self._outbox = []
+
+    def _on_slave_connected(self, slave_nickname):
+        self._send((CONNECTED, slave_nickname))
+
+    def _on_slave_disconnected(self, slave_nickname):
+        self._heartbeat_interval_counters.pop(slave_nickname, None)
+        # the main process makes the state stale, the same payload after a reconnect has to be published again
+        self._latest_states.pop(slave_nickname, None)
+        self._send((DISCONNECTED, slave_nickname))
+
+    def _touch_state(self, slave_nickname):
+        self._send((TOUCH, slave_nickname))
+
+    def _publish_state(self, state):
+        self._latest_states[state.get_slave_nickname()] = state
+        state.get_metrics()  # parse here and not in the main process
+        self._send((STATE, state))
+
+    def _send(self, message):
+        """
+        Messages produced within one event loop iteration are sent together
+        """
+        if not self._outbox:
+            self._loop.call_soon(self._flush_outbox)
+        self._outbox.append(message)
+
+    def _flush_outbox(self):
+        outbox, self._outbox = self._outbox, []
+        self._requests.put((BATCH, outbox))
+
+
+def _run_worker(*args):
+    _ShardWorker(*args)._run_loop()
+
+
+class ShardedUpdateServer(UpdateServer):
+    """
+    UpdateServer spreading slave connections over worker processes that accept
+    from one shared listening socket. The workers do TLS, framing and parsing,
+    the main process authenticates and keeps the unified view of the states.
+
+    Workers are forked before any thread of the server starts, launch it
+    before starting other threads too
+    """
+
+    def __init__(self, tls_context, db_operator: DBOperator, port=5000, workers=None,
+                 max_connections=20000, handshake_timeout=10, authenticator=None, snapshot_path=None,
+                 snapshot_interval=60, snapshot_history=100, read_timeout=120, offline_after=60,
+                 state_archive=None):
+        """
+
+        :param workers: number of worker processes, one per CPU core by default
+        :param max_connections: per worker
+        :param read_timeout: seconds of silence after which a worker drops a slave connection
+
+        The rest is as in UpdateServer
+        """
+        super().__init__(tls_context, db_operator, authenticator=authenticator, snapshot_path=snapshot_path,
+                         snapshot_interval=snapshot_interval, snapshot_history=snapshot_history,
+                         read_timeout=read_timeout, offline_after=offline_after, state_archive=state_archive)
+
+        self._secure_port = port
+        self._workers_count = workers if workers is not None else os.cpu_count()
+        self._max_connections = max_connections
+        self._handshake_timeout = handshake_timeout
+        self._stop_timeout = 5
+
+        self._context = multiprocessing.get_context("fork")
+        self._workers = []
+        self._requests = None
+        self._replies = []
+
+    def launch(self):
+        self._stop = False
+
+        self._secure_socket = socket.socket()
+        self._secure_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._secure_socket.bind((self._host, self._secure_port))
+        self._secure_socket.listen(1024)
+        self._logger.info("ShardedUpdateServer: secure listening on %s with %d workers" %
+                          (str((self._host, self.get_port())), self._workers_count))
+
+        self._requests = self._context.Queue()
+        self._replies = [self._context.Queue() for _ in range(self._workers_count)]
+        for worker_id in range(self._workers_count):
+            worker = self._context.Process(target=_run_worker,
+                                           args=(worker_id, self._secure_socket, self._tls_context,
+                                                 self._requests, self._replies[worker_id],
+                                                 self._max_connections, self._handshake_timeout,
+                                                 self._read_timeout),
+                                           daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+        self._launch_services()  # the service threads and the database pool stay in this process
+        collector = Thread(target=self._collect)
+        collector.setDaemon(True)
+        collector.start()
+
+    def stop(self):
+        self._stop = True
+        self._stop_services()
+
+        for replies in self._replies:
+            replies.put(None)
+        for worker in self._workers:
+            worker.join(self._stop_timeout)
+            if worker.is_alive():
+                worker.terminate()
+        self._workers = []
+
+        if self._requests is not None:
+            self._requests.put(None)
+        if self._secure_socket is not None:
+            self._secure_socket.close()
+
+    def get_port(self):
+        return self._secure_socket.getsockname()[1]
+
+    def get_workers_count(self):
+        return len([worker for worker in self._workers if worker.is_alive()])
+
+    def _collect(self):
+        while True:
+            message = self._requests.get()
+            if message is None:
+                return
+
+            if message[0] == AUTHENTICATE:
+                self._authenticate_remote(*message[1:])
+                continue
+
+            for kind, payload in message[1]:
+                if kind == STATE:
+                    self._publish_state(payload)
+                elif kind == TOUCH:
+                    self._touch_state(payload)
+                elif kind == CONNECTED:
+                    self._on_slave_connected(payload)
+                elif kind == DISCONNECTED:
+                    self._on_slave_disconnected(payload)
+
+    def _authenticate_remote(self, worker_id, request_id, nickname, password):
+        future = self._authenticator.submit(nickname, password)
+        future.add_done_callback(partial(self._reply, worker_id, request_id))
+
+    def _reply(self, worker_id, request_id, future):
+        error = future.exception()
+        if error is None:
+            self._replies[worker_id].put((request_id, future.result(), None))
+        else:
+            self._logger.warn("ShardedUpdateServer: authentication error %s" % repr(error))
+            message = error.args[0] if isinstance(error, ValueError) else "internal error"
+            self._replies[worker_id].put((request_id, False, message))
@@ -0,0 +1,99 @@
+import hmac
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from threading import Lock
+from time import time
+
+from src.DBOperator import DBOperator
+from src.PasswordHashing import verify_password
+
+
+class SlaveAuthenticator:
+    """
+    Verifies slave credentials against a TTL/LRU cache of slave records.
+
+    A password that passed verification is remembered as a keyed digest, so
+    reconnecting slaves skip both the DB query and the slow hash. Entries are
+    dropped when DBOperator adds or updates the slave
+    """
+
+    def __init__(self, db_operator: DBOperator, cache_size=10000, ttl=300, workers=4):
+        self._db_operator = db_operator
+        self._cache_size = cache_size
+        self._ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers)
+
+        self._lock = Lock()
+        self._records = OrderedDict()
+        self._generations = {}  # bumped by invalidate, a record fetched across a bump is not cached
+        self._secret = os.urandom(32)
+
+        self._hits = 0
+        self._misses = 0
+
+        db_operator.add_slave_listener(self.invalidate)
+
+    def authenticate(self, nickname, password):
+        """
+        :raises ValueError: if there is no such slave
+        """
+        if password == "":
+            return False
+
+        digest = hmac.new(self._secret, password.encode(), sha256).digest()
+        slave, verified_digest = self._get_record(nickname)
+
+        if verified_digest is not None and hmac.compare_digest(digest, verified_digest):
+            with self._lock:
+                self._hits += 1
+            return True
+
+        with self._lock:
+            self._misses += 1
+        if not verify_password(password, slave.slave_password):
+            return False
+
+        with self._lock:
+            record = self._records.get(nickname)
+            if record is not None and record[0] is slave:  # not updated meanwhile
+                self._records[nickname] = (slave, record[1], digest)
+        return True
+
+    def submit(self, nickname, password):
+        """
+        Runs authenticate in the worker pool
+
+        :rtype: concurrent.futures.Future
+        """
+        return self._executor.submit(self.authenticate, nickname, password)
+
+    def invalidate(self, nickname):
+        with self._lock:
+            self._records.pop(nickname, None)
+            self._generations[nickname] = self._generations.get(nickname, 0) + 1
+
+    def get_stats(self):
+        with self._lock:
+            return {"cached": len(self._records), "hits": self._hits, "misses": self._misses}
+
+    def _get_record(self, nickname):
+        now = time()
+        with self._lock:
+            record = self._records.get(nickname)
+            if record is not None and record[1] > now:
+                self._records.move_to_end(nickname)
+                return record[0], record[2]
+            generation = self._generations.get(nickname, 0)
+
+        slave = self._db_operator.get_slave(nickname)
+
+        with self._lock:
+            if self._generations.get(nickname, 0) != generation:
+                return slave, None  # the slave was updated during the query, this record may be the old one
+            self._records[nickname] = (slave, now + self._ttl, None)
+            self._records.move_to_end(nickname)
+            while len(self._records) > self._cache_size:
+                self._records.popitem(last=False)
+        return slave, None
@@ -0,0 +1,100 @@
+import asyncio
+import struct
+
+HANDSHAKE_SEPARATOR = "\r\n"
+
+LEGACY_PROTOCOL = "legacy"
+FRAMED_PROTOCOL = "framed/1"
+
+FRAME_HEADER = struct.Struct("!I")
+MAX_FRAME_SIZE = 1024 * 1024
+
+
+def parse_handshake(raw_handshake):
+    """
+    Slaves greet with "nickname\\r\\npassword"; those speaking the framed protocol
+    append "\\r\\nframed/1" to it
+
+    :return: nickname, password, protocol
+    """
+    parts = raw_handshake.split(HANDSHAKE_SEPARATOR)
+    if len(parts) == 2:
+        return parts[0], parts[1], LEGACY_PROTOCOL
+    if len(parts) == 3 and parts[2] == FRAMED_PROTOCOL:
+        return parts[0], parts[1], FRAMED_PROTOCOL
+    raise ValueError("Malformed handshake")
+
+
+def make_handshake_reply(slave_nickname, protocol):
+    if protocol == LEGACY_PROTOCOL:
+        return slave_nickname
+    return slave_nickname + HANDSHAKE_SEPARATOR + protocol
+
+
+def encode_frame(payload: bytes):
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+
+async def read_frame(reader: asyncio.StreamReader, max_frame_size=MAX_FRAME_SIZE):
+    """
+    :return: the frame payload or None if the stream ended between frames
+    """
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if e.partial:
+            raise ConnectionError("Connection closed inside a frame header")
+        return None
+
+    length, = FRAME_HEADER.unpack(header)
+    if length > max_frame_size:
+        raise ValueError("Frame of %d bytes exceeds the limit of %d" % (length, max_frame_size))
+
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Connection closed inside a frame")
+
+
+class FrameReader:
+    """
+    Buffered reader splitting a socket stream into length-prefixed frames
+    regardless of how TCP chunks it
+    """
+
+    def __init__(self, connection, max_frame_size=MAX_FRAME_SIZE, chunk_size=65536):
+        self._connection = connection
+        self._max_frame_size = max_frame_size
+        self._chunk_size = chunk_size
+        self._buffer = bytearray()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        length = self._peek_length()
+        while length is None or len(self._buffer) < FRAME_HEADER.size + length:
+            self._fill()
+            length = self._peek_length()
+
+        end = FRAME_HEADER.size + length
+        frame = bytes(self._buffer[FRAME_HEADER.size:end])
+        del self._buffer[:end]
+        return frame
+
+    def _peek_length(self):
+        if len(self._buffer) < FRAME_HEADER.size:
+            return None
+
+        length, = FRAME_HEADER.unpack_from(self._buffer)
+        if length > self._max_frame_size:
+            raise ValueError("Frame of %d bytes exceeds the limit of %d" % (length, self._max_frame_size))
+        return length
+
+    def _fill(self):
+        chunk = self._connection.recv(self._chunk_size)
+        if not chunk:
+            if self._buffer:
+                raise ConnectionError("Connection closed inside a frame")
+            raise StopIteration
+        self._buffer += chunk
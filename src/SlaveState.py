@@ -1,49 +1,176 @@
 import datetime
 import json
-from json import JSONDecodeError
 
 
 class SlaveState:
+    """
+    Immutable state of a slave. The raw message may be str or bytes and is
+    only parsed when one of its fields is first requested
+    """
 
     RAW_MESSAGE_PARTS = 3
 
-    def __init__(self, slave_nickname, raw_message):
+    __slots__ = ("_slave_nickname", "_raw_message", "_received_at", "_stale", "_parsed", "_rendered", "_hash")
 
-        self._slave_nickname = slave_nickname
-        self._raw_message = raw_message
-        self._received_at = datetime.datetime.now()
-        self._parse_raw_message(raw_message)
+    def __init__(self, slave_nickname, raw_message, received_at: datetime.datetime = None, stale=False):
+        """
 
-    def _parse_raw_message(self, raw_message):
+        :param received_at: now by default
+        :param stale: the state was not reported by a connected slave, but restored
+        """
+        set_slot = object.__setattr__
+        set_slot(self, "_slave_nickname", slave_nickname)
+        set_slot(self, "_raw_message", raw_message)
+        set_slot(self, "_received_at", received_at if received_at is not None else datetime.datetime.now())
+        set_slot(self, "_stale", stale)
+        set_slot(self, "_parsed", None)  # (sent_at, state, alerts, metrics, structured)
+        set_slot(self, "_rendered", None)  # message texts, rendered once for all subscribers
+        set_slot(self, "_hash", None)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SlaveState is immutable")
+
+    def __reduce__(self):
+        # parsed fields travel along, so states parsed in another process are not parsed again
+        return _restore_slave_state, (self._slave_nickname, self._raw_message, self._received_at, self._stale,
+                                      self._parsed)
+
+    def _get_parsed(self):
+        parsed = self._parsed
+        if parsed is None:
+            parsed = self._parse_raw_message(self._raw_message)
+            object.__setattr__(self, "_parsed", parsed)
+        return parsed
+
+    @staticmethod
+    def _parse_raw_message(raw_message):
 
         try:
             data = json.loads(raw_message)
-            self._sent_at = data["sent_at"]  # datetime
-            self._state = data["state"]  # state message
-            self._alerts = data["alerts"]
-        except (JSONDecodeError, KeyError):
-            self._sent_at = ""  # datetime
-            self._state = raw_message  # state message
-            self._alerts = ("")
+            return (data["sent_at"],  # datetime
+                    data["state"],  # state message
+                    data["alerts"],
+                    SlaveState._parse_metrics(data.get("metrics", {})),  # optional numeric readings
+                    True)
+        except (ValueError, KeyError, TypeError):  # JSONDecodeError and UnicodeDecodeError are ValueErrors
+            if isinstance(raw_message, bytes):
+                raw_message = raw_message.decode(errors="replace")
+            return "", raw_message, (""), {}, False
+
+    @staticmethod
+    def _parse_metrics(raw_metrics):
+        if not isinstance(raw_metrics, dict):
+            return {}
+        return {name: float(value) for name, value in raw_metrics.items()
+                if isinstance(value, (int, float)) and not isinstance(value, bool)}
+
+    def _get_rendered(self):
+        rendered = self._rendered
+        if rendered is None:
+            rendered = {}
+            object.__setattr__(self, "_rendered", rendered)
+        return rendered
 
     def get_state_message(self):
-        return self._received_at.strftime("%Y-%m-%d %H:%M:%S") + \
-               " - " + self._slave_nickname + "\n" +\
-               self._state
+        rendered = self._get_rendered()
+        message = rendered.get("state")
+        if message is None:
+            message = rendered["state"] = self._get_header() + "\n" + self._get_parsed()[1]
+        return message
 
     def get_alert_message(self, alert):
         if alert is not "":
-            return self._received_at.strftime("%Y-%m-%d %H:%M:%S") + \
-                   " - " + self._slave_nickname + "\nAlert! " +\
-                   alert
+            return self.get_alerts_message((alert,))
+
+    def get_alerts_message(self, alerts):
+        """
+        :return: one message listing all the given alerts
+        """
+        rendered = self._get_rendered()
+        key = tuple(alerts)
+        message = rendered.get(key)
+        if message is None:
+            message = rendered[key] = self._get_header() + "".join("\nAlert! " + alert for alert in key)
+        return message
+
+    def _get_header(self):
+        rendered = self._get_rendered()
+        header = rendered.get("header")
+        if header is None:
+            header = rendered["header"] = self._received_at.strftime("%Y-%m-%d %H:%M:%S") + \
+                                          " - " + self._slave_nickname + (" (stale)" if self._stale else "")
+        return header
+
+    def get_slave_nickname(self):
+        return self._slave_nickname
+
+    def get_received_at(self):
+        return self._received_at
+
+    def is_stale(self):
+        return self._stale
+
+    def as_stale(self):
+        """
+        :return: the same state marked stale
+        """
+        state = SlaveState(self._slave_nickname, self._raw_message, self._received_at, stale=True)
+        object.__setattr__(state, "_parsed", self._parsed)
+        return state
+
+    def get_raw_message(self):
+        raw_message = self._raw_message
+        if isinstance(raw_message, bytes):
+            return raw_message.decode(errors="replace")
+        return raw_message
+
+    def get_raw_bytes(self):
+        raw_message = self._raw_message
+        if isinstance(raw_message, str):
+            return raw_message.encode()
+        return raw_message
+
+    def has_raw_message(self, raw_message):
+        """
+        Cheap change detection, compares without decoding
+        """
+        if type(raw_message) is type(self._raw_message):
+            return raw_message == self._raw_message
+        if isinstance(raw_message, str):
+            raw_message = raw_message.encode()
+        return raw_message == self.get_raw_bytes()
 
     def get_alerts(self):
-        return self._alerts
+        return self._get_parsed()[2]
+
+    def get_metrics(self):
+        """
+        :return: dict of metric name to float value
+        """
+        return self._get_parsed()[3]
+
+    def is_structured(self):
+        """
+        :return: False if the raw message is not a valid JSON state and is shown as is
+        """
+        return self._get_parsed()[4]
 
     def __eq__(self, other):
         if type(other) is type(self):
-            return self.__dict__ == other.__dict__
+            return self._slave_nickname == other._slave_nickname and \
+                   self._received_at == other._received_at and \
+                   self._stale == other._stale and \
+                   other.has_raw_message(self._raw_message)
         else:
             return False
 
+    def __hash__(self):
+        if self._hash is None:
+            object.__setattr__(self, "_hash", hash((self._slave_nickname, self.get_raw_bytes(), self._received_at)))
+        return self._hash
+
 
+def _restore_slave_state(slave_nickname, raw_message, received_at, stale, parsed):
+    state = SlaveState(slave_nickname, raw_message, received_at, stale)
+    object.__setattr__(state, "_parsed", parsed)
+    return state
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from threading import Thread, Event
+
+from loggingserver import LoggingServer
+
+from src.BatchWriter import BatchWriter, OverflowPolicy
+from src.DBOperator import DBOperator
+
+
+class StateArchive:
+    """
+    Keeps every published slave state in the slave_states table and folds its
+    metrics into the minute and hour rollups. States are queued and written in
+    batches from a background thread, so ingest does not wait for the database.
+    A maintenance thread downsamples the states older than full_resolution_age
+    and deletes the states and minute rollups older than retention
+    """
+
+    def __init__(self, db_operator: DBOperator, batch_size=1000, flush_interval=1, max_queue_size=100000,
+                 retention=90 * 24 * 3600, full_resolution_age=7 * 24 * 3600, downsample_interval=60,
+                 maintenance_interval=3600):
+        """
+
+        :param retention: seconds, older states are deleted
+        :param full_resolution_age: seconds, older states are thinned out to one per
+                                    downsample_interval seconds for every slave
+        """
+        self._db_operator = db_operator
+        self._writer = BatchWriter(self._write, batch_size=batch_size,
+                                   flush_interval=flush_interval, max_queue_size=max_queue_size,
+                                   overflow_policy=OverflowPolicy.DROP, name="StateArchive")
+        self._retention = retention
+        self._full_resolution_age = full_resolution_age
+        self._downsample_interval = downsample_interval
+        self._maintenance_interval = maintenance_interval
+
+        self._logger = LoggingServer.getInstance("overseer")
+        self._stopped = Event()
+        self._maintainer = None
+
+    def launch(self):
+        self._writer.launch()
+
+        self._stopped.clear()
+        self._maintainer = Thread(target=self._maintain_periodically)
+        self._maintainer.setDaemon(True)
+        self._maintainer.start()
+
+    def stop(self):
+        """
+        Writes out the queued states
+        """
+        self._stopped.set()
+        self._writer.stop()
+
+    def add(self, state):
+        """
+        :type state: src.SlaveState.SlaveState
+        """
+        self._writer.put(state)
+
+    def flush(self):
+        self._writer.flush()
+
+    def maintain(self, now=None):
+        """
+        :return: (downsampled, deleted) numbers of states
+        """
+        now = datetime.now() if now is None else now
+        deleted = self._db_operator.delete_slave_states(now - timedelta(seconds=self._retention))
+        self._db_operator.delete_metric_rollups(60, now - timedelta(seconds=self._retention))
+        downsampled = self._db_operator.downsample_slave_states(now - timedelta(seconds=self._full_resolution_age),
+                                                                self._downsample_interval)
+        return downsampled, deleted
+
+    def get_stats(self):
+        return self._writer.get_stats()
+
+    def _write(self, states):
+        self._db_operator.add_slave_states(states)
+        self._db_operator.add_metric_rollups(states)
+
+    def _maintain_periodically(self):
+        while not self._stopped.wait(self._maintenance_interval):
+            try:
+                downsampled, deleted = self.maintain()
+                self._logger.info("StateArchive: %d states downsampled, %d deleted" % (downsampled, deleted))
+            except Exception as e:
+                self._logger.warn("StateArchive: maintenance failed: %s" % repr(e))
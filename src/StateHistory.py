@@ -0,0 +1,104 @@
+from array import array
+from datetime import datetime
+from threading import Lock
+from time import time
+
+
+class _Ring:
+
+    def __init__(self, capacity):
+        self.timestamps = array("d", bytes(8 * capacity))
+        self.states = [None] * capacity
+        self.start = 0
+        self.size = 0
+
+    def append(self, timestamp, state):
+        capacity = len(self.states)
+        end = (self.start + self.size) % capacity
+        self.timestamps[end] = timestamp
+        self.states[end] = state
+        if self.size < capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % capacity
+
+    def drop_older_than(self, timestamp):
+        while self.size and self.timestamps[self.start] < timestamp:
+            self.states[self.start] = None
+            self.start = (self.start + 1) % len(self.states)
+            self.size -= 1
+
+    def bisect(self, timestamp):
+        """
+        :return: the logical index of the first entry not older than timestamp
+        """
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamps[(self.start + middle) % len(self.states)] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def slice(self, begin, end):
+        capacity = len(self.states)
+        return [self.states[(self.start + i) % capacity] for i in range(begin, end)]
+
+
+class StateHistory:
+    """
+    Keeps the last states of every slave in fixed-size ring buffers: at most
+    max_count states per slave and none older than max_age seconds
+    """
+
+    def __init__(self, max_count=1000, max_age=24 * 3600):
+        self._max_count = max_count
+        self._max_age = max_age
+        self._lock = Lock()
+        self._rings = {}
+
+    def add(self, state):
+        """
+        :type state: src.SlaveState.SlaveState
+        """
+        slave_nickname = state.get_slave_nickname()
+        timestamp = state.get_received_at().timestamp()
+        with self._lock:
+            ring = self._rings.get(slave_nickname)
+            if ring is None:
+                ring = self._rings[slave_nickname] = _Ring(self._max_count)
+            ring.append(timestamp, state)
+            ring.drop_older_than(time() - self._max_age)
+
+    def get_range(self, slave_nickname, since: datetime, until: datetime = None):
+        """
+        :return: states received in [since, until), oldest first
+        """
+        with self._lock:
+            ring = self._get_ring(slave_nickname)
+            if ring is None:
+                return []
+            begin = ring.bisect(since.timestamp())
+            end = ring.size if until is None else ring.bisect(until.timestamp())
+            return ring.slice(begin, end)
+
+    def get_latest(self, slave_nickname, count):
+        """
+        :return: up to count most recent states, oldest first
+        """
+        with self._lock:
+            ring = self._get_ring(slave_nickname)
+            if ring is None:
+                return []
+            return ring.slice(max(ring.size - count, 0), ring.size)
+
+    def get_slaves(self):
+        with self._lock:
+            return list(self._rings.keys())
+
+    def _get_ring(self, slave_nickname):
+        ring = self._rings.get(slave_nickname)
+        if ring is not None:
+            ring.drop_older_than(time() - self._max_age)
+        return ring
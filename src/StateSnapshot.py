@@ -0,0 +1,95 @@
+import datetime
+import os
+import struct
+from time import time
+
+from src.SlaveState import SlaveState
+
+MAGIC = b"OVSS"
+VERSION = 1
+HEADER = struct.Struct("!4sHI")  # magic, version, records count
+RECORD = struct.Struct("!dBHI")  # received_at, flags, nickname length, raw message length
+
+HISTORY = 1
+LATEST = 2
+
+
+class StateSnapshot:
+    """
+    Binary file with the latest state of every slave and a tail of its history.
+    Each record is a fixed header followed by the nickname and the raw message
+    """
+
+    def __init__(self, path):
+        self._path = path
+
+    def save(self, latest_states, history_states):
+        """
+        Replaces the file atomically
+
+        :param latest_states: iterable of SlaveState
+        :param history_states: iterable of SlaveState, oldest first for every slave
+        """
+        records = {}
+        for state in history_states:
+            records[id(state)] = [state, HISTORY]
+        for state in latest_states:
+            records.setdefault(id(state), [state, 0])[1] |= LATEST
+
+        chunks = [HEADER.pack(MAGIC, VERSION, len(records))]
+        for state, flags in records.values():
+            nickname = state.get_slave_nickname().encode()
+            raw_message = state.get_raw_bytes()
+            chunks.append(RECORD.pack(state.get_received_at().timestamp(), flags, len(nickname), len(raw_message)))
+            chunks.append(nickname)
+            chunks.append(raw_message)
+
+        temporary_path = self._path + ".tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(b"".join(chunks))
+        os.replace(temporary_path, self._path)
+
+    def load(self, max_age=None):
+        """
+        :param max_age: seconds, older states are skipped
+        :return: (latest states, history states oldest first), restored latest states are stale
+        :raises ValueError: if the file is corrupted
+        """
+        if not os.path.exists(self._path):
+            return [], []
+
+        with open(self._path, "rb") as f:
+            data = memoryview(f.read())
+
+        try:
+            magic, version, count = HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError("Snapshot %s is truncated" % self._path)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("%s is not a version %d snapshot" % (self._path, VERSION))
+
+        oldest = time() - max_age if max_age is not None else 0
+        latest_states = []
+        history_states = []
+        offset = HEADER.size
+        for _ in range(count):
+            try:
+                timestamp, flags, nickname_length, raw_length = RECORD.unpack_from(data, offset)
+            except struct.error:
+                raise ValueError("Snapshot %s is truncated" % self._path)
+            offset += RECORD.size
+            nickname = bytes(data[offset:offset + nickname_length]).decode()
+            offset += nickname_length
+            raw_message = bytes(data[offset:offset + raw_length])
+            offset += raw_length
+            if len(raw_message) != raw_length:
+                raise ValueError("Snapshot %s is truncated" % self._path)
+
+            if timestamp < oldest:
+                continue
+            received_at = datetime.datetime.fromtimestamp(timestamp)
+            if flags & HISTORY:
+                history_states.append(SlaveState(nickname, raw_message, received_at))
+            if flags & LATEST:
+                latest_states.append(SlaveState(nickname, raw_message, received_at, stale=True))
+        return latest_states, history_states
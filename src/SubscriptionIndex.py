@@ -0,0 +1,75 @@
+from collections import namedtuple
+from threading import Lock
+
+Subscription = namedtuple("Subscription", ("telegram_id", "slave_nickname", "info_message_id"))
+
+
+class SubscriptionIndex:
+    """
+    In-process copy of the subscriptions table, indexed both by slave and by user.
+    Kept up to date write-through by DBOperator
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._by_slave = {}
+        self._by_user = {}
+
+    def load(self, subscriptions):
+        by_slave = {}
+        by_user = {}
+        for telegram_id, slave_nickname, info_message_id in subscriptions:
+            by_slave.setdefault(slave_nickname, {})[telegram_id] = info_message_id
+            by_user.setdefault(telegram_id, {})[slave_nickname] = info_message_id
+
+        with self._lock:
+            self._by_slave = by_slave
+            self._by_user = by_user
+
+    def add(self, telegram_id, slave_nickname, info_message_id):
+        with self._lock:
+            self._by_slave.setdefault(slave_nickname, {})[telegram_id] = info_message_id
+            self._by_user.setdefault(telegram_id, {})[slave_nickname] = info_message_id
+
+    def remove(self, telegram_id, slave_nickname):
+        with self._lock:
+            self._discard(self._by_slave, slave_nickname, telegram_id)
+            self._discard(self._by_user, telegram_id, slave_nickname)
+
+    def get_subscribers(self, slave_nickname):
+        """
+        :return: list of (telegram_id, info_message_id)
+        """
+        with self._lock:
+            return list(self._by_slave.get(slave_nickname, {}).items())
+
+    def get_subscriptions(self, telegram_id):
+        """
+        :return: list of (slave_nickname, info_message_id)
+        """
+        with self._lock:
+            return list(self._by_user.get(telegram_id, {}).items())
+
+    def get_info_message_id(self, telegram_id, slave_nickname):
+        with self._lock:
+            return self._by_user.get(telegram_id, {}).get(slave_nickname)
+
+    def get_all_subscriptions(self, slave_nicknames=None):
+        with self._lock:
+            if slave_nicknames is None:
+                slave_nicknames = self._by_slave.keys()
+            return [Subscription(telegram_id, slave_nickname, info_message_id)
+                    for slave_nickname in slave_nicknames
+                    for telegram_id, info_message_id in self._by_slave.get(slave_nickname, {}).items()]
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._by_slave.values())
+
+    @staticmethod
+    def _discard(index, key, inner_key):
+        inner = index.get(key)
+        if inner is not None:
+            inner.pop(inner_key, None)
+            if not inner:
+                del index[key]
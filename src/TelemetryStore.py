@@ -0,0 +1,114 @@
+from threading import Lock
+
+import numpy as np
+
+
+class _MetricRing:
+    """
+    Every sample is written twice, at i and i + capacity, so the last
+    `size` samples are always one contiguous slice of the arrays
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.timestamps = np.zeros(2 * capacity)
+        self.values = np.zeros(2 * capacity)
+        self.next = 0
+        self.size = 0
+
+    def append(self, timestamp, value):
+        for i in (self.next, self.next + self.capacity):
+            self.timestamps[i] = timestamp
+            self.values[i] = value
+        self.next = (self.next + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def window(self, since=None, until=None):
+        end = self.next + self.capacity
+        timestamps = self.timestamps[end - self.size:end]
+        values = self.values[end - self.size:end]
+
+        begin = 0 if since is None else np.searchsorted(timestamps, since, side="left")
+        stop = self.size if until is None else np.searchsorted(timestamps, until, side="left")
+        return timestamps[begin:stop], values[begin:stop]
+
+
+class TelemetryStore:
+    """
+    Numeric readings reported by slaves in the "metrics" field, kept in
+    per-slave, per-metric NumPy ring arrays of fixed capacity
+    """
+
+    def __init__(self, capacity=4096):
+        self._capacity = capacity
+        self._lock = Lock()
+        self._rings = {}
+
+    def add_state(self, state):
+        """
+        :type state: src.SlaveState.SlaveState
+        """
+        metrics = state.get_metrics()
+        if metrics:
+            self.add(state.get_slave_nickname(), state.get_received_at().timestamp(), metrics)
+
+    def add(self, slave_nickname, timestamp, metrics):
+        with self._lock:
+            slave_rings = self._rings.setdefault(slave_nickname, {})
+            for name, value in metrics.items():
+                ring = slave_rings.get(name)
+                if ring is None:
+                    ring = slave_rings[name] = _MetricRing(self._capacity)
+                ring.append(timestamp, value)
+
+    def get_metric_names(self, slave_nickname):
+        with self._lock:
+            return sorted(self._rings.get(slave_nickname, {}).keys())
+
+    def get_series(self, slave_nickname, metric, since=None, until=None):
+        """
+        :param since: unix timestamp, inclusive
+        :param until: unix timestamp, exclusive
+        :return: copies of the timestamps and values arrays in [since, until)
+        """
+        with self._lock:
+            ring = self._rings.get(slave_nickname, {}).get(metric)
+            if ring is None:
+                return np.empty(0), np.empty(0)
+            timestamps, values = ring.window(since, until)
+            return timestamps.copy(), values.copy()
+
+    def aggregate(self, slave_nickname, metric, since=None, until=None, percentiles=(50, 90, 99)):
+        """
+        :return: dict with count, min, max, mean, std, last, the requested percentiles as "p<q>",
+                 "rate" (least squares slope, units per second) and "max_rate" (largest absolute
+                 change per second between consecutive samples); None if there are no samples
+        """
+        timestamps, values = self.get_series(slave_nickname, metric, since, until)
+        if len(values) == 0:
+            return None
+
+        result = {"count": len(values),
+                  "min": float(values.min()),
+                  "max": float(values.max()),
+                  "mean": float(values.mean()),
+                  "std": float(values.std()),
+                  "last": float(values[-1])}
+
+        for q, value in zip(percentiles, np.percentile(values, percentiles)):
+            result["p%g" % q] = float(value)
+
+        result["rate"] = 0.
+        result["max_rate"] = 0.
+        if len(values) > 1:
+            elapsed = timestamps - timestamps.mean()
+            denominator = (elapsed ** 2).sum()
+            if denominator > 0:
+                result["rate"] = float((elapsed * (values - values.mean())).sum() / denominator)
+
+            intervals = np.diff(timestamps)
+            valid = intervals > 0
+            if valid.any():
+                result["max_rate"] = float(np.abs(np.diff(values)[valid] / intervals[valid]).max())
+
+        return result
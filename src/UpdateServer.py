@@ -2,13 +2,32 @@ import datetime
 import socket
 import ssl
 from enum import Enum, auto
-from hashlib import md5
 from loggingserver import LoggingServer
-from threading import Thread
+from threading import Thread, active_count
+from time import time, sleep
 
+from src.AlertEngine import AlertEngine
 from src.DBOperator import DBOperator
+from src.LivenessTable import LivenessTable
+from src.MetricsRegistry import MetricsRegistry
 from src.ResourceManager import ResourceManager
+from src.SlaveAuthenticator import SlaveAuthenticator
+from src.SlaveProtocol import parse_handshake, make_handshake_reply, FrameReader, FRAMED_PROTOCOL, \
+    LEGACY_PROTOCOL
 from src.SlaveState import SlaveState
+from src.StateArchive import StateArchive
+from src.StateHistory import StateHistory
+from src.StateSnapshot import StateSnapshot
+from src.TelemetryStore import TelemetryStore
+
+INGESTED_FRAMES = MetricsRegistry.get_instance().counter("overseer_ingested_frames_total",
+                                                         "State updates received from slaves", ["slave"])
+INGESTED_BYTES = MetricsRegistry.get_instance().counter("overseer_ingested_bytes_total",
+                                                        "Bytes of state updates received from slaves", ["slave"])
+PARSE_FAILURES = MetricsRegistry.get_instance().counter("overseer_parse_failures_total",
+                                                        "State updates which are not valid JSON states", ["slave"])
+SLAVE_CONNECTIONS = MetricsRegistry.get_instance().gauge("overseer_slave_connections", "Open slave connections")
+ACTIVE_THREADS = MetricsRegistry.get_instance().gauge("overseer_active_threads", "Alive threads of the process")
 
 
 class ServerState(Enum):
@@ -18,9 +37,21 @@ class ServerState(Enum):
 
 class UpdateServer:
 
-    def __init__(self, tls_context, db_operator: DBOperator):
+    def __init__(self, tls_context, db_operator: DBOperator, authenticator=None, snapshot_path=None,
+                 snapshot_interval=60, snapshot_history=100, read_timeout=120, offline_after=60, state_archive=None):
+        """
+
+        :param read_timeout: seconds of silence after which a slave connection is dropped
+        :param offline_after: seconds of silence after which a slave is considered offline
 
+        :param authenticator: SlaveAuthenticator over db_operator by default
+        :param snapshot_path: if given, the states are restored from this file on launch and saved
+                              to it every snapshot_interval seconds and on stop
+        :param snapshot_history: number of latest history states of each slave to save
+        :param state_archive: StateArchive over db_operator by default, every published state is added to it
+        """
         self._db_operator = db_operator
+        self._authenticator = authenticator if authenticator is not None else SlaveAuthenticator(db_operator)
 
         self._rm = ResourceManager()
         self._host = "0.0.0.0"
@@ -35,6 +66,25 @@ class UpdateServer:
         self._logger = LoggingServer.getInstance("overseer")
 
         self._latest_states = {}
+        self._state_versions = {}
+        self._history = StateHistory()
+        self._telemetry = TelemetryStore()
+        self._alert_engine = AlertEngine()
+        self._state_listeners = []
+
+        self._read_timeout = read_timeout
+        self._liveness = LivenessTable(offline_after)
+        self._liveness.add_listener(self._on_liveness_change)
+        self._liveness_check_interval = 1
+
+        self._snapshot = StateSnapshot(snapshot_path) if snapshot_path is not None else None
+        self._snapshot_interval = snapshot_interval
+        self._snapshot_history = snapshot_history
+        self._snapshot_max_age = 24 * 3600
+
+        if state_archive is None and db_operator is not None:
+            state_archive = StateArchive(db_operator)
+        self._state_archive = state_archive
 
         self._strategies = {ServerState.ACCEPT: self._accept_connection,
                             ServerState.DISPATCH: self._dispatch_connection}
@@ -49,6 +99,7 @@ class UpdateServer:
     def launch(self):
 
         self._stop = False
+        self._launch_services()
 
         self._secure_socket = socket.socket()
         self._secure_socket.bind((self._host, self._secure_port))
@@ -61,6 +112,101 @@ class UpdateServer:
 
     def stop(self):
         self._stop = True
+        self._stop_services()
+
+    def _launch_services(self):
+        self._alert_engine.launch()
+        if self._state_archive is not None:
+            self._state_archive.launch()
+
+        SLAVE_CONNECTIONS.set_function(self._count_connections)
+        ACTIVE_THREADS.set_function(active_count)
+
+        liveness_checker = Thread(target=self._check_liveness)
+        liveness_checker.setDaemon(True)
+        liveness_checker.start()
+
+        if self._snapshot is not None:
+            self._restore_snapshot()
+            saver = Thread(target=self._save_snapshots)
+            saver.setDaemon(True)
+            saver.start()
+
+    def _stop_services(self):
+        self._alert_engine.stop()
+        if self._state_archive is not None:
+            self._state_archive.stop()
+        if self._snapshot is not None:
+            self._save_snapshot()
+
+    def _check_liveness(self):
+        while not self._stop:
+            self._liveness.check()
+            sleep(self._liveness_check_interval)
+
+    def _on_liveness_change(self, slave_nickname, online):
+        if online:
+            return
+
+        state = self._latest_states.get(slave_nickname)
+        if state is not None and not state.is_stale():
+            self._latest_states[slave_nickname] = state.as_stale()
+
+    def _count_connections(self):
+        return sum(self._liveness.get_liveness(slave_nickname)["connections"]
+                   for slave_nickname in self._liveness.get_slaves())
+
+    def _on_slave_connected(self, slave_nickname):
+        self._liveness.on_connect(slave_nickname)
+
+    def _on_slave_disconnected(self, slave_nickname):
+        self._liveness.on_disconnect(slave_nickname)
+        self._heartbeat_interval_counters.pop(slave_nickname, None)
+
+    @staticmethod
+    def _enable_keepalive(sock, idle=60, interval=10, count=5):
+        """
+        Lets the kernel detect half-open connections of slaves that vanished
+        """
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for option, value in [("TCP_KEEPIDLE", idle), ("TCP_KEEPINTVL", interval), ("TCP_KEEPCNT", count)]:
+            if hasattr(socket, option):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value)
+
+    def _restore_snapshot(self):
+        """
+        Fills the latest states, history and telemetry from the snapshot. Restored states
+        are stale until their slaves report, they do not count as new versions
+        """
+        start = time()
+        try:
+            latest_states, history_states = self._snapshot.load(self._snapshot_max_age)
+        except (ValueError, OSError) as e:
+            self._logger.warn("UpdateServer: could not restore the snapshot, %s" % str(e))
+            return
+
+        for state in history_states:
+            self._history.add(state)
+            self._telemetry.add_state(state)
+        for state in latest_states:
+            self._latest_states.setdefault(state.get_slave_nickname(), state)
+        self._logger.info("UpdateServer: restored %d states and %d history states in %.1f ms" %
+                          (len(latest_states), len(history_states), (time() - start) * 1e3))
+
+    def _save_snapshots(self):
+        while not self._stop:
+            sleep(self._snapshot_interval)
+            if not self._stop:
+                self._save_snapshot()
+
+    def _save_snapshot(self):
+        latest_states = list(self._latest_states.values())
+        history_states = [state for slave_nickname in self._history.get_slaves()
+                          for state in self._history.get_latest(slave_nickname, self._snapshot_history)]
+        try:
+            self._snapshot.save(latest_states, history_states)
+        except OSError as e:
+            self._logger.warn("UpdateServer: could not save the snapshot, %s" % str(e))
 
     def _act(self):
         try:
@@ -77,6 +223,8 @@ class UpdateServer:
         try:
             conn, address = self._secure_socket.accept()  # accept new connection
             self._logger.info("Connection from: " + str(address))
+            conn.settimeout(self._read_timeout)
+            self._enable_keepalive(conn)
             connstream = self._tls_context.wrap_socket(conn, server_side=True)
         except (ssl.SSLError, ConnectionError, socket.error) as e:
             self._logger.warn("UpdateServer: " + str(e))
@@ -94,18 +242,12 @@ class UpdateServer:
         self._state = ServerState.ACCEPT
 
     def _authenticate_slave(self, nickname, password):
-        slave = self._db_operator.get_slave(nickname)
-
-        md5_pass = md5(password.encode()).hexdigest()
-        if slave.slave_password == md5_pass and password != "":
-            return True
-
-        return False
+        return self._authenticator.authenticate(nickname, password)
 
     def _communicate(self, connection: socket.socket, address):
 
         try:
-            slave_nickname, slave_password = connection.recv(1024).decode().split("\r\n")
+            slave_nickname, slave_password, protocol = parse_handshake(connection.recv(1024).decode())
 
             if not self._authenticate_slave(slave_nickname, slave_password):
                 raise ValueError("Wrong username/password!")
@@ -115,25 +257,72 @@ class UpdateServer:
             connection.send(("Authentication failed: " + e.args[0]).encode())
             return
 
-        connection.send(slave_nickname.encode())
-        self._logger.debug("Successful handshake with %s" % str(slave_nickname))
+        connection.send(make_handshake_reply(slave_nickname, protocol).encode())
+        self._logger.debug("Successful handshake with %s (%s)" % (str(slave_nickname), protocol))
 
         self._heartbeat_interval_counters[slave_nickname] = 0
+        self._on_slave_connected(slave_nickname)
 
-        for data in self._update_generator(connection, slave_nickname):
-            self._latest_states[slave_nickname] = SlaveState(slave_nickname, data)
-            self._log_heartbeat(slave_nickname, address, len(data))
-
-        connection.close()
+        try:
+            for data in self._update_generator(connection, slave_nickname, protocol):
+                self._store_state(slave_nickname, data)
+                self._log_heartbeat(slave_nickname, address, len(data))
+        except (ValueError, ConnectionError, socket.error) as e:  # socket.timeout included
+            self._logger.warn("Dropping connection of %s: %s" % (str(slave_nickname), str(e)))
+        finally:
+            connection.close()
+            self._on_slave_disconnected(slave_nickname)
+
+    def _store_state(self, slave_nickname, data):
+        previous_state = self._latest_states.get(slave_nickname)
+        if previous_state is not None and not previous_state.is_stale() and previous_state.has_raw_message(data):
+            self._touch_state(slave_nickname)
+            return  # nothing new to publish
+
+        self._publish_state(SlaveState(slave_nickname, data))
+
+    def _touch_state(self, slave_nickname):
+        INGESTED_FRAMES.inc(slave_nickname)
+        INGESTED_BYTES.inc(slave_nickname, amount=len(self._latest_states[slave_nickname].get_raw_bytes()))
+        self._liveness.on_message(slave_nickname)
+        self._alert_engine.touch(slave_nickname)
+
+    def _publish_state(self, state):
+        slave_nickname = state.get_slave_nickname()
+        INGESTED_FRAMES.inc(slave_nickname)
+        INGESTED_BYTES.inc(slave_nickname, amount=len(state.get_raw_bytes()))
+        if not state.is_structured():
+            PARSE_FAILURES.inc(slave_nickname)
+        self._liveness.on_message(slave_nickname)
+        self._latest_states[slave_nickname] = state
+        self._history.add(state)
+        self._telemetry.add_state(state)
+        if self._state_archive is not None:
+            self._state_archive.add(state)
+        self._alert_engine.on_update(state)
+        self._state_versions[slave_nickname] = self._state_versions.get(slave_nickname, 0) + 1
+        for listener in self._state_listeners:
+            listener(slave_nickname)
+
+    def _update_generator(self, connection, slave_nickname, protocol=LEGACY_PROTOCOL):
+        """
+        Yields the raw updates as bytes, SlaveState decodes them only if needed
+        """
+        if protocol == FRAMED_PROTOCOL:
+            for frame in FrameReader(connection):
+                if self._stop:
+                    return
+                yield frame
+            self._logger.debug("Connection closed by %s" % str(slave_nickname))
+            return
 
-    def _update_generator(self, connection, slave_nickname):
-        data = connection.recv(1024).decode()
+        data = connection.recv(1024)
 
-        while data != "" and not self._stop:
+        while data != b"" and not self._stop:
             yield data
-            data = connection.recv(1024).decode()
+            data = connection.recv(1024)
 
-        if data == "":
+        if data == b"":
             self._logger.debug("Emtpy data from %s, closing" % str(slave_nickname))
 
     def _log_heartbeat(self, slave_nickname, address, length):
@@ -145,6 +334,39 @@ class UpdateServer:
 
         self._heartbeat_interval_counters[slave_nickname] += 1
 
+    def add_state_listener(self, listener):
+        """
+        :param listener: called with the slave nickname each time its latest state changes
+        """
+        self._state_listeners.append(listener)
+
+    def get_history(self):
+        """
+        :rtype: StateHistory
+        """
+        return self._history
+
+    def get_alert_engine(self):
+        """
+        :rtype: AlertEngine
+        """
+        return self._alert_engine
+
+    def get_liveness(self):
+        """
+        :rtype: LivenessTable
+        """
+        return self._liveness
+
+    def get_telemetry(self):
+        """
+        :rtype: TelemetryStore
+        """
+        return self._telemetry
+
+    def get_state_version(self, slave_nickname):
+        return self._state_versions.get(slave_nickname, 0)
+
     def get_latest_state(self, slave_nickname):
         try:
             return self._latest_states[slave_nickname]
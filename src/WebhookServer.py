@@ -0,0 +1,199 @@
+import json
+import ssl
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from queue import Queue, Empty
+from threading import Thread, Lock
+from urllib.parse import urlsplit
+
+from loggingserver import LoggingServer
+from telegram import Update
+
+from src.MetricsRegistry import MetricsRegistry
+
+WEBHOOK_UPDATES = MetricsRegistry.get_instance().counter("overseer_webhook_updates_total",
+                                                         "Updates received by the webhook", ["result"])
+UPDATE_SECONDS = MetricsRegistry.get_instance().histogram("overseer_update_processing_seconds",
+                                                          "Time spent dispatching one update")
+
+
+class WebhookServer:
+    """
+    Receives the updates Telegram pushes to the bot instead of polling for them.
+    A POST body holds one update or a JSON list of them. Updates are handed to
+    the dispatcher by a pool of workers, each draining its queue in batches;
+    all updates of a chat go to the same worker, so conversations keep their order.
+    The path of the url is the only credential, make it hard to guess
+    """
+
+    def __init__(self, dispatcher, url, host="0.0.0.0", port=8443, certificate=None, key=None, workers=4,
+                 batch_size=100, max_queue_size=10000):
+        """
+
+        :type dispatcher: telegram.ext.Dispatcher
+        :param url: public https url registered with Telegram, its path is served
+        :param certificate: path to the PEM certificate, uploaded to Telegram when self-signed like domain.crt
+        :param key: path to the private key, the receiver serves plain HTTP without it
+                    (when TLS is terminated by a proxy in front)
+        :param max_queue_size: per worker, requests not fitting are refused with 503 and Telegram retries them
+        """
+        self._dispatcher = dispatcher
+        self._url = url
+        self._path = urlsplit(url).path or "/"
+        self._host = host
+        self._port = port
+        self._certificate = certificate
+        self._key = key
+        self._batch_size = batch_size
+        self._queues = [Queue(maxsize=max_queue_size) for _ in range(workers)]
+
+        self._logger = LoggingServer.getInstance("overseer")
+        self._lock = Lock()
+        self._receive_lock = Lock()
+        self._received = 0
+        self._processed = 0
+        self._rejected = 0
+        self._server = None
+        self._workers = []
+
+    def launch(self, register=True):
+        """
+        :param register: set the webhook in Telegram, off for local testing
+        """
+        self._workers = [Thread(target=self._process, args=(queue,)) for queue in self._queues]
+        for worker in self._workers:
+            worker.setDaemon(True)
+            worker.start()
+
+        self._server = _ReceiverServer((self._host, self._port), self._make_handler())
+        self._server.daemon_threads = True
+        if self._key is not None:
+            self._server.ssl_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            self._server.ssl_context.load_cert_chain(self._certificate, self._key)
+        server = Thread(target=self._server.serve_forever)
+        server.setDaemon(True)
+        server.start()
+
+        if register:
+            if self._certificate is not None:
+                with open(self._certificate, "rb") as certificate:
+                    self._dispatcher.bot.set_webhook(self._url, certificate=certificate)
+            else:
+                self._dispatcher.bot.set_webhook(self._url)
+
+    def stop(self, unregister=True):
+        """
+        Processes the queued updates
+        """
+        if unregister:
+            self._dispatcher.bot.delete_webhook()
+        self._server.shutdown()
+        self._server.server_close()
+        for queue in self._queues:
+            queue.put(None)
+        for worker in self._workers:
+            worker.join()
+
+    def get_port(self):
+        return self._server.server_address[1]
+
+    def get_stats(self):
+        with self._lock:
+            return {"received": self._received, "processed": self._processed, "rejected": self._rejected,
+                    "queued": sum(queue.qsize() for queue in self._queues)}
+
+    def receive(self, data):
+        """
+        Queues all the updates or none of them, Telegram delivers the whole body again after a refusal
+
+        :param data: decoded JSON of one update or a list of them
+        :return: False if the updates did not fit into the queues
+        :raises ValueError, TypeError, KeyError, AttributeError: if an update is malformed, nothing is queued
+        """
+        if isinstance(data, dict):
+            data = [data]
+
+        batches = {}
+        for item in data:
+            update = Update.de_json(item, self._dispatcher.bot)
+            chat = update.effective_chat
+            queue = self._queues[(chat.id if chat is not None else update.update_id) % len(self._queues)]
+            batches.setdefault(queue, []).append(update)
+
+        with self._receive_lock:  # the workers only take from the queues, the room checked stays free
+            accepted = all(queue.maxsize <= 0 or queue.qsize() + len(updates) <= queue.maxsize
+                           for queue, updates in batches.items())
+            if accepted:
+                for queue, updates in batches.items():
+                    for update in updates:
+                        queue.put_nowait(update)
+
+        with self._lock:
+            if accepted:
+                self._received += len(data)
+            else:
+                self._rejected += len(data)
+        WEBHOOK_UPDATES.inc("accepted" if accepted else "rejected", amount=len(data))
+        return accepted
+
+    def _make_handler(self):
+        webhook = self
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_POST(self):
+                if self.path.split("?")[0] != webhook._path:
+                    self.send_error(404)
+                    return
+                try:
+                    data = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                    accepted = webhook.receive(data)
+                except (ValueError, TypeError, KeyError, AttributeError) as e:
+                    webhook._logger.warn("WebhookServer: malformed update: %s" % repr(e))
+                    self.send_error(400)
+                    return
+                self.send_response(200 if accepted else 503)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _process(self, queue):
+        while True:
+            batch = [queue.get()]
+            try:
+                while len(batch) < self._batch_size:
+                    batch.append(queue.get_nowait())
+            except Empty:
+                pass
+
+            stopped = None in batch
+            updates = [update for update in batch if update is not None]
+            for update in updates:
+                with UPDATE_SECONDS.time():
+                    try:
+                        self._dispatcher.process_update(update)
+                    except Exception as e:
+                        self._logger.warn("WebhookServer: update %d failed: %s" % (update.update_id, repr(e)))
+            with self._lock:
+                self._processed += len(updates)
+            if stopped:
+                return
+
+
+class _ReceiverServer(ThreadingHTTPServer):
+    """
+    Does the TLS handshake in the request thread, so a slow client does not hold up accepting
+    """
+
+    ssl_context = None
+
+    def finish_request(self, request, client_address):
+        if self.ssl_context is not None:
+            try:
+                request = self.ssl_context.wrap_socket(request, server_side=True)
+            except (ssl.SSLError, OSError):
+                return  # the failed handshake is not worth a traceback, the socket is closed by the caller
+        super().finish_request(request, client_address)
@@ -0,0 +1,94 @@
+import datetime
+import json
+import unittest
+from time import time
+
+from src.AlertEngine import AlertEngine, AlertRule, ThresholdRule, RateRule, SilenceRule
+from src.SlaveState import SlaveState
+
+
+class AlertEngineTest(unittest.TestCase):
+
+    def setUp(self):
+        self._now = datetime.datetime.now()
+        self._events = []
+        self._sut = AlertEngine()
+        self._sut.add_listener(self._events.append)
+
+    def _make_state(self, metrics, seconds_ago=0, slave_nickname="slave1"):
+        return SlaveState(slave_nickname, json.dumps({"state": "ok", "sent_at": "", "alerts": [],
+                                                      "metrics": metrics}),
+                          self._now - datetime.timedelta(seconds=seconds_ago))
+
+    def testIncompleteRuleIsRejected(self):
+        class UndescribedRule(AlertRule):
+            pass
+
+        with self.assertRaises(TypeError):
+            UndescribedRule()
+
+    def testThresholdIsEdgeTriggered(self):
+        self._sut.add_rule("slave1", ThresholdRule("T", above=1.5))
+
+        for value in [1, 2, 3, 2.5, 1, 0.5, 2]:
+            self._sut.on_update(self._make_state({"T": value}))
+
+        self.assertListEqual([event.fired for event in self._events], [True, False, True])
+        self.assertEqual(self._events[0].slave_nickname, "slave1")
+        self.assertIn("Alert! T above 1.5 (2)", self._events[0].get_message())
+        self.assertIn("Resolved: T above 1.5 (1)", self._events[1].get_message())
+        self.assertListEqual(self._sut.get_active_alerts("slave1"), ["T above 1.5"])
+
+    def testRulesArePerSlave(self):
+        self._sut.add_rule("slave1", ThresholdRule("T", below=0))
+
+        self._sut.on_update(self._make_state({"T": -1}, slave_nickname="slave2"))
+        self._sut.on_update(self._make_state({"P": -1}))
+        self.assertListEqual(self._events, [])
+
+        self._sut.on_update(self._make_state({"T": -1}))
+        self.assertEqual(len(self._events), 1)
+        self.assertListEqual(self._sut.get_active_alerts("slave2"), [])
+
+    def testRate(self):
+        self._sut.add_rule("slave1", RateRule("P", max_rate=0.5))
+
+        self._sut.on_update(self._make_state({"P": 0}, seconds_ago=30))
+        self._sut.on_update(self._make_state({"P": 5}, seconds_ago=20))
+        self.assertListEqual(self._events, [])
+
+        self._sut.on_update(self._make_state({"P": 15}, seconds_ago=10))
+        self._sut.on_update(self._make_state({"P": 30}, seconds_ago=0))
+        self.assertEqual(len(self._events), 1)
+        self.assertTrue(self._events[0].fired)
+        self.assertAlmostEqual(self._events[0].value, 1)
+
+        self._sut.on_update(self._make_state({"P": 20}, seconds_ago=-100))
+        self.assertFalse(self._events[-1].fired)
+
+    def testSilence(self):
+        self._sut.add_rule("slave1", SilenceRule(60))
+        self._sut.on_update(self._make_state({}))
+
+        self._sut.check_silence(time() + 30)
+        self.assertListEqual(self._events, [])
+
+        self._sut.check_silence(time() + 61)
+        self._sut.check_silence(time() + 120)
+        self.assertListEqual([event.fired for event in self._events], [True])
+
+        self._sut.touch("slave1")
+        self.assertListEqual([event.fired for event in self._events], [True, False])
+
+    def testLoadRules(self):
+        self._sut.load_rules({"slave1": [{"type": "threshold", "metric": "T", "above": 1.5},
+                                         {"type": "rate", "metric": "P", "max_rate": 0.1},
+                                         {"type": "silence", "seconds": 120}]})
+
+        self._sut.on_update(self._make_state({"T": 2}))
+        self._sut.check_silence(time() + 121)
+        self.assertCountEqual(self._sut.get_active_alerts("slave1"),
+                              ["T above 1.5", "no updates for 120 s"])
+
+        with self.assertRaises(KeyError):
+            self._sut.load_rules({"slave1": [{"type": "unknown"}]})
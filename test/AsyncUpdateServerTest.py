@@ -0,0 +1,103 @@
+import socket
+import time
+import unittest
+from hashlib import md5
+from unittest.mock import MagicMock
+
+from loggingserver import LoggingServer
+
+from src.AsyncUpdateServer import AsyncUpdateServer
+from test.SlaveLoadGenerator import SlaveLoadGenerator
+from test.SlaveMock import SlaveMock
+
+
+class AsyncUpdateServerTest(unittest.TestCase):
+
+    def setUp(self):
+        LoggingServer.getInstance("overseer", test=True)
+
+        self._db_operator = MagicMock()
+        self._db_operator.get_slave = MagicMock(return_value=SlaveMock(password=md5("testpass".encode()).hexdigest()))
+
+        self._sut = AsyncUpdateServer(None, self._db_operator, port=0)
+        self._sut._host = "127.0.0.1"
+        self._sut.launch()
+
+    def tearDown(self):
+        self._sut.stop()
+
+    def _wait_for(self, condition, timeout=10):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(.01)
+        return condition()
+
+    def testManyConcurrentSlaves(self):
+        slaves_count = 1000
+        generator = SlaveLoadGenerator("127.0.0.1", self._sut.get_port(), slaves_count)
+
+        connections = []
+        replies = generator.run(lambda: connections.append(self._sut.get_connections_count()))
+
+        self.assertListEqual(replies, ["slave%d" % i for i in range(slaves_count)])
+        self.assertEqual(connections, [slaves_count])
+        self.assertTrue(self._wait_for(lambda: len(self._sut._latest_states) == slaves_count))
+        self.assertEqual(self._sut.get_latest_state("slave42").get_raw_message(), "state 0 of slave42")
+        self.assertTrue(self._wait_for(lambda: self._sut.get_connections_count() == 0))
+
+    def testStopClosesConnections(self):
+        connections = [socket.create_connection(("127.0.0.1", self._sut.get_port())) for _ in range(10)]
+        for i, connection in enumerate(connections):
+            connection.send(("slave%d\r\ntestpass" % i).encode())
+            self.assertEqual(connection.recv(1024), ("slave%d" % i).encode())
+        self.assertTrue(self._wait_for(lambda: self._sut.get_connections_count() == 10))
+
+        self._sut.stop()
+
+        for connection in connections:
+            connection.settimeout(5)
+            self.assertEqual(connection.recv(1024), b"")
+            connection.close()
+        self.assertTrue(self._wait_for(lambda: self._sut._loop.is_closed()))
+        self.assertEqual(self._sut.get_connections_count(), 0)
+        self.assertSetEqual(self._sut._connection_tasks, set())
+
+    def testUpdatesAreStored(self):
+        generator = SlaveLoadGenerator("127.0.0.1", self._sut.get_port(), 10,
+                                       updates_per_slave=3, update_interval=.05, framed=True)
+        generator.run()
+
+        for i in range(10):
+            self.assertTrue(self._wait_for(lambda: self._sut.get_state_version("slave%d" % i) == 3))
+            self.assertEqual(self._sut.get_latest_state("slave%d" % i).get_raw_message(),
+                             "state 2 of slave%d" % i)
+
+    def testWrongPassword(self):
+        generator = SlaveLoadGenerator("127.0.0.1", self._sut.get_port(), 5, password="wrong")
+
+        replies = generator.run()
+
+        self.assertListEqual(replies, ["Authentication failed: Wrong username/password!"] * 5)
+        self.assertDictEqual(self._sut._latest_states, {})
+
+    def testFramedLargeStates(self):
+        generator = SlaveLoadGenerator("127.0.0.1", self._sut.get_port(), 20, updates_per_slave=5,
+                                       update_interval=0, state_size=100000, framed=True)
+        replies = generator.run()
+
+        self.assertListEqual(replies, ["slave%d\r\nframed/1" % i for i in range(20)])
+        for i in range(20):
+            self.assertTrue(self._wait_for(lambda: self._sut.get_state_version("slave%d" % i) == 5))
+            self.assertEqual(self._sut.get_latest_state("slave%d" % i).get_raw_message(),
+                             generator.make_state(4, i))
+
+    def testSilentSlavesAreDropped(self):
+        self._sut._read_timeout = .2
+        generator = SlaveLoadGenerator("127.0.0.1", self._sut.get_port(), 10)
+
+        generator.run(lambda: time.sleep(1))
+
+        self.assertEqual(self._sut.get_connections_count(), 0)
+        for i in range(10):
+            self.assertFalse(self._sut.get_liveness().is_online("slave%d" % i))
+            self.assertTrue(self._sut.get_latest_state("slave%d" % i).is_stale())
@@ -0,0 +1,84 @@
+import time
+import unittest
+from threading import Event
+from unittest.mock import MagicMock
+
+from loggingserver import LoggingServer
+
+from src.BatchWriter import BatchWriter, OverflowPolicy
+
+
+class BatchWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        LoggingServer.getInstance("overseer", test=True)
+        self._batches = []
+
+    def _wait_for(self, condition, timeout=5):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(.01)
+        return condition()
+
+    def testBatchBySize(self):
+        sut = BatchWriter(self._batches.append, batch_size=10, flush_interval=100)
+        sut.launch()
+
+        for i in range(25):
+            sut.put(i)
+
+        self.assertTrue(self._wait_for(lambda: len(self._batches) == 2))
+        self.assertListEqual(self._batches, [list(range(10)), list(range(10, 20))])
+
+        sut.stop()  # the rest is flushed on stop
+        self.assertListEqual(self._batches[2], list(range(20, 25)))
+        self.assertEqual(sut.get_stats(), {"queued": 0, "written": 25, "dropped": 0, "failed": 0})
+
+    def testBatchByTime(self):
+        sut = BatchWriter(self._batches.append, batch_size=100, flush_interval=.1)
+        sut.launch()
+
+        sut.put(1)
+        sut.put(2)
+
+        self.assertTrue(self._wait_for(lambda: len(self._batches) == 1))
+        self.assertListEqual(self._batches, [[1, 2]])
+        sut.stop()
+
+    def testDropPolicy(self):
+        sut = BatchWriter(self._batches.append, max_queue_size=3, overflow_policy=OverflowPolicy.DROP)
+
+        for i in range(5):
+            sut.put(i)
+
+        self.assertEqual(sut.get_stats()["dropped"], 2)
+        sut.flush()
+        self.assertListEqual(self._batches, [[0, 1, 2]])
+
+    def testBlockPolicy(self):
+        release = Event()
+
+        def slow_write(batch):
+            release.wait()
+            self._batches.append(batch)
+
+        sut = BatchWriter(slow_write, batch_size=1, flush_interval=.01, max_queue_size=1,
+                          overflow_policy=OverflowPolicy.BLOCK)
+        sut.launch()
+        for i in range(2):
+            sut.put(i)  # first one is being written, second one is queued
+
+        started = time.time()
+        release.set()
+        sut.put(2)  # blocks until the writer frees the queue
+        sut.stop()
+
+        self.assertLess(time.time() - started, 1)
+        self.assertListEqual(self._batches, [[0], [1], [2]])
+
+    def testFailedWrite(self):
+        sut = BatchWriter(MagicMock(side_effect=ValueError("DB is down")))
+        sut.put(1)
+        sut.flush()
+
+        self.assertEqual(sut.get_stats(), {"queued": 0, "written": 0, "dropped": 0, "failed": 1})
@@ -3,14 +3,17 @@ import itertools
 import time
 from random import shuffle, randint
 import unittest
-from unittest.mock import Mock, call, MagicMock
+from unittest.mock import Mock, call, MagicMock, ANY
 
 from telegram import ParseMode, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.error import BadRequest
 
+from src.AlertEngine import AlertEvent
 from src.Broadcaster import Broadcaster
 from src.DBOperator import DBOperator
 from loggingserver import LoggingServer
 
+from src.SendScheduler import SendScheduler
 from src.SlaveState import SlaveState
 from test.SlaveMock import SlaveMock
 from test.UserMock import UserMock
@@ -65,8 +68,15 @@ class BroadcasterTest(unittest.TestCase):
             for slave in slaves_monitored:
                 self._db_operator.subscribe(user.id, slave.nickname, randint(0, 100))
 
+        self._send_scheduler = SendScheduler(workers=32, global_rate=1000, global_burst=1000,
+                                             chat_rate=1000, chat_burst=1000)
+        self._send_scheduler.launch()
+
         self._sut = Broadcaster(self._telegram_updater, self._update_server,
-                                self._db_operator)
+                                self._db_operator, send_scheduler=self._send_scheduler)
+
+    def tearDown(self):
+        self._send_scheduler.stop()
 
     def testBroadcastUpdates(self):
 
@@ -76,6 +86,7 @@ class BroadcasterTest(unittest.TestCase):
         self._telegram_updater.bot.edit_message_text = Mock(side_effect=wait)
 
         self._sut._broadcast_updates()
+        self.assertTrue(self._send_scheduler.wait_idle(10))
 
         for user in self._users:
             subs = self._db_operator.get_subscriptions(user.id)
@@ -88,22 +99,141 @@ class BroadcasterTest(unittest.TestCase):
                     edit_message_text.assert_has_calls([call(*args,
                                                              parse_mode=ParseMode.MARKDOWN)])
 
-                alerts = state.get_alerts()
-
+                alerts = [alert for alert in state.get_alerts() if alert != ""]
                 reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("OK",
                                                                            callback_data="OK")]])
-                for alert in alerts:
-                    args = user.id, state.get_alert_message(alert)
-
-                    if alert != "":
-                        self._telegram_updater.bot. \
-                            send_message.assert_has_calls([call(*args,
-                                                                parse_mode=ParseMode.MARKDOWN,
-                                                                reply_markup=reply_markup)])
-                    else:
-                        unexpected_call = call(*args,
-                                               parse_mode=ParseMode.MARKDOWN,
-                                               reply_markup=reply_markup)
-                        calls = self._telegram_updater.bot.send_message.mock_calls
-
-                        self.assertNotIn(unexpected_call, calls)
+                expected_call = call(user.id, state.get_alerts_message(alerts),
+                                     parse_mode=ParseMode.MARKDOWN, reply_markup=reply_markup)
+                if alerts:
+                    self._telegram_updater.bot.send_message.assert_has_calls([expected_call])
+                else:
+                    self.assertNotIn(expected_call, self._telegram_updater.bot.send_message.mock_calls)
+
+        expected_alert_messages = len([sub for user in self._users
+                                       for sub in self._db_operator.get_subscriptions(user.id)
+                                       if self._slave_states[sub[0]].get_alerts() != ""])
+        self.assertEqual(self._telegram_updater.bot.send_message.call_count, expected_alert_messages)
+
+    def testAlertsAreShownOnce(self):
+        slave_nickname = "slave1"
+        self._db_operator.subscribe(self._users[0].id, slave_nickname, 1)
+        subscribers = self._db_operator.get_subscription_index().get_subscribers(slave_nickname)
+
+        self._sut._broadcast_updates({slave_nickname})
+        self._sut._broadcast_updates({slave_nickname})
+        self.assertTrue(self._send_scheduler.wait_idle(10))
+        self.assertEqual(self._telegram_updater.bot.send_message.call_count, len(subscribers))
+        self._sut._alert_ledger.flush()  # done by the broadcast loop after the alerts were delivered
+
+        # the ledger survives a restart
+        restarted = Broadcaster(self._telegram_updater, self._update_server,
+                                DBOperator("overseer_test", "inlatexbot", "inlatexbot"),
+                                send_scheduler=self._send_scheduler)
+        restarted._broadcast_updates({slave_nickname})
+        self.assertTrue(self._send_scheduler.wait_idle(10))
+        self.assertEqual(self._telegram_updater.bot.send_message.call_count, len(subscribers))
+
+        state = SlaveState(slave_nickname, '{"state":"", "sent_at":"", '
+                                           '"alerts":["SLAVE died", "SLAVE on fire", "SLAVE melted"]}')
+        self._slave_states[slave_nickname] = state
+        restarted._broadcast_updates({slave_nickname})
+        self.assertTrue(self._send_scheduler.wait_idle(10))
+        for telegram_id, info_message_id in subscribers:
+            self._telegram_updater.bot.send_message.assert_has_calls(
+                [call(telegram_id, state.get_alerts_message(["SLAVE on fire", "SLAVE melted"]),
+                      parse_mode=ParseMode.MARKDOWN, reply_markup=ANY)])
+        self.assertEqual(self._telegram_updater.bot.send_message.call_count, 2 * len(subscribers))
+
+    def testFailedAlertsAreShownAgain(self):
+        slave_nickname = "slave1"
+        self._db_operator.subscribe(self._users[0].id, slave_nickname, 1)
+        subscribers = self._db_operator.get_subscription_index().get_subscribers(slave_nickname)
+
+        self._telegram_updater.bot.send_message.side_effect = BadRequest("Chat not found")
+        self._sut._broadcast_updates({slave_nickname})
+        self.assertTrue(self._send_scheduler.wait_idle(10))
+        self.assertEqual(self._telegram_updater.bot.send_message.call_count, len(subscribers))
+
+        self._telegram_updater.bot.send_message.side_effect = None
+        self._sut._broadcast_updates({slave_nickname})
+        self._sut._broadcast_updates({slave_nickname})
+        self.assertTrue(self._send_scheduler.wait_idle(10))
+        self.assertEqual(self._telegram_updater.bot.send_message.call_count, 2 * len(subscribers))
+
+    def testBroadcastChangedSlavesOnly(self):
+        self._sut._broadcast_updates({"slave1"})
+        self.assertTrue(self._send_scheduler.wait_idle(10))
+
+        self._update_server.get_latest_state.assert_called_once_with("slave1")  # rendered once for all
+
+        expected_calls = len([sub for user in self._users
+                              for sub in self._db_operator.get_subscriptions(user.id)
+                              if sub[0] == "slave1"])
+        self.assertEqual(self._telegram_updater.bot.edit_message_text.call_count, expected_calls)
+
+    def testChangesAreCoalesced(self):
+        self._update_server.add_state_listener.assert_called_with(self._sut.request_update)
+
+        self._sut._min_push_interval = 100
+        self._sut.request_update("slave1")
+        self._sut.request_update("slave2")
+        self._sut.request_update("slave1")
+
+        self._sut._wait_for_changes()
+        self.assertEqual(self._sut._pop_due_slaves(), {"slave1", "slave2"})
+
+        self._sut.request_update("slave1")
+        self._sut.request_update("slave3")
+        self._sut._wait_for_changes()
+        self.assertEqual(self._sut._pop_due_slaves(), {"slave3"})  # slave1 has to wait
+        self.assertEqual(self._sut._dirty_slaves, {"slave1"})
+
+        self._sut._next_push_times["slave1"] = 0
+        self.assertEqual(self._sut._pop_due_slaves(), {"slave1"})
+
+    def testServerAlertsAreSentToSubscribers(self):
+        self._update_server.get_alert_engine().add_listener.assert_called_with(self._sut._on_alert)
+
+        event = AlertEvent("slave1", "T above 1.5", True, 2, datetime.datetime.now())
+        self._sut._on_alert(event)
+        self.assertTrue(self._send_scheduler.wait_idle(10))
+
+        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("OK", callback_data="OK")]])
+        subscribers = self._db_operator.get_subscription_index().get_subscribers("slave1")
+        self.assertEqual(self._telegram_updater.bot.send_message.call_count, len(subscribers))
+        for telegram_id, info_message_id in subscribers:
+            self._telegram_updater.bot.send_message.assert_has_calls(
+                [call(telegram_id, event.get_message(), parse_mode=ParseMode.MARKDOWN,
+                      reply_markup=reply_markup)])
+
+    def testOfflineNotice(self):
+        self._update_server.get_liveness().add_listener.assert_called_with(self._sut._on_liveness_change)
+        self._db_operator.subscribe(self._users[0].id, "slave1", 1)
+        subscribers = self._db_operator.get_subscription_index().get_subscribers("slave1")
+        send_message = self._telegram_updater.bot.send_message
+
+        self._sut._on_liveness_change("slave1", True)
+        self._sut._on_liveness_change("slave1", False)
+        self.assertEqual(self._sut._changes.qsize(), 2)
+        self._sut._send_offline_notices(time.time() + 30)
+        self._sut._on_liveness_change("slave1", True)  # a blip, nobody is told
+        self._sut._send_offline_notices(time.time() + 60)
+        self.assertTrue(self._send_scheduler.wait_idle(10))
+        send_message.assert_not_called()
+
+        for i in range(3):  # every connection of the slave is dropped
+            self._sut._on_liveness_change("slave1", False)
+            self._sut._send_offline_notices(time.time() + 60)
+        self.assertTrue(self._send_scheduler.wait_idle(10))
+        self.assertCountEqual(send_message.call_args_list,
+                              [call(telegram_id, "Slave slave1 went offline!", reply_markup=ANY)
+                               for telegram_id, info_message_id in subscribers])
+        self.assertIn((self._users[0].id, "slave1", [], True), self._db_operator.get_alert_ledger())
+
+        send_message.reset_mock()
+        self._sut._on_liveness_change("slave1", True)
+        self._sut._on_liveness_change("slave1", True)
+        self.assertTrue(self._send_scheduler.wait_idle(10))
+        self.assertCountEqual(send_message.call_args_list,
+                              [call(telegram_id, "Slave slave1 is back online", reply_markup=ANY)
+                               for telegram_id, info_message_id in subscribers])
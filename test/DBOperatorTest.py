@@ -1,12 +1,16 @@
+import datetime
 import unittest
+from concurrent.futures import ThreadPoolExecutor
 from unittest.mock import Mock, MagicMock
 import psycopg2
 from psycopg2._psycopg import ProgrammingError
 from hashlib import md5
 
 
-from src.DBOperator import DBOperator
+from src.DBOperator import DBOperator, MetricPoint
+from src.PasswordHashing import verify_password, SCRYPT
 from src.ResourceManager import ResourceManager
+from src.SlaveState import SlaveState
 from test.MessageMock import MessageMock
 from test.SlaveMock import SlaveMock
 from test.UserMock import UserMock
@@ -29,7 +33,8 @@ class DBOperatorTest(unittest.TestCase):
         db_operator = DBOperator("overseer_test", "inlatexbot", "inlatexbot")
         # db_operator = self._sut
         try:
-            db_operator._c.execute("INVALID_TRANSACTION")
+            with db_operator._cursor() as c:
+                c.execute("INVALID_TRANSACTION")
         except ProgrammingError:
             pass
 
@@ -150,6 +155,25 @@ class DBOperatorTest(unittest.TestCase):
         else:
             assert False
 
+    def testSlowPasswordHashes(self):
+        sut = DBOperator("overseer_test", "inlatexbot", "inlatexbot", password_scheme=SCRYPT)
+        listener = MagicMock()
+        sut.add_slave_listener(listener)
+
+        slave = SlaveMock()
+        sut.add_slave(slave)
+        slave.password = "11ge!"
+        sut.update_slave(slave)
+
+        stored_hash = sut.get_slave(slave.nickname).slave_password
+        self.assertTrue(stored_hash.startswith("scrypt1$"))
+        self.assertTrue(verify_password("11ge!", stored_hash))
+        listener.assert_called_with(slave.nickname)
+        self.assertEqual(listener.call_count, 2)
+
+        with self.assertRaises(ValueError):
+            sut.get_slave("x' OR '1'='1")
+
     def testSubscribe(self):
 
         telegram_id = 123459
@@ -249,6 +273,99 @@ class DBOperatorTest(unittest.TestCase):
         self.assertListEqual(self._sut.get_subscriptions(user1.id), [(slave1.nickname, 1), (slave2.nickname, 2)])
         self.assertListEqual(self._sut.get_subscriptions(user2.id), [(slave1.nickname, 3), (slave2.nickname, 4)])
 
+    def testGetAllSubscriptions(self):
+        user1 = UserMock()
+        user2 = UserMock(123460, full_name="Joe Marti", nickname="@pidr")
+        user3 = UserMock(123461, full_name="Rob Shel", nickname="@RShel")
+
+        for user in [user1, user2, user3]:
+            self._sut.add_user(user)
+        self._sut.add_slave(SlaveMock())
+        self._sut.add_slave(SlaveMock("slave2"))
+
+        self._sut.subscribe(user1.id, "slave1", 1)
+        self._sut.subscribe(user1.id, "slave2", 2)
+        self._sut.subscribe(user2.id, "slave2", 3)
+
+        subs = list(self._sut.get_all_subscriptions(itersize=1))
+
+        self.assertCountEqual(subs, [(user1.id, "slave1", 1),
+                                     (user1.id, "slave2", 2),
+                                     (user2.id, "slave2", 3)])
+        self.assertEqual(subs[0].telegram_id, subs[0][0])
+
+    def testAlertLedger(self):
+        user = UserMock()
+        self._sut.add_user(user)
+        self._sut.add_slave(SlaveMock())
+        self._sut.add_slave(SlaveMock("slave2"))
+
+        self._sut.save_alert_ledger([(user.id, "slave1", ["SLAVE failing", "SLAVE died"], False),
+                                     (user.id, "slave2", [], True)])
+        self._sut.save_alert_ledger([(user.id, "slave1", ["SLAVE died"], True),
+                                     (user.id, "slave3", ["no such slave"], False)])
+
+        self.assertCountEqual(self._sut.get_alert_ledger(), [(user.id, "slave1", ["SLAVE died"], True),
+                                                             (user.id, "slave2", [], True)])
+
+    def testSlaveStates(self):
+        start = datetime.datetime(2020, 1, 1)
+        states = [SlaveState("slave1", '{"state": "a,\\"b\\"\\nc\\td"}', start),
+                  SlaveState("slave1", b"not utf-8 \xff\x00", start + datetime.timedelta(seconds=30)),
+                  SlaveState("slave2", "other", start + datetime.timedelta(seconds=30)),
+                  SlaveState("slave1", "latest", start + datetime.timedelta(seconds=90))]
+
+        self._sut.add_slave_states(states)
+
+        self.assertListEqual(self._sut.get_slave_states("slave1", start), [states[0], states[1], states[3]])
+        self.assertListEqual(self._sut.get_slave_states("slave1", start + datetime.timedelta(seconds=1),
+                                                        start + datetime.timedelta(seconds=90)), [states[1]])
+
+        self.assertEqual(self._sut.downsample_slave_states(start + datetime.timedelta(minutes=5), 60), 1)
+        self.assertEqual(self._sut.downsample_slave_states(start + datetime.timedelta(minutes=5), 60), 0)
+        self.assertListEqual(self._sut.get_slave_states("slave1", start), [states[0], states[3]])
+        self.assertListEqual(self._sut.get_slave_states("slave2", start), [states[2]])
+
+        self.assertEqual(self._sut.delete_slave_states(start + datetime.timedelta(seconds=60)), 2)
+        self.assertListEqual(self._sut.get_slave_states("slave1", start), [states[3]])
+
+    def testMetricRollups(self):
+        start = datetime.datetime(2020, 1, 1)
+
+        def make_state(seconds, temperature):
+            return SlaveState("slave1", '{"state":"", "sent_at":"", "alerts":[], "metrics":{"T":%f, "P":1}}'
+                              % temperature, start + datetime.timedelta(seconds=seconds))
+
+        states = [make_state(0, 1), make_state(30, 3), make_state(90, 5), make_state(3700, 7)]
+        self._sut.add_slave_states(states)
+        self._sut.add_metric_rollups(states[:1])
+        self._sut.add_metric_rollups(states[1:])  # merged into the existing rollups
+
+        self.assertListEqual(self._sut.get_metric_series("slave1", "T", start),
+                             [MetricPoint(state.get_received_at(), value, value, value)
+                              for state, value in zip(states, [1, 3, 5, 7])])
+        self.assertListEqual(self._sut.get_metric_series("slave1", "T", start, resolution=60),
+                             [MetricPoint(start, 1, 3, 2),
+                              MetricPoint(start + datetime.timedelta(minutes=1), 5, 5, 5),
+                              MetricPoint(start + datetime.timedelta(minutes=61), 7, 7, 7)])
+        self.assertListEqual(self._sut.get_metric_series("slave1", "T", start, resolution=600),
+                             [MetricPoint(start, 1, 5, 3),
+                              MetricPoint(start + datetime.timedelta(minutes=60), 7, 7, 7)])
+        self.assertListEqual(self._sut.get_metric_series("slave1", "T", start, resolution=7200),
+                             [MetricPoint(start, 1, 7, 4)])
+        self.assertListEqual(self._sut.get_metric_series("slave1", "T", start + datetime.timedelta(minutes=30),
+                                                         resolution=3600),
+                             [MetricPoint(start + datetime.timedelta(minutes=60), 7, 7, 7)])
+        self.assertListEqual(self._sut.get_metric_series("slave1", "T", start + datetime.timedelta(seconds=30),
+                                                         resolution=60),
+                             [MetricPoint(start + datetime.timedelta(minutes=1), 5, 5, 5),
+                              MetricPoint(start + datetime.timedelta(minutes=61), 7, 7, 7)])
+        self.assertListEqual(self._sut.get_metric_series("slave1", "P", start, resolution=3600),
+                             [MetricPoint(start, 1, 1, 1), MetricPoint(start + datetime.timedelta(minutes=60), 1, 1, 1)])
+
+        self.assertEqual(self._sut.delete_metric_rollups(60, start + datetime.timedelta(minutes=30)), 4)
+        self.assertEqual(len(self._sut.get_metric_series("slave1", "T", start, resolution=60)), 1)
+
     def testAddMessage(self):
 
         telegram_id = 123456
@@ -265,3 +382,36 @@ class DBOperatorTest(unittest.TestCase):
         self.assertEqual(message_repr[3], "@lox")
         self.assertEqual(message_repr[4], message.date)
         self.assertEqual(message_repr[5], md5("I am a lox".encode()).hexdigest())
+
+    def testConcurrentAccess(self):
+        sut = DBOperator("overseer_test", "inlatexbot", "inlatexbot", pool_size=4)
+        threads_count, iterations = 16, 20
+
+        for i in range(threads_count):
+            sut.add_user(UserMock(1000 + i))
+            sut.add_slave(SlaveMock("slave%d" % i))
+
+        def hammer(i):
+            telegram_id = 1000 + i
+            for j in range(iterations):
+                slave_nickname = "slave%d" % ((i + j) % threads_count)
+                sut.subscribe(telegram_id, slave_nickname, j)
+                self.assertEqual(sut.get_slave(slave_nickname).slave_nickname, slave_nickname)
+                sut.add_message(MessageMock(telegram_id, message_id=j))
+            return telegram_id
+
+        with ThreadPoolExecutor(max_workers=threads_count) as executor:
+            telegram_ids = list(executor.map(hammer, range(threads_count)))
+
+        for i, telegram_id in enumerate(telegram_ids):
+            self.assertEqual(len(self._sut.get_messages(telegram_id)), iterations)
+            subs = self._sut.get_subscriptions(telegram_id)
+            self.assertEqual(len(subs), min(iterations, threads_count))
+            self.assertIn(("slave%d" % ((i + iterations - 1) % threads_count), iterations - 1), subs)
+
+        stats = sut.get_pool_stats()
+        self.assertEqual(stats["size"], 4)
+        self.assertEqual(stats["in_use"], 0)
+        self.assertGreaterEqual(stats["acquired"], threads_count * iterations * 3)
+        self.assertGreaterEqual(stats["max_wait"], stats["mean_wait"])
+        sut.close()
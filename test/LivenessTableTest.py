@@ -0,0 +1,47 @@
+import unittest
+
+from src.LivenessTable import LivenessTable
+
+
+class LivenessTableTest(unittest.TestCase):
+
+    def setUp(self):
+        self._transitions = []
+        self._sut = LivenessTable(offline_after=60)
+        self._sut.add_listener(lambda slave_nickname, online: self._transitions.append((slave_nickname, online)))
+
+    def testSilenceTakesOffline(self):
+        self._sut.on_connect("slave1")
+        for second in range(0, 100, 10):
+            self._sut.on_message("slave1", now=1000 + second)
+        self._sut.on_message("slave2", now=1000)
+
+        self.assertListEqual(self._sut.check(now=1095), ["slave2"])
+        self.assertListEqual(self._sut.check(now=1100), [])
+        self.assertListEqual(self._sut.check(now=1200), ["slave1"])
+        self._sut.on_message("slave2", now=1300)
+
+        self.assertListEqual(self._transitions, [("slave1", True), ("slave2", True), ("slave2", False),
+                                                 ("slave1", False), ("slave2", True)])
+
+        liveness = self._sut.get_liveness("slave1")
+        self.assertEqual(liveness["last_seen"], 1090)
+        self.assertAlmostEqual(liveness["rate"], 0.1)
+        self.assertEqual(liveness["messages"], 10)
+        self.assertEqual(liveness["connections"], 1)
+        self.assertFalse(liveness["online"])
+        self.assertIsNone(self._sut.get_liveness("slave3"))
+
+    def testLastConnectionClosed(self):
+        self._sut.on_connect("slave1")
+        self._sut.on_connect("slave1")
+        self._sut.on_message("slave1")
+
+        self._sut.on_disconnect("slave1")
+        self.assertTrue(self._sut.is_online("slave1"))
+        self._sut.on_disconnect("slave1")
+        self.assertFalse(self._sut.is_online("slave1"))
+        self._sut.on_disconnect("slave1")
+
+        self.assertListEqual(self._transitions, [("slave1", True), ("slave1", False)])
+        self.assertEqual(self._sut.get_liveness("slave1")["connections"], 0)
@@ -0,0 +1,68 @@
+import unittest
+from unittest.mock import Mock
+
+from loggingserver import LoggingServer
+from telegram.error import BadRequest
+
+from src.DBOperator import DBOperator
+from src.MediaCache import MediaCache
+
+
+class MediaCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        LoggingServer.getInstance("overseer", test=True)
+        self._db_operator = DBOperator("overseer_test", "inlatexbot", "inlatexbot", drop_key="r4jYi1@")
+        self._sut = MediaCache(self._db_operator, cache_size=2)
+
+        self._file_ids = iter(range(100))
+        self._bot = Mock()
+        self._bot.send_photo = Mock(side_effect=self._send_photo)
+
+    def tearDown(self):
+        self._db_operator.close()
+
+    def _send_photo(self, chat_id, photo, **kwargs):
+        if isinstance(photo, str):
+            return Mock(photo=[Mock(file_id=photo)])
+        return Mock(photo=[Mock(file_id="thumbnail"), Mock(file_id="file%d" % next(self._file_ids))])
+
+    def _get_sent(self):
+        return [photo if isinstance(photo, str) else photo.read() for (chat_id, photo), kwargs
+                in self._bot.send_photo.call_args_list]
+
+    def testUploadedOnce(self):
+        self._sut.send_photo(self._bot, 1, b"scheme", caption="scheme")
+        self._sut.send_photo(self._bot, 2, b"scheme", caption="scheme")
+        MediaCache(self._db_operator).send_photo(self._bot, 3, b"scheme")
+
+        self.assertListEqual(self._get_sent(), [b"scheme", "file0", "file0"])
+        self.assertEqual(self._bot.send_photo.call_args_list[1][1], {"caption": "scheme"})
+        self.assertEqual(self._sut.get_stats(), {"persistent": 1, "transient": 0, "uploads": 1, "reuses": 1})
+
+    def testTransientPhotos(self):
+        for photo in [b"plot1", b"plot2", b"plot1", b"plot3", b"plot2"]:
+            self._sut.send_photo(self._bot, 1, photo, persist=False)
+
+        self.assertListEqual(self._get_sent(), [b"plot1", b"plot2", "file0", b"plot3", b"plot2"])
+        self.assertListEqual(self._db_operator.get_media_files(), [])
+
+    def testRejectedFileIdIsUploadedAgain(self):
+        self._sut.send_photo(self._bot, 1, b"scheme")
+        self._bot.send_photo.side_effect = [BadRequest("Wrong file identifier"), Mock(photo=[Mock(file_id="new")])]
+
+        self._sut.send_photo(self._bot, 1, b"scheme")
+
+        self.assertListEqual(self._get_sent(), [b"scheme", "file0", b"scheme"])
+        self.assertEqual([file_id for content_hash, file_id in self._db_operator.get_media_files()], ["new"])
+
+    def testOtherErrorsKeepFileId(self):
+        self._sut.send_photo(self._bot, 1, b"scheme")
+        self._bot.send_photo.side_effect = BadRequest("Chat not found")
+
+        with self.assertRaises(BadRequest):
+            self._sut.send_photo(self._bot, 2, b"scheme")
+
+        self.assertListEqual(self._get_sent(), [b"scheme", "file0"])
+        self.assertEqual([file_id for content_hash, file_id in self._db_operator.get_media_files()], ["file0"])
+        self.assertEqual(self._sut.get_stats()["persistent"], 1)
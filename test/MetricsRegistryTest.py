@@ -0,0 +1,77 @@
+import unittest
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+from src.MetricsRegistry import MetricsRegistry, MetricsServer, timed
+
+
+class MetricsRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self._sut = MetricsRegistry()
+
+    def testCountersAndGauges(self):
+        counter = self._sut.counter("test_total", "Test counter", ["kind"])
+        counter.inc("a")
+        counter.inc("a", amount=2)
+        counter.inc('b"')
+        gauge = self._sut.gauge("test_gauge", "Test gauge")
+        gauge.set_function(lambda: 42)
+
+        self.assertIs(self._sut.counter("test_total", "Test counter", ["kind"]), counter)
+        self.assertEqual(counter.get("a"), 3)
+        self.assertEqual(self._sut.render(),
+                         "# HELP test_total Test counter\n"
+                         "# TYPE test_total counter\n"
+                         'test_total{kind="a"} 3.0\n'
+                         'test_total{kind="b\\""} 1.0\n'
+                         "# HELP test_gauge Test gauge\n"
+                         "# TYPE test_gauge gauge\n"
+                         "test_gauge 42.0\n")
+
+    def testRegisteredDifferently(self):
+        self._sut.counter("test_total", "Test counter", ["kind"])
+
+        with self.assertRaises(ValueError):
+            self._sut.gauge("test_total", "Test counter", ["kind"])
+        with self.assertRaises(ValueError):
+            self._sut.counter("test_total", "Test counter")
+
+    def testHistogram(self):
+        histogram = self._sut.histogram("test_seconds", "Test histogram", ["method"], buckets=(.1, 1))
+        histogram.observe(.05, "get")
+        histogram.observe(.1, "get")
+        histogram.observe(.5, "get")
+        histogram.observe(5, "get")
+
+        self.assertEqual(histogram.get_count("get"), 4)
+        self.assertEqual(histogram.render().split("\n")[2:],
+                         ['test_seconds_bucket{method="get",le="0.1"} 2',
+                          'test_seconds_bucket{method="get",le="1"} 3',
+                          'test_seconds_bucket{method="get",le="+Inf"} 4',
+                          'test_seconds_sum{method="get"} 5.65',
+                          'test_seconds_count{method="get"} 4'])
+
+    def testTimed(self):
+        histogram = self._sut.histogram("test_seconds", "Test histogram", ["method"])
+
+        @timed(histogram)
+        def query(value):
+            return value
+
+        self.assertEqual(query(1), 1)
+        self.assertEqual(query(2), 2)
+        self.assertEqual(histogram.get_count("query"), 2)
+
+    def testMetricsServer(self):
+        self._sut.counter("test_total", "Test counter").inc()
+        server = MetricsServer(self._sut, port=0)
+        server.launch()
+
+        try:
+            with urlopen("http://127.0.0.1:%d/metrics" % server.get_port()) as response:
+                self.assertEqual(response.read().decode(), self._sut.render())
+            with self.assertRaises(HTTPError):
+                urlopen("http://127.0.0.1:%d/other" % server.get_port())
+        finally:
+            server.stop()
@@ -1,8 +1,12 @@
+import tempfile
 import unittest
-from unittest.mock import Mock
+from concurrent.futures import Future
+from unittest.mock import Mock, ANY
 from hashlib import md5
 
 from src.Overseer import *
+from src.SlaveState import SlaveState
+from src.StateHistory import StateHistory
 from test.MessageMock import MessageMock
 from test.SlaveMock import SlaveMock
 from test.UserMock import UserMock
@@ -34,6 +38,25 @@ class OverseerTest(unittest.TestCase):
 
         update.message.reply_text.assert_called_with(self._rm.get_string("greeting"))
 
+    def testMessagesAreRecordedInBackground(self):
+        update = Mock()
+        update.message = MessageMock(text="/start")
+
+        self._sut.on_start(None, update)
+
+        self.assertListEqual(self._db_operator.get_messages(update.message.chat_id), [])
+        self._sut._audit_writer.flush()
+        self.assertEqual(len(self._db_operator.get_messages(update.message.chat_id)), 1)
+
+    def testOnHelp(self):
+        update = Mock()
+        update.message = MessageMock(text="/help")
+
+        self._sut.on_help(None, update)
+
+        with open("resources/command_summary.html", "r") as f:
+            update.message.reply_text.assert_called_with(f.read(), parse_mode="HTML")
+
     def testOnSubscribeWithNoSlaveName(self):
         update = Mock()
         update.message = MessageMock(text="/subscribe")
@@ -68,6 +91,7 @@ class OverseerTest(unittest.TestCase):
 
         self.assertIn(("slave1", 11), self._db_operator.get_subscriptions(telegram_id))
         self.assertIn(("slave2", 12), self._db_operator.get_subscriptions(telegram_id))
+        self._broadcaster.request_update.assert_called_with("slave2")
 
 
         reply_message.message_id = 13
@@ -114,6 +138,110 @@ class OverseerTest(unittest.TestCase):
                                                      reply_markup=reply_markup)
 
 
+    def testOnHistory(self):
+        history = StateHistory()
+        self._update_server.get_history = Mock(return_value=history)
+        for i in range(3):
+            history.add(SlaveState("slave1", "state %d" % i))
+
+        update = Mock()
+        update.message = MessageMock(text="/history slave1 10")
+        self._sut.on_history(None, update)
+
+        reply_markup = InlineKeyboardMarkup([[InlineKeyboardButton("OK", callback_data="OK")]])
+        expected = "\n\n".join(state.get_state_message() for state in history.get_latest("slave1", 3))
+        update.message.reply_text.assert_called_with(expected, parse_mode="Markdown", reply_markup=reply_markup)
+
+        for i in range(500):
+            history.add(SlaveState("slave1", "long state %d " % i + "x" * 100))
+        self._sut.on_history(None, update)
+        reply = update.message.reply_text.call_args[0][0]
+        self.assertLessEqual(len(reply), 4096)
+        self.assertTrue(reply.endswith("long state 499 " + "x" * 100))
+        entries = [state.get_state_message() for state in history.get_latest("slave1", 503)]
+        self.assertTrue(all(entry in entries for entry in reply.split("\n\n")))
+
+        oversized = SlaveState("slave1", "\n".join("*line %d*" % i for i in range(1000)))
+        history.add(oversized)
+        self._sut.on_history(None, update)
+        reply = update.message.reply_text.call_args[0][0]
+        header, *lines = reply.split("\n")
+        self.assertLessEqual(len(reply), 4096)
+        self.assertEqual(header, oversized.get_state_message().split("\n")[0])
+        self.assertEqual(lines[-1], "*line 999*")
+        self.assertTrue(all(line.startswith("*line ") and line.endswith("*") for line in lines))
+
+        update.message.text = "/history slave2 10"
+        self._sut.on_history(None, update)
+        update.message.reply_text.assert_called_with(self._rm.get_string("no_history") % ("slave2", "10"))
+
+        for text in ["/history slave1", "/history slave1 inf", "/history slave1 1e20", "/history slave1 1e10",
+                     "/history slave1 nan", "/history slave1 -5"]:
+            update.message.reply_text.reset_mock()
+            update.message.text = text
+            self._sut.on_history(None, update)
+            update.message.reply_text.assert_called_once_with(self._rm.get_string("history_usage"))
+
+    def testOnScheme(self):
+        bot = self._broadcaster.get_telegram_updater().bot
+        bot.send_photo = Mock(return_value=Mock(photo=[Mock(file_id="small"), Mock(file_id="scheme_file")]))
+        update = Mock()
+        update.message = MessageMock(text="/scheme")
+
+        with tempfile.NamedTemporaryFile(suffix=".PNG") as scheme:
+            scheme.write(b"scheme bytes")
+            scheme.flush()
+            self._sut.SCHEME_FILE = scheme.name
+            self._sut.on_scheme(None, update)
+            self._sut.on_scheme(None, update)
+
+        uploaded, reused = bot.send_photo.call_args_list
+        self.assertEqual(uploaded[0][1].read(), b"scheme bytes")
+        self.assertEqual(reused[0][1], "scheme_file")
+        self.assertEqual(len(self._db_operator.get_media_files()), 1)
+
+    def testOnPlot(self):
+        plot = Future()
+        plot.set_result(b"PNG")
+        self._sut._plot_service = Mock(submit=Mock(return_value=plot))
+        bot = self._broadcaster.get_telegram_updater().bot
+        bot.send_photo = Mock(return_value=Mock(photo=[Mock(file_id="plot_file")]))
+
+        update = Mock()
+        update.message = MessageMock(text="/plot slave1 T_mc 6h")
+        self._sut.on_plot(None, update)
+
+        self._sut._plot_service.submit.assert_called_with("slave1", "T_mc", 6 * 3600)
+        bot.send_photo.assert_called_once_with(update.message.chat_id, ANY, caption="slave1 - T_mc, 6h",
+                                               reply_markup=ANY)
+        self.assertEqual(bot.send_photo.call_args[0][1].read(), b"PNG")
+
+        failed_plot = Future()
+        failed_plot.set_exception(ValueError("No samples"))
+        self._sut._plot_service.submit.return_value = failed_plot
+        update.message.text = "/plot slave1 P 30"
+        self._sut.on_plot(None, update)
+        self._sut._plot_service.submit.assert_called_with("slave1", "P", 30 * 60)
+        bot.send_message.assert_called_with(update.message.chat_id,
+                                            self._rm.get_string("no_plot") % ("P", "slave1", "30"))
+
+        for text in ["/plot slave1 T_mc", "/plot slave1 T_mc 6x", "/plot slave1 T_mc -1d"]:
+            update.message.text = text
+            self._sut.on_plot(None, update)
+            update.message.reply_text.assert_called_with(self._rm.get_string("plot_usage"))
+        self.assertEqual(self._sut._plot_service.submit.call_count, 2)
+
+    def testLaunchWithWebhook(self):
+        webhook_server = Mock()
+        sut = Overseer(self._broadcaster, self._db_operator, webhook_server=webhook_server)
+
+        sut.launch()
+        sut.stop()
+
+        webhook_server.launch.assert_called_once_with()
+        webhook_server.stop.assert_called_once_with()
+        self._broadcaster.get_telegram_updater().start_polling.assert_not_called()
+
     def testSlaveRegistration(self):
 
         telegram_id1 = 123456
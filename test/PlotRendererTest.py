@@ -0,0 +1,54 @@
+import struct
+import unittest
+import zlib
+
+import numpy as np
+
+from src.PlotRenderer import render_plot, encode_png, BAND, LINE, BACKGROUND
+
+
+def decode_png(png):
+    assert png[:8] == b"\x89PNG\r\n\x1a\n"
+    chunks = {}
+    offset = 8
+    while offset < len(png):
+        length, kind = struct.unpack_from("!I4s", png, offset)
+        data = png[offset + 8:offset + 8 + length]
+        crc, = struct.unpack_from("!I", png, offset + 8 + length)
+        assert crc == zlib.crc32(kind + data)
+        chunks[kind] = chunks.get(kind, b"") + data
+        offset += 12 + length
+
+    width, height = struct.unpack_from("!II", chunks[b"IHDR"])
+    scanlines = np.frombuffer(zlib.decompress(chunks[b"IDAT"]), dtype=np.uint8).reshape(height, width * 3 + 1)
+    return scanlines[:, 1:].reshape(height, width, 3)
+
+
+class PlotRendererTest(unittest.TestCase):
+
+    def testEncodePng(self):
+        canvas = np.random.RandomState(0).randint(0, 256, size=(7, 5, 3)).astype(np.uint8)
+
+        self.assertTrue(np.array_equal(decode_png(encode_png(canvas)), canvas))
+
+    def testRenderPlot(self):
+        timestamps = np.arange(100) * 60. + 1.6e9
+        means = np.sin(timestamps / 600)
+
+        image = decode_png(render_plot(timestamps, means - .5, means + .5, means, width=400, height=200))
+
+        self.assertEqual(image.shape, (200, 400, 3))
+        colors = {tuple(color) for color in image.reshape(-1, 3)}
+        self.assertTrue({BAND, LINE, BACKGROUND} <= colors)
+
+    def testWindowIsWiderThanSamples(self):
+        image = decode_png(render_plot([1.6e9], [1], [1], [1], start=1.6e9 - 3600, end=1.6e9 + 3600,
+                                       width=400, height=200))
+
+        line_columns = np.nonzero((image == LINE).all(axis=2).any(axis=0))[0]
+        self.assertTrue(len(line_columns) > 0)
+        self.assertTrue(all(150 < column < 300 for column in line_columns))
+
+    def testNothingToPlot(self):
+        with self.assertRaises(ValueError):
+            render_plot([], [], [], [])
@@ -0,0 +1,48 @@
+import datetime
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from src.DBOperator import MetricPoint
+from src.PlotService import PlotService
+
+
+class PlotServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        now = datetime.datetime.now()
+        self._db_operator = MagicMock()
+        self._db_operator.get_metric_series = MagicMock(
+            return_value=[MetricPoint(now - datetime.timedelta(minutes=i), i, i + 1, i + .5) for i in range(30, 0, -1)])
+        self._sut = PlotService(self._db_operator)
+
+    def tearDown(self):
+        self._sut.stop()
+
+    def testPlotsAreCached(self):
+        plots = [self._sut.submit("slave1", "T", 3600) for _ in range(10)]
+
+        self.assertTrue(plots[0].result().startswith(b"\x89PNG"))
+        self.assertTrue(all(plot is plots[0] for plot in plots))
+        self._db_operator.get_metric_series.assert_called_once()
+        self.assertEqual(self._db_operator.get_metric_series.call_args[0][4], 3600 / PlotService.POINTS)
+        self.assertEqual(self._sut.get_stats(), {"cached": 1, "hits": 9, "misses": 1})
+
+        self._sut.submit("slave1", "T", 600).result()
+        self._sut.submit("slave1", "P", 3600).result()
+        self.assertEqual(self._db_operator.get_metric_series.call_count, 3)
+
+    def testNoSamples(self):
+        self._db_operator.get_metric_series.return_value = []
+
+        with self.assertRaises(ValueError):
+            self._sut.submit("slave1", "T", 3600).result()
+        for i in range(100):  # the callbacks run after result() is released
+            if self._sut.get_stats()["cached"] == 0:
+                break
+            time.sleep(.01)
+        self.assertEqual(self._sut.get_stats()["cached"], 0)
+
+        self._db_operator.get_metric_series.return_value = [MetricPoint(datetime.datetime.now(), 1, 2, 1.5)]
+        self.assertTrue(self._sut.submit("slave1", "T", 3600).result().startswith(b"\x89PNG"))
+        self.assertEqual(self._db_operator.get_metric_series.call_count, 2)
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.ResourceManager import ResourceManager
+
+
+class ResourceManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.TemporaryDirectory()
+        self._strings_file = os.path.join(self._dir.name, "strings.json")
+        self._write_strings({"greeting": "Hello"}, mtime=1000)
+
+        self._sut = ResourceManager(self._strings_file, check_interval=0)
+
+    def tearDown(self):
+        ResourceManager.reload()
+        self._dir.cleanup()
+
+    def _write_strings(self, strings, mtime):
+        with open(self._strings_file, "w") as f:
+            json.dump(strings, f)
+        os.utime(self._strings_file, (mtime, mtime))
+
+    def testStringsAreCached(self):
+        self.assertEqual(self._sut.get_string("greeting"), "Hello")
+
+        self._write_strings({"greeting": "Bye"}, mtime=1000)  # same mtime, not re-read
+        self.assertEqual(self._sut.get_string("greeting"), "Hello")
+        self.assertEqual(ResourceManager(self._strings_file).get_string("greeting"), "Hello")
+
+        ResourceManager.reload()
+        self.assertEqual(self._sut.get_string("greeting"), "Bye")
+
+    def testReloadOnModification(self):
+        self.assertEqual(self._sut.get_string("greeting"), "Hello")
+
+        self._write_strings({"greeting": "Bye"}, mtime=2000)
+        self.assertEqual(self._sut.get_string("greeting"), "Bye")
+
+        sut = ResourceManager(self._strings_file, check_interval=100)
+        self._write_strings({"greeting": "Hello again"}, mtime=3000)
+        self.assertEqual(sut.get_string("greeting"), "Bye")  # modification not checked yet
+
+    def testPreload(self):
+        binary_file = os.path.join(self._dir.name, "scheme.PNG")
+        with open(binary_file, "wb") as f:
+            f.write(b"\x89PNG")
+
+        loaded = self._sut.preload(text_files=[self._strings_file],
+                                   binary_files=[binary_file, os.path.join(self._dir.name, "missing.PNG")])
+
+        self.assertListEqual(loaded, [self._strings_file, binary_file])
+        os.remove(binary_file)
+        self.assertEqual(ResourceManager(check_interval=100).get_bytes(binary_file), b"\x89PNG")
+        self.assertEqual(self._sut.get_text(self._strings_file), '{"greeting": "Hello"}')
@@ -0,0 +1,121 @@
+import time
+import unittest
+from unittest.mock import MagicMock
+
+from loggingserver import LoggingServer
+from telegram.error import RetryAfter, BadRequest, TimedOut
+
+from src.SendScheduler import SendScheduler, SendPriority, TokenBucket
+
+
+class SendSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        LoggingServer.getInstance("overseer", test=True)
+        self._sent = []
+        self._sut = SendScheduler()
+
+    def tearDown(self):
+        self._sut.stop()
+
+    def _send(self, name):
+        def send():
+            self._sent.append((name, time.time()))
+            return name
+        return send
+
+    def testTokenBucket(self):
+        bucket = TokenBucket(rate=2, capacity=2)
+        now = time.time()
+
+        bucket.take(now)
+        bucket.take(now)
+        self.assertAlmostEqual(bucket.get_delay(now), .5)
+        self.assertEqual(bucket.get_delay(now + .5), 0)
+        self.assertTrue(bucket.is_full(now + 1))
+
+    def testAlertsGoFirst(self):
+        self._sut = SendScheduler(workers=1)
+
+        self._sut.submit(1, self._send("state1"))
+        self._sut.submit(1, self._send("state2"))
+        self._sut.submit(1, self._send("alert"), priority=SendPriority.ALERT)
+        self._sut.launch()
+
+        self.assertTrue(self._sut.wait_idle(10))
+        self.assertListEqual([name for name, _ in self._sent], ["alert", "state1", "state2"])
+
+    def testRateLimits(self):
+        self._sut = SendScheduler(global_rate=100, global_burst=100, chat_rate=10, chat_burst=1)
+        self._sut.launch()
+
+        started = time.time()
+        for i in range(5):
+            self._sut.submit(1, self._send("chat1"))
+        for chat_id in range(2, 6):
+            self._sut.submit(chat_id, self._send("other"))
+
+        self.assertTrue(self._sut.wait_idle(10))
+        chat1_times = [sent_at - started for name, sent_at in self._sent if name == "chat1"]
+        other_times = [sent_at - started for name, sent_at in self._sent if name == "other"]
+        self.assertGreaterEqual(chat1_times[-1], .35)
+        self.assertLess(max(other_times), .2)  # not held up by the busy chat
+
+        self._sent = []
+        self._sut = SendScheduler(global_rate=20, global_burst=1, chat_rate=100, chat_burst=100)
+        self._sut.launch()
+        started = time.time()
+        for chat_id in range(6):
+            self._sut.submit(chat_id, self._send("global"))
+        self.assertTrue(self._sut.wait_idle(10))
+        self.assertGreaterEqual(self._sent[-1][1] - started, .2)
+
+    def testCoalescing(self):
+        self._sut = SendScheduler()
+
+        on_done = MagicMock()
+        first = self._sut.submit(1, self._send("old state"), key=(1, 11), on_done=on_done)
+        second = self._sut.submit(1, self._send("new state"), key=(1, 11), on_done=on_done)
+        self._sut.launch()
+
+        self.assertIs(first, second)
+        self.assertEqual(second.result(10), "new state")
+        self.assertTrue(self._sut.wait_idle(10))
+        self.assertListEqual([name for name, _ in self._sent], ["new state"])
+        self.assertEqual(self._sut.get_stats()["coalesced"], 1)
+        on_done.assert_called_once_with(first)
+
+    def testRetryAfterIsRequeued(self):
+        self._sut = SendScheduler()
+        send = MagicMock(side_effect=[RetryAfter(1), "sent"])
+
+        started = time.time()
+        self._sut.launch()
+        future = self._sut.submit(1, send)
+        while self._sut.get_stats()["retried"] == 0:
+            time.sleep(.01)
+        self._sut.submit(2, self._send("other chat"))  # waits for the flood control too
+
+        self.assertEqual(future.result(10), "sent")
+        self.assertGreaterEqual(time.time() - started, 1)
+        self.assertTrue(self._sut.wait_idle(10))
+        self.assertGreaterEqual(self._sent[0][1] - started, 1)
+
+        stats = self._sut.get_stats()
+        self.assertEqual(stats["sent"], 2)
+        self.assertEqual(stats["retried"], 1)
+        self.assertEqual(stats["queued"], 0)
+        self.assertGreaterEqual(stats["max_latency"], 1)
+
+    def testErrors(self):
+        self._sut = SendScheduler(max_retries=1)
+        self._sut.launch()
+
+        bad_request = self._sut.submit(1, MagicMock(side_effect=BadRequest("Message to edit not found")))
+        timed_out = MagicMock(side_effect=TimedOut())
+        timed_out_future = self._sut.submit(2, timed_out)
+
+        self.assertIsInstance(bad_request.exception(10), BadRequest)
+        self.assertIsInstance(timed_out_future.exception(10), TimedOut)
+        self.assertEqual(timed_out.call_count, 2)
+        self.assertEqual(self._sut.get_stats()["failed"], 2)
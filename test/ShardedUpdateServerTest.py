@@ -0,0 +1,107 @@
+import time
+import unittest
+from hashlib import md5
+from unittest.mock import MagicMock
+
+from loggingserver import LoggingServer
+
+from src.AlertEngine import ThresholdRule
+from src.ShardedUpdateServer import ShardedUpdateServer
+from test.SlaveLoadGenerator import SlaveLoadGenerator
+from test.SlaveMock import SlaveMock
+
+
+class ShardedUpdateServerTest(unittest.TestCase):
+
+    def setUp(self):
+        LoggingServer.getInstance("overseer", test=True)
+
+        self._db_operator = MagicMock()
+        self._db_operator.get_slave = MagicMock(return_value=SlaveMock(password=md5("testpass".encode()).hexdigest()))
+
+        self._sut = ShardedUpdateServer(None, self._db_operator, port=0, workers=3)
+        self._sut._host = "127.0.0.1"
+        self._sut.launch()
+
+    def tearDown(self):
+        self._sut.stop()
+
+    def _wait_for(self, condition, timeout=10):
+        deadline = time.time() + timeout
+        while not condition() and time.time() < deadline:
+            time.sleep(.01)
+        return condition()
+
+    def testUnifiedView(self):
+        listener = MagicMock()
+        self._sut.add_state_listener(listener)
+
+        generator = SlaveLoadGenerator("127.0.0.1", self._sut.get_port(), 100, updates_per_slave=3,
+                                       update_interval=.01, framed=True)  # legacy updates may arrive merged
+        replies = generator.run()
+
+        self.assertEqual(self._sut.get_workers_count(), 3)
+        self.assertListEqual(replies, ["slave%d\r\nframed/1" % i for i in range(100)])
+        for i in range(100):
+            self.assertTrue(self._wait_for(lambda: self._sut.get_state_version("slave%d" % i) == 3))
+            self.assertEqual(self._sut.get_latest_state("slave%d" % i).get_raw_message(), "state 2 of slave%d" % i)
+        self.assertEqual(listener.call_count, 300)
+        self.assertEqual(len(self._sut.get_history().get_latest("slave7", 10)), 3)
+
+    def testStatesArriveParsed(self):
+        events = []
+        self._sut.get_alert_engine().add_listener(events.append)
+        self._sut.get_alert_engine().add_rule("slave0", ThresholdRule("T", above=1))
+
+        generator = SlaveLoadGenerator("127.0.0.1", self._sut.get_port(), 1, framed=True)
+        generator.make_state = lambda update, i: '{"state":"", "sent_at":"", "alerts":[], "metrics":{"T":2}}'
+        generator.run()
+
+        self.assertTrue(self._wait_for(lambda: self._sut.get_state_version("slave0") == 1))
+        self.assertIsNotNone(self._sut.get_latest_state("slave0")._parsed)
+        self.assertEqual(len(events), 1)
+
+    def testReconnectRefreshesStaleState(self):
+        self._sut.stop()
+        self._sut = ShardedUpdateServer(None, self._db_operator, port=0, workers=1)  # the reconnect hits the same worker
+        self._sut._host = "127.0.0.1"
+        self._sut.launch()
+
+        generator = SlaveLoadGenerator("127.0.0.1", self._sut.get_port(), 1, framed=True)
+        generator.run()
+        self.assertTrue(self._wait_for(lambda: self._sut.get_latest_state("slave0").is_stale()))
+
+        reconnected = []
+        generator.run(lambda: reconnected.append(  # the same payload again
+            self._wait_for(lambda: self._sut.get_liveness().is_online("slave0")) and
+            not self._sut.get_latest_state("slave0").is_stale()))
+
+        self.assertListEqual(reconnected, [True])
+        self.assertEqual(self._sut.get_state_version("slave0"), 2)
+
+    def testWorkersAreForkedBeforeServices(self):
+        self._sut.stop()
+        state_archive = MagicMock()
+        self._sut = ShardedUpdateServer(None, self._db_operator, port=0, workers=2, read_timeout=7,
+                                        state_archive=state_archive)
+        self._sut._host = "127.0.0.1"
+        forked_workers = []
+        launch_services = self._sut._launch_services
+        self._sut._launch_services = lambda: forked_workers.append(len(self._sut._workers)) or launch_services()
+
+        self._sut.launch()
+
+        self.assertListEqual(forked_workers, [2])
+        state_archive.launch.assert_called_once_with()
+        self.assertEqual(self._sut._read_timeout, 7)
+
+    def testWrongPassword(self):
+        generator = SlaveLoadGenerator("127.0.0.1", self._sut.get_port(), 5, password="wrong")
+        self.assertListEqual(generator.run(), ["Authentication failed: Wrong username/password!"] * 5)
+
+        self._db_operator.get_slave = MagicMock(side_effect=ValueError("Slave slave0 not found"))
+        self._sut._authenticator.invalidate("slave0")
+        generator = SlaveLoadGenerator("127.0.0.1", self._sut.get_port(), 1)
+        self.assertListEqual(generator.run(), ["Authentication failed: Slave slave0 not found"])
+
+        self.assertDictEqual(self._sut._latest_states, {})
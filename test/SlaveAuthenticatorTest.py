@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from src.PasswordHashing import hash_password, verify_password, MD5, SCRYPT
+from src.SlaveAuthenticator import SlaveAuthenticator
+from test.SlaveMock import SlaveMock
+
+
+class SlaveAuthenticatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self._slave = SlaveMock(password=hash_password("pass", SCRYPT))
+        self._db_operator = MagicMock()
+        self._db_operator.get_slave = MagicMock(return_value=self._slave)
+
+        self._sut = SlaveAuthenticator(self._db_operator, cache_size=2, ttl=100)
+
+    def testPasswordHashing(self):
+        for scheme in [MD5, SCRYPT]:
+            stored_hash = hash_password("pass", scheme)
+            self.assertLessEqual(len(stored_hash), 60)
+            self.assertTrue(verify_password("pass", stored_hash))
+            self.assertFalse(verify_password("wrong", stored_hash))
+
+        self.assertNotEqual(hash_password("pass", SCRYPT), hash_password("pass", SCRYPT))  # salted
+        self.assertFalse(verify_password("pass", "scrypt1$broken"))
+        self.assertFalse(verify_password("pass", None))
+
+    def testVerifiedPasswordsAreCached(self):
+        with patch("src.SlaveAuthenticator.verify_password", side_effect=verify_password) as verify:
+            for _ in range(5):
+                self.assertTrue(self._sut.authenticate("slave1", "pass"))
+            self.assertFalse(self._sut.authenticate("slave1", "wrong"))
+            self.assertFalse(self._sut.authenticate("slave1", ""))
+
+        self.assertEqual(self._db_operator.get_slave.call_count, 1)
+        self.assertEqual(verify.call_count, 2)
+        self.assertEqual(self._sut.get_stats(), {"cached": 1, "hits": 4, "misses": 2})
+
+    def testInvalidation(self):
+        self._db_operator.add_slave_listener.assert_called_once_with(self._sut.invalidate)
+        self.assertTrue(self._sut.authenticate("slave1", "pass"))
+
+        self._db_operator.get_slave.return_value = SlaveMock(password=hash_password("new pass", MD5))
+        self._sut.invalidate("slave1")
+
+        self.assertFalse(self._sut.authenticate("slave1", "pass"))
+        self.assertTrue(self._sut.authenticate("slave1", "new pass"))
+
+    def testInvalidationDuringQuery(self):
+        old_slave = self._slave
+
+        def get_slave(nickname):  # the update commits after the old record was read
+            self._db_operator.get_slave.side_effect = None
+            self._db_operator.get_slave.return_value = SlaveMock(password=hash_password("new pass", MD5))
+            self._sut.invalidate(nickname)
+            return old_slave
+
+        self._db_operator.get_slave.side_effect = get_slave
+        self.assertTrue(self._sut.authenticate("slave1", "pass"))
+
+        self.assertFalse(self._sut.authenticate("slave1", "pass"))
+        self.assertTrue(self._sut.authenticate("slave1", "new pass"))
+
+    def testExpiryAndEviction(self):
+        self._sut.authenticate("slave1", "pass")
+        self._sut.authenticate("slave2", "pass")
+        self._sut.authenticate("slave1", "pass")
+        self._sut.authenticate("slave3", "pass")  # evicts slave2, the least recently used
+
+        self.assertListEqual(list(self._sut._records.keys()), ["slave1", "slave3"])
+
+        with patch("src.SlaveAuthenticator.time", return_value=10 ** 10):
+            self._sut.authenticate("slave1", "pass")
+        self.assertEqual(self._db_operator.get_slave.call_count, 4)
+
+    def testSubmit(self):
+        self._db_operator.get_slave.side_effect = ValueError("Slave slave9 not found")
+
+        self.assertIsInstance(self._sut.submit("slave9", "pass").exception(10), ValueError)
@@ -0,0 +1,71 @@
+import asyncio
+
+from src.SlaveProtocol import encode_frame, FRAMED_PROTOCOL
+
+
+class SlaveLoadGenerator:
+    """
+    Opens many concurrent fake slave connections to an update server
+    """
+
+    def __init__(self, host, port, slaves_count, password="testpass", updates_per_slave=1,
+                 update_interval=0.01, state_size=0, framed=False, ssl_context=None, first_slave=0):
+        self._host = host
+        self._port = port
+        self._slaves_count = slaves_count
+        self._password = password
+        self._updates_per_slave = updates_per_slave
+        self._update_interval = update_interval
+        self._state_size = state_size
+        self._framed = framed
+        self._ssl_context = ssl_context
+        self._first_slave = first_slave
+
+    def make_state(self, update, i):
+        state = "state %d of slave%d" % (update, i)
+        return state + "." * (self._state_size - len(state))
+
+    def run(self, while_connected=lambda: None):
+        """
+        Connects all slaves, sends their updates and calls while_connected
+        before disconnecting them
+
+        :return: handshake replies of the slaves
+        """
+        return asyncio.run(self._run(while_connected))
+
+    async def _run(self, while_connected):
+        sent = asyncio.Semaphore(0)
+        release = asyncio.Event()
+        slaves = [asyncio.ensure_future(self._slave(i, sent, release))
+                  for i in range(self._first_slave, self._first_slave + self._slaves_count)]
+
+        for _ in range(self._slaves_count):
+            await sent.acquire()
+
+        await asyncio.get_event_loop().run_in_executor(None, while_connected)
+        release.set()
+        return await asyncio.gather(*slaves)
+
+    async def _slave(self, i, sent, release):
+        reader, writer = await asyncio.open_connection(self._host, self._port, ssl=self._ssl_context)
+        try:
+            handshake = "slave%d\r\n%s" % (i, self._password)
+            if self._framed:
+                handshake += "\r\n" + FRAMED_PROTOCOL
+            writer.write(handshake.encode())
+            reply = (await reader.read(1024)).decode()
+
+            if reply.split("\r\n")[0] == "slave%d" % i:
+                for update in range(self._updates_per_slave):
+                    state = self.make_state(update, i).encode()
+                    writer.write(encode_frame(state) if self._framed else state)
+                    await writer.drain()
+                    if self._update_interval:
+                        await asyncio.sleep(self._update_interval)
+
+            sent.release()
+            await release.wait()
+            return reply
+        finally:
+            writer.close()
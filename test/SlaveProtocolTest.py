@@ -0,0 +1,39 @@
+import unittest
+from unittest.mock import MagicMock
+
+from src.SlaveProtocol import *
+
+
+class SlaveProtocolTest(unittest.TestCase):
+
+    def testParseHandshake(self):
+        self.assertEqual(parse_handshake("slave1\r\npass"), ("slave1", "pass", LEGACY_PROTOCOL))
+        self.assertEqual(parse_handshake("slave1\r\npass\r\nframed/1"), ("slave1", "pass", FRAMED_PROTOCOL))
+
+        for handshake in ["slave1", "slave1\r\npass\r\nframed/2", "a\r\nb\r\nc\r\nd"]:
+            with self.assertRaises(ValueError):
+                parse_handshake(handshake)
+
+        self.assertEqual(make_handshake_reply("slave1", LEGACY_PROTOCOL), "slave1")
+        self.assertEqual(make_handshake_reply("slave1", FRAMED_PROTOCOL), "slave1\r\nframed/1")
+
+    def testFrameReader(self):
+        frames = [b"first", b"", "второй".encode(), b"x" * 70000]
+        stream = b"".join(encode_frame(frame) for frame in frames)
+
+        for chunk_size in [1, 3, 1000, len(stream)]:
+            connection = MagicMock()
+            chunks = [stream[i:i + chunk_size] for i in range(0, len(stream), chunk_size)]
+            connection.recv = MagicMock(side_effect=chunks + [b""])
+
+            self.assertListEqual(list(FrameReader(connection)), frames)
+
+    def testFrameReaderErrors(self):
+        connection = MagicMock()
+        connection.recv = MagicMock(side_effect=[encode_frame(b"abcdef")[:-2], b""])
+        with self.assertRaises(ConnectionError):
+            list(FrameReader(connection))
+
+        connection.recv = MagicMock(side_effect=[encode_frame(b"abcdef"), b""])
+        with self.assertRaises(ValueError):
+            list(FrameReader(connection, max_frame_size=5))
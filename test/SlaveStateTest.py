@@ -1,3 +1,4 @@
+import pickle
 import unittest
 import datetime
 from unittest.mock import patch, MagicMock
@@ -51,3 +52,55 @@ class SlaveStateTest(unittest.TestCase):
                                                     'Alert! %s'%alert)
             else:
                 self.assertEqual(self._sut.get_alert_message(alert), None)
+
+    def testGetMetrics(self):
+        raw_message = '{"state":"test state", "sent_at":"", "alerts":[],' \
+                      ' "metrics":{"T_mc": 0.012, "P": 3, "valve": "open", "on": true}}'
+
+        self.assertDictEqual(SlaveState(self._slave_nick, raw_message).get_metrics(), {"T_mc": 0.012, "P": 3.0})
+        self.assertDictEqual(SlaveState(self._slave_nick, self._raw_msg_2).get_metrics(), {})
+        self.assertDictEqual(SlaveState(self._slave_nick, self._raw_msg_1).get_metrics(), {})
+        self.assertDictEqual(SlaveState(self._slave_nick, "42").get_metrics(), {})
+
+    def testMessagesAreRenderedOnce(self):
+        with patch("datetime.datetime", new = self._dt_mock):
+            self._sut = SlaveState(self._slave_nick, self._raw_msg_2)
+
+        self.assertIs(self._sut.get_state_message(), self._sut.get_state_message())
+        self.assertEqual(self._sut.get_alerts_message(["SLAVE failing", "SLAVE died"]),
+                         '2018-01-01 00:00:00 - slave1\nAlert! SLAVE failing\nAlert! SLAVE died')
+        self.assertIs(self._sut.get_alerts_message(["SLAVE failing", "SLAVE died"]),
+                      self._sut.get_alerts_message(("SLAVE failing", "SLAVE died")))
+
+        with patch("datetime.datetime", new = self._dt_mock):
+            self.assertEqual(self._sut, SlaveState(self._slave_nick, self._raw_msg_2))
+
+    def testImmutableAndHashable(self):
+        self._sut = SlaveState(self._slave_nick, self._raw_msg_2, self._received_at)
+
+        with self.assertRaises(AttributeError):
+            self._sut._received_at = datetime.datetime.now()
+        with self.assertRaises(AttributeError):
+            self._sut.extra = 1
+
+        same_state = SlaveState(self._slave_nick, self._raw_msg_2.encode(), self._received_at)
+        self.assertEqual(self._sut, same_state)
+        self.assertEqual(hash(self._sut), hash(same_state))
+        self.assertNotEqual(self._sut, SlaveState(self._slave_nick, self._raw_msg_1, self._received_at))
+        self.assertEqual(pickle.loads(pickle.dumps(self._sut)), self._sut)
+
+    def testRawBytes(self):
+        raw_message = self._raw_msg_2.encode()
+        self._sut = SlaveState(self._slave_nick, raw_message, self._received_at)
+        self.assertIsNone(self._sut._parsed)  # nothing parsed until asked
+
+        self.assertTrue(self._sut.has_raw_message(raw_message))
+        self.assertTrue(self._sut.has_raw_message(self._raw_msg_2))
+        self.assertFalse(self._sut.has_raw_message(self._raw_msg_1))
+        self.assertEqual(self._sut.get_raw_message(), self._raw_msg_2)
+        self.assertEqual(self._sut.get_state_message(), '2018-01-01 00:00:00 - slave1\ntest state')
+        self.assertEqual(self._sut.get_alerts(), ["SLAVE failing", "", "SLAVE died"])
+
+        broken = SlaveState(self._slave_nick, b"\xfftest", self._received_at)
+        self.assertEqual(broken.get_state_message(), '2018-01-01 00:00:00 - slave1\n�test')
+        self.assertDictEqual(broken.get_metrics(), {})
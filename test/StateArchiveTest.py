@@ -0,0 +1,52 @@
+import datetime
+import unittest
+
+from loggingserver import LoggingServer
+
+from src.DBOperator import DBOperator
+from src.SlaveState import SlaveState
+from src.StateArchive import StateArchive
+
+
+class StateArchiveTest(unittest.TestCase):
+
+    def setUp(self):
+        LoggingServer.getInstance("overseer", test=True)
+        self._db_operator = DBOperator("overseer_test", "inlatexbot", "inlatexbot", drop_key="r4jYi1@")
+        self._sut = StateArchive(self._db_operator, batch_size=100, flush_interval=.05,
+                                 retention=3600, full_resolution_age=600, downsample_interval=60)
+        self._now = datetime.datetime.now().replace(second=0, microsecond=0)
+
+    def tearDown(self):
+        self._db_operator.close()
+
+    def testStatesAreWrittenInBackground(self):
+        self._sut.launch()
+        states = [SlaveState("slave%d" % (i % 3), "state %d" % i, self._now + datetime.timedelta(seconds=i))
+                  for i in range(250)]
+        for state in states:
+            self._sut.add(state)
+        self._sut.stop()
+
+        self.assertEqual(self._sut.get_stats()["written"], 250)
+        self.assertListEqual(self._db_operator.get_slave_states("slave1", self._now), states[1::3])
+
+    def testRollupsAreMaintained(self):
+        self._sut.launch()
+        for i in range(120):
+            self._sut.add(SlaveState("slave1", '{"state":"", "sent_at":"", "alerts":[], "metrics":{"T":%d}}' % i,
+                                     self._now + datetime.timedelta(seconds=i)))
+        self._sut.stop()
+
+        self.assertListEqual([tuple(point)[1:] for point in
+                              self._db_operator.get_metric_series("slave1", "T", self._now, resolution=60)],
+                             [(0, 59, 29.5), (60, 119, 89.5)])
+
+    def testMaintain(self):
+        ages = [7200, 1200, 1190, 1100, 60, 30]
+        states = [SlaveState("slave1", "state", self._now - datetime.timedelta(seconds=age)) for age in ages]
+        self._db_operator.add_slave_states(states)
+
+        self.assertEqual(self._sut.maintain(self._now), (1, 1))
+        self.assertListEqual(self._db_operator.get_slave_states("slave1", self._now - datetime.timedelta(days=1)),
+                             [states[1], states[3], states[4], states[5]])
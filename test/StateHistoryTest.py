@@ -0,0 +1,64 @@
+import datetime
+import sys
+import unittest
+from unittest.mock import patch
+
+from src.SlaveState import SlaveState
+from src.StateHistory import StateHistory
+
+
+class StateHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self._now = datetime.datetime.now()
+        self._sut = StateHistory(max_count=5, max_age=3600)
+
+    def _make_state(self, minutes_ago, slave_nickname="slave1"):
+        return SlaveState(slave_nickname, "state %d" % minutes_ago,
+                          self._now - datetime.timedelta(minutes=minutes_ago))
+
+    def testLatestAndRange(self):
+        for minutes_ago in [40, 30, 20, 10]:
+            self._sut.add(self._make_state(minutes_ago))
+        self._sut.add(self._make_state(5, "slave2"))
+
+        self.assertListEqual([s.get_raw_message() for s in self._sut.get_latest("slave1", 2)],
+                             ["state 20", "state 10"])
+        self.assertListEqual([s.get_raw_message() for s in self._sut.get_latest("slave1", 10)],
+                             ["state 40", "state 30", "state 20", "state 10"])
+
+        since = self._now - datetime.timedelta(minutes=35)
+        until = self._now - datetime.timedelta(minutes=10)
+        self.assertListEqual([s.get_raw_message() for s in self._sut.get_range("slave1", since, until)],
+                             ["state 30", "state 20"])
+        self.assertListEqual([s.get_raw_message() for s in self._sut.get_range("slave1", since)],
+                             ["state 30", "state 20", "state 10"])
+
+        self.assertListEqual(self._sut.get_range("slave3", since), [])
+        self.assertListEqual(self._sut.get_latest("slave3", 1), [])
+        self.assertCountEqual(self._sut.get_slaves(), ["slave1", "slave2"])
+
+    def testRetentionByCount(self):
+        ring_size = None
+        for minutes_ago in range(50, 0, -1):
+            self._sut.add(self._make_state(minutes_ago))
+            ring = self._sut._rings["slave1"]
+            if ring_size is None:
+                ring_size = sys.getsizeof(ring.timestamps) + sys.getsizeof(ring.states)
+            self.assertEqual(sys.getsizeof(ring.timestamps) + sys.getsizeof(ring.states), ring_size)
+
+        self.assertListEqual([s.get_raw_message() for s in self._sut.get_latest("slave1", 100)],
+                             ["state %d" % i for i in range(5, 0, -1)])
+        since = self._now - datetime.timedelta(minutes=3, seconds=30)
+        self.assertListEqual([s.get_raw_message() for s in self._sut.get_range("slave1", since)],
+                             ["state 3", "state 2", "state 1"])
+
+    def testRetentionByAge(self):
+        self._sut.add(self._make_state(90))
+        self._sut.add(self._make_state(70))
+        self._sut.add(self._make_state(50))
+
+        self.assertListEqual([s.get_raw_message() for s in self._sut.get_latest("slave1", 5)], ["state 50"])
+
+        with patch("src.StateHistory.time", return_value=self._now.timestamp() + 3600):
+            self.assertListEqual(self._sut.get_latest("slave1", 5), [])
@@ -0,0 +1,62 @@
+import datetime
+import os
+import tempfile
+import unittest
+
+from src.SlaveState import SlaveState
+from src.StateSnapshot import StateSnapshot
+
+
+class StateSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self._directory = tempfile.TemporaryDirectory()
+        self._path = os.path.join(self._directory.name, "states.snapshot")
+        self._sut = StateSnapshot(self._path)
+        self._now = datetime.datetime.now().replace(microsecond=0)
+
+    def tearDown(self):
+        self._directory.cleanup()
+
+    def _make_state(self, slave_nickname, raw_message, minutes_ago):
+        return SlaveState(slave_nickname, raw_message, self._now - datetime.timedelta(minutes=minutes_ago))
+
+    def testRoundTrip(self):
+        history = [self._make_state("slave1", "state %d" % i, 10 - i) for i in range(3)]
+        history.append(self._make_state("слейв", '{"state":"ü", "sent_at":"", "alerts":[]}'.encode(), 1))
+        latest = [history[2], history[3], self._make_state("slave2", "only latest", 5)]
+
+        self._sut.save(latest, history)
+        latest_states, history_states = StateSnapshot(self._path).load()
+
+        self.assertListEqual(history_states, history)
+        self.assertListEqual([state.get_raw_message() for state in latest_states],
+                             ["state 2", '{"state":"ü", "sent_at":"", "alerts":[]}', "only latest"])
+        self.assertTrue(all(state.is_stale() for state in latest_states))
+        self.assertFalse(any(state.is_stale() for state in history_states))
+        received_at = (self._now - datetime.timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M:%S")
+        self.assertEqual(latest_states[1].get_state_message(), received_at + " - слейв (stale)\nü")
+
+    def testMaxAge(self):
+        self._sut.save([self._make_state("slave1", "new", 1), self._make_state("slave2", "old", 120)], [])
+
+        latest_states, history_states = self._sut.load(max_age=3600)
+
+        self.assertListEqual([state.get_slave_nickname() for state in latest_states], ["slave1"])
+
+    def testMissingAndBrokenFiles(self):
+        self.assertEqual(self._sut.load(), ([], []))
+
+        self._sut.save([self._make_state("slave1", "state", 1)], [])
+        with open(self._path, "rb") as f:
+            data = f.read()
+
+        with open(self._path, "wb") as f:
+            f.write(data[:-2])
+        with self.assertRaises(ValueError):
+            self._sut.load()
+
+        with open(self._path, "wb") as f:
+            f.write(b"JUNK" + data[4:])
+        with self.assertRaises(ValueError):
+            self._sut.load()
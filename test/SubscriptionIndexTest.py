@@ -0,0 +1,64 @@
+import unittest
+from random import Random
+
+from src.DBOperator import DBOperator
+from src.SubscriptionIndex import SubscriptionIndex
+from test.SlaveMock import SlaveMock
+from test.UserMock import UserMock
+
+
+class SubscriptionIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self._sut = SubscriptionIndex()
+
+    def testAddRemove(self):
+        self._sut.load([(1, "slave1", 11), (1, "slave2", 12), (2, "slave1", 21)])
+
+        self.assertCountEqual(self._sut.get_subscribers("slave1"), [(1, 11), (2, 21)])
+        self.assertCountEqual(self._sut.get_subscriptions(1), [("slave1", 11), ("slave2", 12)])
+
+        self._sut.add(1, "slave1", 13)
+        self._sut.add(3, "slave3", 31)
+        self._sut.remove(2, "slave1")
+        self._sut.remove(2, "slave1")  # already removed
+        self._sut.remove(1, "slave2")
+
+        self.assertEqual(self._sut.get_info_message_id(1, "slave1"), 13)
+        self.assertIsNone(self._sut.get_info_message_id(1, "slave2"))
+        self.assertListEqual(self._sut.get_subscriptions(2), [])
+        self.assertCountEqual(self._sut.get_all_subscriptions(), [(1, "slave1", 13), (3, "slave3", 31)])
+        self.assertListEqual(self._sut.get_all_subscriptions(["slave3", "slave4"]), [(3, "slave3", 31)])
+        self.assertEqual(len(self._sut), 2)
+        self.assertDictEqual(self._sut._by_user, {1: {"slave1": 13}, 3: {"slave3": 31}})
+
+    def testConsistencyWithDB(self):
+        db_operator = DBOperator("overseer_test", "inlatexbot", "inlatexbot", drop_key="r4jYi1@")
+        random = Random(42)
+
+        telegram_ids = list(range(100, 110))
+        slave_nicknames = ["slave%d" % i for i in range(5)]
+        for telegram_id in telegram_ids:
+            db_operator.add_user(UserMock(telegram_id))
+        for slave_nickname in slave_nicknames:
+            db_operator.add_slave(SlaveMock(slave_nickname))
+
+        for i in range(300):
+            telegram_id, slave_nickname = random.choice(telegram_ids), random.choice(slave_nicknames)
+            if random.random() < .7:
+                db_operator.subscribe(telegram_id, slave_nickname, i)
+            else:
+                db_operator.unsubscribe(telegram_id, slave_nickname)
+
+        index = db_operator.get_subscription_index()
+        from_db = list(db_operator.get_all_subscriptions())
+        self.assertCountEqual(index.get_all_subscriptions(), from_db)
+        for telegram_id in telegram_ids:
+            self.assertCountEqual(index.get_subscriptions(telegram_id), db_operator.get_subscriptions(telegram_id))
+
+        reloaded = DBOperator("overseer_test", "inlatexbot", "inlatexbot").get_subscription_index()
+        self.assertCountEqual(reloaded.get_all_subscriptions(), from_db)
+
+        with self.assertRaises(ValueError):
+            db_operator.subscribe(telegram_ids[0], "missing_slave", 1)
+        self.assertCountEqual(index.get_all_subscriptions(), from_db)
@@ -0,0 +1,59 @@
+import unittest
+
+import numpy as np
+
+from src.SlaveState import SlaveState
+from src.TelemetryStore import TelemetryStore
+
+
+class TelemetryStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self._sut = TelemetryStore(capacity=100)
+
+    def testSeriesWindowsAndWrapAround(self):
+        for i in range(250):
+            self._sut.add("slave1", 1000. + i, {"T": i * 2., "P": -i})
+
+        timestamps, values = self._sut.get_series("slave1", "T")
+        np.testing.assert_array_equal(timestamps, np.arange(1150., 1250.))
+        np.testing.assert_array_equal(values, np.arange(150, 250) * 2.)
+
+        timestamps, values = self._sut.get_series("slave1", "P", since=1200, until=1210)
+        np.testing.assert_array_equal(values, -np.arange(200, 210))
+
+        self.assertListEqual(self._sut.get_metric_names("slave1"), ["P", "T"])
+        self.assertEqual(len(self._sut.get_series("slave2", "T")[0]), 0)
+        self.assertIsNone(self._sut.aggregate("slave1", "missing"))
+
+    def testAggregate(self):
+        rng = np.random.RandomState(0)
+        values = rng.normal(size=60)
+        for i, value in enumerate(values):
+            self._sut.add("slave1", 10. * i, {"T": value + .5 * i})
+        expected = values + .5 * np.arange(60)
+
+        result = self._sut.aggregate("slave1", "T", since=100, percentiles=(50, 95))
+        window = expected[10:]
+
+        self.assertEqual(result["count"], 50)
+        self.assertAlmostEqual(result["min"], window.min())
+        self.assertAlmostEqual(result["max"], window.max())
+        self.assertAlmostEqual(result["mean"], window.mean())
+        self.assertAlmostEqual(result["p50"], np.median(window))
+        self.assertAlmostEqual(result["p95"], np.percentile(window, 95))
+        self.assertAlmostEqual(result["last"], expected[-1])
+        self.assertAlmostEqual(result["rate"], .05, delta=.01)  # .5 per 10 s
+        self.assertAlmostEqual(result["max_rate"], np.abs(np.diff(window)).max() / 10)
+
+        single = self._sut.aggregate("slave1", "T", since=590)
+        self.assertEqual((single["count"], single["rate"], single["max_rate"]), (1, 0., 0.))
+
+    def testAddState(self):
+        state = SlaveState("slave1", '{"state":"", "sent_at":"", "alerts":[], "metrics":{"T": 4.2}}')
+        self._sut.add_state(state)
+        self._sut.add_state(SlaveState("slave1", "no metrics"))
+
+        timestamps, values = self._sut.get_series("slave1", "T")
+        self.assertListEqual(list(values), [4.2])
+        self.assertEqual(timestamps[0], state.get_received_at().timestamp())
@@ -1,8 +1,15 @@
+import os
+import tempfile
 import unittest
+from hashlib import md5
 from unittest.mock import MagicMock
 from ssl import SSLError
 
+from src.AlertEngine import ThresholdRule
+from src.MetricsRegistry import MetricsRegistry
+from src.StateSnapshot import StateSnapshot
 from src.UpdateServer import *
+from src.SlaveProtocol import encode_frame
 from test.SlaveMock import SlaveMock
 
 
@@ -65,8 +72,7 @@ class UpdateServerTest(unittest.TestCase):
 
         self._sut._communicate(conn, MagicMock())
         state = self._sut._latest_states[slave.nickname]
-        expected_state = SlaveState("slave1", "state")
-        state._received_at = expected_state._received_at
+        expected_state = SlaveState("slave1", "state", state.get_received_at(), stale=True)  # offline now
 
         self.assertEqual(state, expected_state)
 
@@ -77,3 +83,100 @@ class UpdateServerTest(unittest.TestCase):
 
         self._sut._communicate(conn, MagicMock())
         self.assertNotIn("slave2", self._sut._latest_states.keys())
+
+    def testStoreStatePublishesChangesOnly(self):
+        listener = MagicMock()
+        self._sut.add_state_listener(listener)
+
+        self._sut._store_state("slave1", "state")
+        self._sut._store_state("slave1", "state")
+        self.assertEqual(self._sut.get_state_version("slave1"), 1)
+        listener.assert_called_once_with("slave1")
+
+        self._sut._store_state("slave1", "new state")
+        self.assertEqual(self._sut.get_state_version("slave1"), 2)
+        self.assertEqual(listener.call_count, 2)
+        self.assertEqual(self._sut.get_state_version("slave2"), 0)
+
+    def testIngestMetrics(self):
+        frames = INGESTED_FRAMES.get("metered_slave")
+        failures = PARSE_FAILURES.get("metered_slave")
+
+        self._sut._store_state("metered_slave", b"state")
+        self._sut._store_state("metered_slave", b"state")
+        self._sut._store_state("metered_slave", b'{"sent_at":"", "state":"ok", "alerts":[]}')
+
+        self.assertEqual(INGESTED_FRAMES.get("metered_slave") - frames, 3)
+        self.assertEqual(PARSE_FAILURES.get("metered_slave") - failures, 1)
+        self.assertIn('overseer_ingested_bytes_total{slave="metered_slave"}',
+                      MetricsRegistry.get_instance().render())
+
+    def testStoreStateEvaluatesAlertRules(self):
+        events = []
+        self._sut.get_alert_engine().add_listener(events.append)
+        self._sut.get_alert_engine().add_rule("slave1", ThresholdRule("T", above=1))
+
+        for value in [0, 2, 2, 3, 0]:
+            self._sut._store_state("slave1", '{"state":"", "sent_at":"", "alerts":[], '
+                                             '"metrics":{"T":%d}}' % value)
+        self.assertListEqual([event.fired for event in events], [True, False])
+
+    def testSnapshotRestore(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "states.snapshot")
+            self._sut._snapshot = StateSnapshot(path)
+            for i in range(3):
+                self._sut._store_state("slave1", '{"state":"%d", "sent_at":"", "alerts":[], '
+                                                 '"metrics":{"T":%d}}' % (i, i))
+            self._sut._save_snapshot()
+
+            restarted = UpdateServer(self._tls_context, self._db_operator, snapshot_path=path)
+            restarted._restore_snapshot()
+
+        state = restarted.get_latest_state("slave1")
+        self.assertTrue(state.is_stale())
+        self.assertEqual(state.get_raw_message(), self._sut.get_latest_state("slave1").get_raw_message())
+        self.assertEqual(restarted.get_state_version("slave1"), 0)
+        self.assertEqual(len(restarted.get_history().get_latest("slave1", 10)), 3)
+        self.assertEqual(restarted.get_telemetry().aggregate("slave1", "T")["count"], 3)
+
+        restarted._store_state("slave1", "live state")
+        self.assertFalse(restarted.get_latest_state("slave1").is_stale())
+        self.assertEqual(restarted.get_state_version("slave1"), 1)
+
+    def testSilentConnectionIsDropped(self):
+        conn = MagicMock()
+        conn.recv = MagicMock(side_effect=["slave1\r\npass".encode(), "state".encode(), socket.timeout("timed out")])
+        self._db_operator.get_slave = MagicMock(return_value=SlaveMock(password=md5("pass".encode()).hexdigest()))
+
+        self._sut._communicate(conn, MagicMock())
+
+        conn.close.assert_called_once_with()
+        self.assertFalse(self._sut.get_liveness().is_online("slave1"))
+        self.assertEqual(self._sut.get_liveness().get_liveness("slave1")["connections"], 0)
+        self.assertTrue(self._sut.get_latest_state("slave1").is_stale())
+
+        self._sut._store_state("slave1", "state")  # back with the same state
+        self.assertFalse(self._sut.get_latest_state("slave1").is_stale())
+        self.assertTrue(self._sut.get_liveness().is_online("slave1"))
+
+    def testCommunicateFramed(self):
+        large_state = '{"state":"%s", "sent_at":"", "alerts":[]}' % ("x" * 5000)
+        stream = b"".join(encode_frame(state.encode()) for state in ["state1", large_state, "state3"])
+        chunks = [stream[i:i + 700] for i in range(0, len(stream), 700)]  # frames torn and coalesced
+
+        conn = MagicMock()
+        conn.recv = MagicMock(side_effect=["slave1\r\npass\r\nframed/1".encode()] + chunks + [b""])
+
+        slave_from_db = SlaveMock(password=md5("pass".encode()).hexdigest())
+        self._db_operator.get_slave = MagicMock(return_value=slave_from_db)
+
+        states = []
+        self._sut.add_state_listener(lambda nickname: states.append(self._sut.get_latest_state(nickname)))
+
+        self._sut._communicate(conn, MagicMock())
+
+        conn.send.assert_called_once_with("slave1\r\nframed/1".encode())
+        self.assertListEqual([state.get_raw_message() for state in states], ["state1", large_state, "state3"])
+        self.assertEqual(states[1].get_state_message()[-5000:], "x" * 5000)
+        conn.close.assert_called_once_with()
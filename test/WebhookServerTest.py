@@ -0,0 +1,101 @@
+import json
+import unittest
+from queue import Queue
+from time import sleep
+from urllib.error import HTTPError
+from urllib.request import urlopen, Request
+from unittest.mock import Mock
+
+from loggingserver import LoggingServer
+from telegram.ext import Dispatcher, CommandHandler, MessageHandler, Filters
+
+from src.WebhookServer import WebhookServer
+
+
+def make_update(update_id, chat_id, text):
+    return {"update_id": update_id,
+            "message": {"message_id": update_id, "date": 1600000000, "text": text,
+                        "chat": {"id": chat_id, "type": "private"},
+                        "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+                        "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split(" ")[0])}]
+                        if text.startswith("/") else []}}
+
+
+class WebhookServerTest(unittest.TestCase):
+
+    def setUp(self):
+        LoggingServer.getInstance("overseer", test=True)
+
+        self._bot = Mock()
+        self._dispatcher = Dispatcher(self._bot, Queue(), workers=0)
+        self._received = []
+        self._dispatcher.add_handler(CommandHandler("start", self._on_update))
+        self._dispatcher.add_handler(MessageHandler(Filters.text, self._on_update))
+
+        self._sut = WebhookServer(self._dispatcher, "https://example.org/secret-path", host="127.0.0.1", port=0,
+                                  workers=2, batch_size=10)
+        self._sut.launch(register=False)
+
+    def tearDown(self):
+        self._sut.stop(unregister=False)
+
+    def _on_update(self, bot, update):
+        self._received.append((update.message.chat_id, update.message.text))
+
+    def _post(self, data, path="/secret-path"):
+        request = Request("http://127.0.0.1:%d%s" % (self._sut.get_port(), path), data=json.dumps(data).encode(),
+                          headers={"Content-Type": "application/json"})
+        return urlopen(request).status
+
+    def _wait_processed(self, count):
+        for i in range(100):
+            if self._sut.get_stats()["processed"] >= count:
+                return
+            sleep(.01)
+
+    def testPostedUpdatesAreDispatched(self):
+        self.assertEqual(self._post(make_update(1, 10, "/start")), 200)
+        self.assertEqual(self._post([make_update(2, 11, "hello"), make_update(3, 12, "/start")]), 200)
+        self._wait_processed(3)
+
+        self.assertCountEqual(self._received, [(10, "/start"), (11, "hello"), (12, "/start")])
+        self.assertEqual(self._sut.get_stats(), {"received": 3, "processed": 3, "rejected": 0, "queued": 0})
+
+    def testChatOrderIsKept(self):
+        self._post([make_update(i, 10 + i % 3, str(i)) for i in range(300)])
+        self._wait_processed(300)
+
+        for chat_id in range(10, 13):
+            texts = [int(text) for chat, text in self._received if chat == chat_id]
+            self.assertEqual(texts, sorted(texts))
+            self.assertEqual(len(texts), 100)
+
+    def testRejectedRequests(self):
+        with self.assertRaises(HTTPError) as e:
+            self._post(make_update(1, 10, "/start"), path="/")
+        self.assertEqual(e.exception.code, 404)
+        with self.assertRaises(HTTPError) as e:
+            self._post({"message": "not an update"})
+        self.assertEqual(e.exception.code, 400)
+        with self.assertRaises(HTTPError) as e:
+            self._post([make_update(1, 10, "/start"), "not an update"])
+        self.assertEqual(e.exception.code, 400)
+        self.assertEqual(self._sut.get_stats()["received"], 0)
+
+    def testFullQueueIsRefused(self):
+        sut = WebhookServer(self._dispatcher, "https://example.org/", workers=1, max_queue_size=2)
+
+        self.assertTrue(sut.receive(make_update(0, 10, "0")))
+        self.assertFalse(sut.receive([make_update(i, 10, str(i)) for i in range(1, 3)]))
+        self.assertEqual(sut.get_stats(), {"received": 1, "processed": 0, "rejected": 2, "queued": 1})
+        self.assertTrue(sut.receive(make_update(1, 10, "1")))
+
+    def testRegistersWebhook(self):
+        sut = WebhookServer(self._dispatcher, "https://example.org/secret-path", host="127.0.0.1", port=0,
+                            certificate="domain.crt")
+        sut.launch()
+        sut.stop()
+
+        self._bot.set_webhook.assert_called_once()
+        self.assertEqual(self._bot.set_webhook.call_args[0], ("https://example.org/secret-path",))
+        self._bot.delete_webhook.assert_called_once_with()